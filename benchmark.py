@@ -0,0 +1,58 @@
+if __name__ == "__main__":
+    import json
+    import logging
+    from src.bench import RoundTripBenchmark
+    _logger = logging.getLogger(__name__)
+    import argparse
+    parser = argparse.ArgumentParser(description="Round trip of random payloads through a simulated audio channel, reported as JSON")
+    parser.add_argument("-o", "--output", help="report file path, printed if not given")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[1024, 16*1024, 128*1024], help="payload sizes in bytes")
+    parser.add_argument("-m", "--modes", nargs="+", default=list(RoundTripBenchmark.MODES), choices=list(RoundTripBenchmark.MODES), help="sonify modes")
+    parser.add_argument("-p", "--profiles", nargs="+", default=list(RoundTripBenchmark.PROFILES), choices=list(RoundTripBenchmark.PROFILES), help="audio channel profiles")
+    parser.add_argument("--gain", type=float, help="gain of a custom channel profile, replacing the ones given by --profiles")
+    parser.add_argument("--noise", type=float, default=0.0, help="white noise standard deviation of the custom profile, as a fraction of the full scale")
+    parser.add_argument("--dc-offset", type=float, default=0.0, help="DC offset of the custom profile, as a fraction of the full scale")
+    parser.add_argument("--drift-ppm", type=float, default=0.0, help="clock drift of the recorder of the custom profile, in ppm")
+    parser.add_argument("--cutoff", type=float, help="cutoff frequency of the low-pass cable response of the custom profile, in Hz")
+    parser.add_argument("--stream", action="store_true", help="sonify and demodulate as streams")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes demodulating the chunks")
+    parser.add_argument("--soft-detection", action="store_true", help="demodulate with the soft detector of the cycles")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory, which runs each stage twice")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the payloads and of the noise")
+    parser.add_argument("-l", "--log-level", default="INFO", help="logging level")
+
+    args = parser.parse_args()
+
+    logging_levels = {
+        logging.getLevelName(logging.DEBUG): logging.DEBUG,
+        logging.getLevelName(logging.INFO): logging.INFO,
+        logging.getLevelName(logging.WARNING): logging.WARNING,
+        logging.getLevelName(logging.ERROR): logging.ERROR,
+        logging.getLevelName(logging.CRITICAL): logging.CRITICAL
+    }
+    logging.basicConfig(level=logging_levels[args.log_level], format='[%(levelname)s] %(asctime)s - %(message)s')
+    # The workflows log every step and every lost chunk, only the benchmark progress is shown. The report counts the lost chunks
+    logging.getLogger("src.sonify").setLevel(max(logging.ERROR, logging_levels[args.log_level]))
+    logging.getLogger("src.demod").setLevel(max(logging.ERROR, logging_levels[args.log_level]))
+
+    modes = {name: RoundTripBenchmark.MODES[name] for name in args.modes}
+    if args.gain is not None:
+        profiles = {"custom": dict(gain=args.gain, noise=args.noise, dc_offset=args.dc_offset, drift_ppm=args.drift_ppm, cutoff=args.cutoff)}
+    else:
+        profiles = {name: RoundTripBenchmark.PROFILES[name] for name in args.profiles}
+    _logger.info(f"Sizes: {args.sizes}")
+    _logger.info(f"Modes: {list(modes)}")
+    _logger.info(f"Profiles: {profiles}")
+
+    report = RoundTripBenchmark(args.stream, args.jobs, not args.no_memory, args.seed, args.soft_detection).run(args.sizes, modes, profiles)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        _logger.info(f"Report saved to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    failed = [result for result in report["results"] if not result["ok"]]
+    _logger.info(f"{len(report['results']) - len(failed)} of {len(report['results'])} round trips recovered the payload")
+    spread = [result for result in report["results"] if not result["contained"]]
+    if spread:
+        _logger.warning(f"{len(spread)} round trips lost more chunks than their channel damages reach")
@@ -15,26 +15,46 @@
 
 # Note : 32khz seems to be the limit. As some unreliabilities emerged beginning with this frequency and to handle these unreliabilities, the code is much more complexe than before to handle these issues.
 # Note : At 32khz, the transfer rate would be : 32000/8 = 4000B/sec
+# Note : With --soft-detection, a cycle is decided by the level of the carrier in it over a running envelope instead of its peaks.
+# The 1st "1" after "0"s keeps most of its energy even when its peak is low, so higher frequencies (up to 1/6 of the frame rate) can be used
 
 
+import asyncio
 import logging
+import os
+import sys
 from src.demod import DemodWorkflow
+from src.common.metrics import Metrics
 
 _logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_file", help="input file path") 
-    parser.add_argument("output_file", help="output file path")
-    parser.add_argument("-s", "--start-at", type=int, default=2, help="start at sec")
+    parser.add_argument("input_file", help="input file path, with --live a pipe of raw PCM frames (- for the standard input)") 
+    parser.add_argument("output_file", help="output file path, the directory where the files are unpacked for a batch or written with --scan, the JSON report with --calibrate")
+    parser.add_argument("-s", "--start-at", type=float, default=None, help="search the start of the transmission in the first seconds only (default: whole recording)")
     parser.add_argument("-l", "--log-level", default="INFO", help="logging level")
+    parser.add_argument("--stream", action="store_true", help="write the file chunk by chunk with a bounded memory usage")
+    parser.add_argument("--merge-with", nargs="+", default=[], help="other recordings of the same transmission to take the chunks lost in the first one")
+    parser.add_argument("--scan", action="store_true", help="demodulate every transmission of a long recording, each to a file of the output directory named after its offset")
+    parser.add_argument("--calibrate", action="store_true", help="analyze a recording of the calibration sweep (datatobuzz.py --calibrate) and recommend the frequency and the chunk size")
+    parser.add_argument("--live", action="store_true", help="demodulate raw PCM frames while they are received, e.g. from arecord -t raw")
+    parser.add_argument("--frame-rate", type=int, default=192000, help="frame rate of the live stream")
+    parser.add_argument("--sample-width", type=int, default=2, choices=[1, 2, 3, 4], help="sample width in bytes of the live stream")
+    parser.add_argument("--channels", type=int, default=1, help="number of channels of the live stream")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes demodulating the chunks, 0 for one per CPU")
+    parser.add_argument("--soft-detection", action="store_true", help="decide the cycles by the level of the carrier over a running envelope instead of their peaks, for high frequencies or weak signals")
+    parser.add_argument("--base", default=None, help="the file a delta transmission was made against, the output file is rebuilt from it")
+    parser.add_argument("--metrics-json", default=None, help="save the time of each stage, the peak RSS and the stats of each chunk to this JSON file")
 
     args = parser.parse_args()
     input_file = args.input_file
     output_file = args.output_file
     start_at = args.start_at
     log_level = args.log_level
+    streaming = args.stream
+    jobs = args.jobs or os.cpu_count()
 
     logging_levels = {
         logging.getLevelName(logging.DEBUG): logging.DEBUG,
@@ -49,5 +69,42 @@ if __name__ == "__main__":
     _logger.info(f"Output file: {output_file}")
     _logger.info(f"Start at: {start_at}")
     _logger.info(f"Log level: {log_level}")
-    DemodWorkflow().execute(args.input_file, args.output_file, args.start_at)
+    _logger.info(f"Streaming: {streaming}")
+    _logger.info(f"Jobs: {jobs}")
+    _logger.info(f"Merge with: {args.merge_with}")
+    _logger.info(f"Soft detection: {args.soft_detection}")
+    _logger.info(f"Base file: {args.base}")
+    assert not (args.scan and (args.live or args.merge_with or start_at is not None)), "--scan cannot be used with --live, --merge-with or --start-at"
+    metrics = Metrics()
+    try:
+        if args.calibrate:
+            report = DemodWorkflow(streaming, jobs, args.soft_detection, metrics).execute_calibration(args.input_file, args.output_file, start_at)
+            _logger.info(f"Clock drift: {report['clock_drift_ppm']:.2f} ppm, wander across the sweep: {report['clock_wander_ppm']:.2f} ppm")
+            if report["frequency"] is None:
+                _logger.error("No frequency of the sweep decodes reliably on this link")
+                sys.exit(1)
+            _logger.info(f"Recommended settings: datatobuzz.py -f {report['frequency']} -c {report['chunk_size']}" + (" and buzztodata.py --soft-detection" if report["soft_detection"] else ""))
+            if not args.soft_detection and report["frequency"] < report["segments"][-1]["frequency"]:
+                _logger.info("Higher frequencies may decode with --soft-detection, analyze the recording again with it")
+            missing_chunks = []
+        elif args.scan:
+            transmissions = DemodWorkflow(streaming, jobs, args.soft_detection, metrics).execute_scan(args.input_file, args.output_file, args.base)
+            _logger.info(f"{len(transmissions)} transmission(s) found")
+            failed = [transmission for transmission in transmissions if transmission.error or transmission.missing_chunks]
+            for transmission in failed:
+                _logger.error(f"Transmission at {transmission.offset:.3f}s: {transmission.error or f'missing chunks {transmission.missing_chunks}'}")
+            if failed:
+                sys.exit(1)
+            missing_chunks = []
+        elif args.live:
+            _logger.info(f"Live stream: {args.frame_rate}Hz, {args.sample_width} bytes, {args.channels} channel(s)")
+            missing_chunks = asyncio.run(DemodWorkflow(True, 1, args.soft_detection, metrics).execute_live(args.input_file, args.output_file, args.frame_rate, args.sample_width, args.channels, args.base))
+        else:
+            missing_chunks = DemodWorkflow(streaming, jobs, args.soft_detection, metrics).execute(args.input_file, args.output_file, args.start_at, args.merge_with, args.base)
+    finally: # the metrics of a failed demodulation tell where it failed
+        if args.metrics_json:
+            metrics.save(args.metrics_json)
+    if missing_chunks:
+        _logger.error(f"Missing chunks: {missing_chunks}")
+        sys.exit(1)
     _logger.info("All Done!")
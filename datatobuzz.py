@@ -1,24 +1,50 @@
 if __name__ == "__main__":
     import logging
+    import os
     from src.sonify import SonifyWorkflow
+    from src.common.metrics import Metrics
+    from src.sonify.wavecache import WaveCache
     _logger = logging.getLogger(__name__)
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_file", help="input file path") 
-    parser.add_argument("output_file", help="output file path")
+    parser.add_argument("input_files", nargs="*", help="input file path, several files or a directory to send them as one batch")
+    parser.add_argument("output_file", help="output wav file path, - to write raw PCM frames to the standard output (e.g. piped to aplay -t raw)")
     parser.add_argument("-f", "--frequency", type=int, default=32000, help="frequency")
     parser.add_argument("-r", "--frame-rate", type=int, default=192000, help="frame rate")  
     parser.add_argument("-c", "--chunk-size", type=int, default=1, help="chunk size in KB")
     parser.add_argument("-l", "--log-level", default="INFO", help="logging level")
+    parser.add_argument("-n", "--carriers", type=int, default=1, help="number of parallel subcarriers up to the frequency (multi carrier mode when more than 1)")
+    parser.add_argument("-b", "--bits-per-cycle", type=int, default=1, help="bits sent by the phase and amplitude of each cycle, 2 to 4 (constellation mode when more than 1). 4 bits need about 12 samples per cycle or more")
+    parser.add_argument("--channels", type=int, default=1, help="number of channels of the wav file, the chunks are striped across them")
+    parser.add_argument("-z", "--compress", default="auto", choices=["auto", "none", "zlib", "bz2", "lzma"], help="compression of the file, auto to choose the best one on a sample of the file")
+    parser.add_argument("-e", "--fec", type=int, default=0, help="Reed-Solomon parity bytes per codeword of 255 bytes at most, each chunk then survives as many unreadable bytes or half as many wrong ones (0 for no correction)")
+    parser.add_argument("--no-crc", action="store_true", help="do not add the CRC of each chunk, without it a damaged recording cannot be partially recovered")
+    parser.add_argument("--stream", action="store_true", help="process the file chunk by chunk with a bounded memory usage")
+    parser.add_argument("-w", "--sample-width", type=int, default=2, choices=[1, 2, 3], help="sample width in bytes of the output, 1 (unsigned) to 3")
+    parser.add_argument("--base", default=None, help="send only the differences from this file, which the receiver has (buzztodata.py --base)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes compressing the files of a batch, 0 for one per CPU")
+    parser.add_argument("--calibrate", action="store_true", help="write a calibration sweep instead of a file (no input file), its recording is analyzed by buzztodata.py --calibrate to choose -f and -c")
+    parser.add_argument("--cache", default=None, help="directory of a cache of the generated wav files, a file already converted with the same settings is copied from it")
+    parser.add_argument("--cache-size", type=int, default=1024, help="size of the cache in MB, the least recently used wav files are removed above it")
+    parser.add_argument("--metrics-json", default=None, help="save the time of each stage and the peak RSS to this JSON file")
 
     args = parser.parse_args()
 
-    input_file = args.input_file
+    input_files = args.input_files
+    assert bool(input_files) != args.calibrate, "Give the input files, or --calibrate without input file"
+    batch = len(input_files) > 1 or (bool(input_files) and os.path.isdir(input_files[0]))
     output_file = args.output_file 
     frequency = args.frequency
     frame_rate = args.frame_rate
     chunk_size = args.chunk_size
     log_level = args.log_level
+    streaming = args.stream or output_file == "-" # the frames are played while the next ones are converted
+    carrier_number = args.carriers
+    bits_per_cycle = args.bits_per_cycle
+    channel_number = args.channels
+    codec = args.compress
+    fec_parity_number = args.fec
+    chunk_crc = not args.no_crc
 
     logging_levels = {
         logging.getLevelName(logging.DEBUG): logging.DEBUG,
@@ -28,14 +54,37 @@ if __name__ == "__main__":
         logging.getLevelName(logging.CRITICAL): logging.CRITICAL
     }
     logging.basicConfig(level=logging_levels[log_level], format='[%(levelname)s] %(asctime)s - %(message)s')
-    _logger.info(f"Input file: {input_file}")
+    _logger.info(f"Input files: {input_files}")
+    _logger.info(f"Batch: {batch}")
+    _logger.info(f"Base file: {args.base}")
     _logger.info(f"Output file: {output_file}")
     _logger.info(f"Frequency: {frequency}")
     _logger.info(f"Frame rate: {frame_rate}")
     _logger.info(f"Chunk size: {chunk_size}")
     _logger.info(f"Version: {SonifyWorkflow.VERSION}")
     _logger.info(f"Log level: {log_level}")
+    _logger.info(f"Streaming: {streaming}")
+    _logger.info(f"Carriers: {carrier_number}")
+    _logger.info(f"Bits per cycle: {bits_per_cycle}")
+    _logger.info(f"Channels: {channel_number}")
+    _logger.info(f"Compression: {codec}")
+    _logger.info(f"FEC parity bytes: {fec_parity_number}")
+    _logger.info(f"Chunk CRC: {chunk_crc}")
+    _logger.info(f"Sample width: {args.sample_width}")
+    _logger.info(f"Cache: {args.cache}")
 
-    wf = SonifyWorkflow(frequency, frame_rate, chunk_size)
-    wf.execute(input_file, output_file)
+    wf = SonifyWorkflow(frequency, frame_rate, chunk_size, streaming=streaming, carrier_number=carrier_number, bits_per_cycle=bits_per_cycle,
+                        channel_number=channel_number, codec=codec, fec_parity_number=fec_parity_number, chunk_crc=chunk_crc, metrics=Metrics(),
+                        sample_width=args.sample_width, cache=WaveCache(args.cache, args.cache_size*1024*1024) if args.cache else None)
+    if args.calibrate:
+        wf.execute_calibration(output_file)
+    elif batch:
+        assert args.base is None, "A batch cannot be sent as a delta"
+        wf.execute_batch(input_files, output_file, args.jobs or os.cpu_count())
+    elif args.base:
+        wf.execute_delta(input_files[0], args.base, output_file)
+    else:
+        wf.execute(input_files[0], output_file)
+    if args.metrics_json:
+        wf.metrics.save(args.metrics_json)
     _logger.info("All Done!")
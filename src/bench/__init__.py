@@ -0,0 +1,2 @@
+from .channel import AudioChannel
+from .roundtrip import RoundTripBenchmark
\ No newline at end of file
@@ -0,0 +1,98 @@
+import logging
+import math
+import wave
+import numpy as np
+from ..demod.readwave import WaveReader
+
+_logger = logging.getLogger(__name__)
+
+class AudioChannel:
+    # Simulates the audio path from the player of a wav file to the recorder: the low-pass response of the cable (first order, cutoff
+    # in Hz, None for none), the clock drift of the recorder (drift_ppm faster than the player, the sound is resampled), the gain,
+    # the DC offset and the additive white noise (standard deviation). The offset and the noise are fractions of the full scale.
+    # The recording starts and ends margin_sec before and after the sound, with the noise only.
+    # damages are the accidents of the recording, in order, each a dict of its kind, where it starts ("at", a fraction of the sound),
+    # its length ("seconds") and for a burst its level ("level", standard deviation of the noise as a fraction of the full scale):
+    # a gap (the samples are silent), a drop (the samples are missing from the recording) or a burst of noise
+    DAMAGE_KINDS = ("gap", "drop", "burst")
+    RESAMPLE_TAPS = 32 # of the windowed sinc interpolation
+    RESAMPLE_STEPS = 4096 # fractions of sample of the tabulated kernel
+    RESAMPLE_BLOCK_SIZE = 32*1024 # samples interpolated at once
+
+    def __init__(self, gain:float=1.0, noise:float=0.0, dc_offset:float=0.0, drift_ppm:float=0.0, cutoff:float|None=None, margin_sec:float=0.1, damages:list[dict]|None=None, seed:int=0) -> None:
+        assert gain > 0, f"Unexpected gain {gain}. Expect more than 0."
+        assert noise >= 0, f"Unexpected noise {noise}. Expect 0 or more."
+        assert abs(drift_ppm) < 1e5, f"Unexpected clock drift {drift_ppm} ppm."
+        for damage in damages or []:
+            assert damage["kind"] in self.DAMAGE_KINDS, f"Unexpected damage {damage['kind']}. Expect one of {self.DAMAGE_KINDS}."
+            assert 0 <= damage["at"] <= 1 and damage["seconds"] >= 0, f"Unexpected damage {damage}."
+        self._gain = gain
+        self._noise = noise
+        self._dc_offset = dc_offset
+        self._drift_ppm = drift_ppm
+        self._cutoff = cutoff
+        self._margin_sec = margin_sec
+        self._damages = damages or []
+        self._seed = seed
+
+    def transmit(self, input_wave_path:str, output_wave_path:str):
+        # Plays the wav file through the channel and records it as 16 bits samples at the same nominal frame rate
+        rng = np.random.default_rng(self._seed)
+        with WaveReader(input_wave_path) as reader:
+            channels = [self.apply(reader.with_channel(c).data / reader.full_scale, reader.frame_rate, rng) for c in range(reader.channel_number)]
+        frames = np.clip(np.round(np.stack(channels, axis=1) * 32768), -32768, 32767).astype('<i2')
+        with wave.open(output_wave_path, 'wb') as wav_file:
+            wav_file.setparams((reader.channel_number, 2, reader.frame_rate, 0, 'NONE', 'not compressed'))
+            wav_file.writeframes(frames.tobytes())
+        _logger.debug(f"Recorded {len(frames)} frames of {reader.num_frames} played")
+
+    def apply(self, signal:np.ndarray, frame_rate:int, rng:np.random.Generator|None=None)->np.ndarray:
+        # signal is a channel scaled to the full scale (1.0), returns the recorded one on the same scale
+        signal = np.asarray(signal, dtype=np.float64)
+        rng = rng or np.random.default_rng(self._seed)
+        if self._cutoff:
+            signal = self._low_pass(signal, frame_rate)
+        if self._drift_ppm:
+            signal = self._resample(signal, 1 + self._drift_ppm * 1e-6)
+        margin = np.zeros(int(self._margin_sec * frame_rate))
+        sound_length = len(signal)
+        signal = np.concatenate((margin, signal * self._gain, margin)) + self._dc_offset
+        if self._noise:
+            signal += rng.normal(0, self._noise, len(signal))
+        for damage in self._damages:
+            signal = self._damage(signal, damage, len(margin) + int(damage["at"] * sound_length), int(damage["seconds"] * frame_rate), rng)
+        return signal
+
+    @staticmethod
+    def _damage(signal:np.ndarray, damage:dict, start:int, length:int, rng:np.random.Generator)->np.ndarray:
+        end = min(start + length, len(signal))
+        if damage["kind"] == "gap":
+            signal[start:end] = 0.0
+        elif damage["kind"] == "drop":
+            signal = np.concatenate((signal[:start], signal[end:]))
+        else:
+            signal[start:end] += rng.normal(0, damage.get("level", 1.0), end - start)
+        return signal
+
+    def _low_pass(self, signal:np.ndarray, frame_rate:int)->np.ndarray:
+        # RC filter, its impulse response is truncated when it falls under 1e-6
+        decay = math.exp(-2 * math.pi * self._cutoff / frame_rate)
+        length = max(1, math.ceil(math.log(1e-6) / math.log(decay)))
+        response = (1 - decay) * decay ** np.arange(length)
+        return np.convolve(signal, response)[:len(signal)]
+
+    def _resample(self, signal:np.ndarray, ratio:float)->np.ndarray:
+        # ratio recorded samples per played sample, the recorded sample n is the played signal at n / ratio.
+        # The interpolation kernel is tabulated for RESAMPLE_STEPS fractions of sample
+        half = self.RESAMPLE_TAPS // 2
+        offsets = np.arange(-half + 1, half + 1)
+        x = np.arange(self.RESAMPLE_STEPS + 1)[:, None] / self.RESAMPLE_STEPS - offsets[None, :]
+        kernels = np.sinc(x) * (0.5 + 0.5 * np.cos(np.pi * x / half)) # Hann windowed
+        padded = np.concatenate((np.zeros(half), signal, np.zeros(half)))
+        recorded = np.empty(int((len(signal) - 1) * ratio) + 1)
+        for start in range(0, len(recorded), self.RESAMPLE_BLOCK_SIZE):
+            positions = np.arange(start, min(start + self.RESAMPLE_BLOCK_SIZE, len(recorded))) / ratio
+            indexes = np.floor(positions).astype(np.int64)
+            steps = np.round((positions - indexes) * self.RESAMPLE_STEPS).astype(np.int64)
+            recorded[start:start + len(positions)] = np.einsum('ij,ij->i', padded[indexes[:, None] + offsets[None, :] + half], kernels[steps])
+        return recorded
@@ -0,0 +1,141 @@
+import logging
+import math
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import wave
+from datetime import datetime, timezone
+import numpy as np
+from ..sonify import SonifyWorkflow
+from ..demod import DemodWorkflow
+from ..demod.writefile import FileWriter
+from .channel import AudioChannel
+
+_logger = logging.getLogger(__name__)
+
+class RoundTripBenchmark:
+    # Sonifies random payloads, plays them through a simulated AudioChannel and demodulates them back, for each combination of
+    # payload size, mode (parameters of SonifyWorkflow) and channel profile (parameters of AudioChannel).
+    # Each stage is timed on its own, then run again under tracemalloc for its peak memory (the tracing slows it down,
+    # the demodulation jobs in other processes are not traced).
+    # The files are written to a temporary directory in memory (/dev/shm) when there is one.
+    # The damaged profiles check that a gap, dropped samples or a burst of noise only lose the chunks they reach: a result is
+    # contained when it lost no more chunks than its damages can reach (none for the other profiles)
+    VERSION = 1
+    MODES = {
+        "v1": dict(frequency=32000, frame_rate=192000),
+        "v1-48k": dict(frequency=8000, frame_rate=48000),
+        "v1-fec": dict(frequency=32000, frame_rate=192000, fec_parity_number=16),
+        "v1-2ch": dict(frequency=32000, frame_rate=192000, channel_number=2),
+        "v2": dict(frequency=32000, frame_rate=192000, carrier_number=8),
+        "v3-2b": dict(frequency=32000, frame_rate=192000, bits_per_cycle=2),
+        "v3-4b": dict(frequency=16000, frame_rate=192000, bits_per_cycle=4),
+    }
+    PROFILES = {
+        "clean": dict(),
+        "cable": dict(gain=0.6, noise=0.002, dc_offset=0.01, drift_ppm=20, cutoff=60000),
+        "noisy": dict(gain=0.3, noise=0.01, dc_offset=0.02, drift_ppm=50, cutoff=40000),
+        "gap": dict(gain=0.6, noise=0.002, drift_ppm=20, damages=[dict(kind="gap", at=0.4, seconds=0.016)]),
+        "drop": dict(gain=0.6, noise=0.002, drift_ppm=20, damages=[dict(kind="drop", at=0.4, seconds=0.0026)]),
+        "burst": dict(gain=0.6, noise=0.002, drift_ppm=20, damages=[dict(kind="burst", at=0.4, seconds=0.5, level=0.6)]),
+    }
+    DEFAULT_MODE = dict(chunk_kb_size=1, chunk_crc=True)
+    MEMORY_DIR = "/dev/shm"
+
+    def __init__(self, streaming:bool=False, jobs:int=1, memory:bool=True, seed:int=0, soft_detection:bool=False) -> None:
+        self._streaming = streaming
+        self._jobs = jobs
+        self._soft_detection = soft_detection
+        self._memory = memory # measure the peak memory of the stages
+        self._seed = seed # of the payloads and of the noise
+
+    def run(self, payload_sizes:list[int], modes:dict[str, dict], profiles:dict[str, dict])->dict:
+        # Returns the report, modes and profiles are named parameters as MODES and PROFILES
+        work_dir = self.MEMORY_DIR if os.access(self.MEMORY_DIR, os.W_OK) else None
+        with tempfile.TemporaryDirectory(prefix="buzzbench", dir=work_dir) as temp_dir:
+            results = [self._run_case(temp_dir, payload_size, mode_name, modes[mode_name], profile_name, profiles[profile_name])
+                       for mode_name in modes for profile_name in profiles for payload_size in payload_sizes]
+        return {"version": self.VERSION, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "environment": self._get_environment(),
+                "streaming": self._streaming, "jobs": self._jobs, "soft_detection": self._soft_detection, "results": results}
+
+    @staticmethod
+    def _get_environment()->dict:
+        return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                "machine": platform.machine(), "cpu_count": os.cpu_count()}
+
+    def _run_case(self, temp_dir:str, payload_size:int, mode_name:str, mode:dict, profile_name:str, profile:dict)->dict:
+        payload = np.random.default_rng(self._seed).bytes(payload_size)
+        payload_path, played_path, recorded_path, output_path = (os.path.join(temp_dir, name) for name in ("payload.bin", "played.wav", "recorded.wav", "output.bin"))
+        with open(payload_path, 'wb') as f:
+            f.write(payload)
+        result = {"mode": mode_name, "profile": profile_name, "payload_size": payload_size, "sonify_parameters": mode, "channel_parameters": profile,
+                  "stages": {}, "sound_seconds": None, "bit_rate": None, "lost_chunks": None, "damaged_chunks": None, "contained": False, "ber": None, "ok": False, "error": None}
+        # Random payloads do not compress, the content is sent as is so that the bits errors can be counted
+        sonify = SonifyWorkflow(**{**self.DEFAULT_MODE, **mode, "streaming": self._streaming, "codec": "none"})
+        channel = AudioChannel(**profile, seed=self._seed)
+        try:
+            result["stages"]["sonify"], _ = self._measure(payload_size, sonify.execute, payload_path, played_path)
+            with wave.open(played_path, 'rb') as wav_file:
+                result["sound_seconds"] = wav_file.getnframes() / wav_file.getframerate()
+            result["bit_rate"] = payload_size * 8 / result["sound_seconds"]
+            result["stages"]["channel"], _ = self._measure(payload_size, channel.transmit, played_path, recorded_path)
+            result["stages"]["demod"], missing_chunks = self._measure(payload_size, self._demod, recorded_path, output_path)
+        except Exception as e: # a failed case is reported, the next ones are run
+            result["error"] = f"{type(e).__name__}: {e}"
+            _logger.warning(f"{mode_name}/{profile_name}/{payload_size} bytes failed: {result['error']}")
+            return result
+        with open(output_path, 'rb') as f:
+            output = f.read()
+        result["lost_chunks"] = len(missing_chunks)
+        result["damaged_chunks"] = self._get_damaged_chunk_number(payload_size, {**self.DEFAULT_MODE, **mode}, profile.get("damages", []), result["sound_seconds"])
+        result["contained"] = result["lost_chunks"] <= result["damaged_chunks"]
+        if not result["contained"]:
+            _logger.warning(f"{mode_name}/{profile_name}/{payload_size} bytes: {result['lost_chunks']} chunks lost, {result['damaged_chunks']} damaged")
+        result["ber"] = self._get_bit_error_rate(payload, output)
+        result["ok"] = output == payload
+        _logger.info(f"{mode_name}/{profile_name}/{payload_size} bytes: BER {result['ber']:.2e}, "
+                     + ", ".join(f"{name} {stage['throughput']:.0f} B/s" for name, stage in result["stages"].items()))
+        return result
+
+    def _demod(self, wave_file_path:str, output_file_path:str)->list[int]:
+        # A partial output of a previous run would be resumed, it's removed first
+        for path in (output_file_path, f"{output_file_path}{FileWriter.SIDECAR_SUFFIX}"):
+            if os.path.exists(path):
+                os.remove(path)
+        return DemodWorkflow(self._streaming, self._jobs, self._soft_detection).execute(wave_file_path, output_file_path)
+
+    def _measure(self, payload_size:int, stage, *args):
+        # Returns the measures of the stage and its result
+        start = time.perf_counter()
+        stage_result = stage(*args)
+        seconds = time.perf_counter() - start
+        measures = {"seconds": seconds, "throughput": payload_size / seconds, "peak_memory": None}
+        if self._memory:
+            tracemalloc.start()
+            try:
+                stage(*args)
+                measures["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return measures, stage_result
+
+    @staticmethod
+    def _get_damaged_chunk_number(payload_size:int, mode:dict, damages:list[dict], sound_seconds:float)->int:
+        # Chunks which the damages can reach, the chunks of a channel are taken as equal parts of the sound (it's a bit less with the
+        # header) and a damage can overlap one more chunk than its length, on every channel
+        channel_number = mode.get("channel_number", 1)
+        chunk_number = max(1, math.ceil(payload_size / (mode["chunk_kb_size"] * 1024)))
+        channel_chunk_number = math.ceil(chunk_number / channel_number)
+        chunk_seconds = sound_seconds / channel_chunk_number
+        reached = sum(min(math.ceil(damage["seconds"] / chunk_seconds) + 1, channel_chunk_number) for damage in damages)
+        return min(reached * channel_number, chunk_number)
+
+    @staticmethod
+    def _get_bit_error_rate(payload:bytes, output:bytes)->float:
+        # The bits missing from the output are counted as errors
+        sent = np.frombuffer(payload, dtype=np.uint8)
+        received = np.zeros(len(sent), dtype=np.uint8)
+        received[:min(len(sent), len(output))] = np.frombuffer(output, dtype=np.uint8)[:len(sent)]
+        return int(np.unpackbits(sent ^ received).sum()) / max(1, len(sent) * 8)
@@ -0,0 +1 @@
+from .bitbuffer import BitBuffer
\ No newline at end of file
@@ -0,0 +1,51 @@
+import struct
+from dataclasses import dataclass
+
+
+@dataclass
+class BatchEntry:
+    name:str # path of the file in the batch, "/" separated
+    size:int # bytes of the file
+    checksum:int # Adler-32 of the file
+    codec_id:int = 0 # compression of the file in the batch
+    stored_size:int = 0 # bytes of the file in the batch, compressed
+
+
+class BatchManifest:
+    # A batch of files sent as one content: the manifest, then each file (compressed on its own) one after the other.
+    # The manifest is its version (1 byte) and the number of files (4 bytes), then for each file: the length of its name (2 bytes),
+    # its UTF-8 name, its codec id (1 byte), its stored size and its size (8 bytes each) and its checksum (4 bytes), big-endian
+    VERSION = 1
+    CONTENT_TYPE = 1 # in the header, the content is a batch
+    _HEADER = struct.Struct(">BI")
+    _ENTRY = struct.Struct(">BQQI")
+    _NAME_LENGTH = struct.Struct(">H")
+
+    @classmethod
+    def to_bytes(cls, entries:list[BatchEntry])->bytes:
+        manifest = [cls._HEADER.pack(cls.VERSION, len(entries))]
+        for entry in entries:
+            name = entry.name.encode("utf-8")
+            manifest.append(cls._NAME_LENGTH.pack(len(name)) + name + cls._ENTRY.pack(entry.codec_id, entry.stored_size, entry.size, entry.checksum))
+        return b"".join(manifest)
+
+    @classmethod
+    def read(cls, f)->list[BatchEntry]:
+        # Reads the manifest from the beginning of the batch, f is then at the 1st file
+        version, entry_number = cls._HEADER.unpack(cls._read_exactly(f, cls._HEADER.size))
+        if version != cls.VERSION:
+            raise ValueError(f"Unexpected batch version {version}. Expect {cls.VERSION}")
+        entries = []
+        for _ in range(entry_number):
+            name_length, = cls._NAME_LENGTH.unpack(cls._read_exactly(f, cls._NAME_LENGTH.size))
+            name = cls._read_exactly(f, name_length).decode("utf-8")
+            codec_id, stored_size, size, checksum = cls._ENTRY.unpack(cls._read_exactly(f, cls._ENTRY.size))
+            entries.append(BatchEntry(name, size, checksum, codec_id, stored_size))
+        return entries
+
+    @staticmethod
+    def _read_exactly(f, size:int)->bytes:
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("The batch manifest is truncated")
+        return data
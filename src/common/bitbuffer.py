@@ -0,0 +1,138 @@
+import numpy as np
+
+
+class BitBuffer:
+    # Bits packed 8 per byte, most significant bit first. The padding bits of the last byte are always 0.
+    def __init__(self, content:bytes|bytearray=b"", bits_number:int|None=None) -> None:
+        if bits_number is None:
+            bits_number = len(content) * 8
+        assert len(content) == (bits_number + 7) // 8, f"Unexpected bits number {bits_number} for {len(content)} bytes"
+        self._data = content # kept as given (no copy) until the buffer is modified
+        self._len = bits_number
+        self._clear_padding()
+
+    @classmethod
+    def from_bytes(cls, content:bytes|bytearray)->"BitBuffer":
+        return cls(content)
+
+    @classmethod
+    def from_str(cls, bits:str)->"BitBuffer":
+        return cls.from_array(np.frombuffer(bits.encode("ascii"), dtype=np.uint8) - ord("0"))
+
+    @classmethod
+    def from_array(cls, bits:np.ndarray)->"BitBuffer":
+        # bits is an array of 0/1 values (or booleans)
+        return cls(np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes(), len(bits))
+
+    @classmethod
+    def from_int(cls, value:int, width:int)->"BitBuffer":
+        assert 0 <= value < 2**width, f"The value {value} does not fit in {width} bits"
+        bytes_number = (width + 7) // 8
+        return cls((value << (bytes_number * 8 - width)).to_bytes(bytes_number, byteorder='big'), width)
+
+    @classmethod
+    def repeat(cls, bit:int, bits_number:int)->"BitBuffer":
+        return cls((b"\xff" if bit else b"\x00") * ((bits_number + 7) // 8), bits_number)
+
+    def _clear_padding(self):
+        padding = -self._len % 8
+        if padding and self._data[-1] & ((1 << padding) - 1):
+            self._writable()[-1] &= 0xff ^ ((1 << padding) - 1)
+
+    def _writable(self)->bytearray:
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+        return self._data
+
+    def append(self, bits:"BitBuffer|str")->"BitBuffer":
+        if isinstance(bits, str):
+            bits = BitBuffer.from_str(bits)
+        if not bits._len:
+            return self
+        shift = self._len % 8
+        data = self._writable()
+        if shift == 0:
+            data += bits._data
+        else:
+            # Merge the unfinished last byte with the appended bits
+            merged = np.concatenate((np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=1, offset=len(data) - 1))[:shift], bits.to_array()))
+            data[-1:] = np.packbits(merged).tobytes()
+        self._len += bits._len
+        return self
+
+    def append_int(self, value:int, width:int)->"BitBuffer":
+        return self.append(BitBuffer.from_int(value, width))
+
+    def append_bytes(self, content:bytes|bytearray)->"BitBuffer":
+        return self.append(BitBuffer.from_bytes(content))
+
+    def __add__(self, other:"BitBuffer")->"BitBuffer":
+        return BitBuffer(bytearray(self._data), self._len).append(other)
+
+    def __len__(self)->int:
+        return self._len
+
+    def __getitem__(self, key:int|slice):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._len)
+            assert step == 1, "Only contiguous slices are supported"
+            stop = max(start, stop)
+            if start % 8 == 0:
+                return BitBuffer(self._data[start // 8:(stop + 7) // 8], stop - start)
+            return BitBuffer.from_array(self.to_array(start, stop))
+        if key < 0:
+            key += self._len
+        if not 0 <= key < self._len:
+            raise IndexError("Bit index out of range")
+        return (self._data[key >> 3] >> (7 - (key & 7))) & 1
+
+    def __eq__(self, other)->bool:
+        if isinstance(other, str):
+            return str(self) == other
+        if not isinstance(other, BitBuffer):
+            return NotImplemented
+        return self._len == other._len and self._data == other._data
+
+    def __str__(self)->str:
+        return (self.to_array() + ord("0")).tobytes().decode("ascii")
+
+    def __repr__(self)->str:
+        return f"BitBuffer({self._len} bits)"
+
+    def to_array(self, start:int=0, stop:int|None=None)->np.ndarray:
+        # Unpacked uint8 array of 0/1 values
+        stop = self._len if stop is None else stop
+        first_byte = start // 8
+        packed = np.frombuffer(self._data, dtype=np.uint8)[first_byte:(stop + 7) // 8]
+        return np.unpackbits(packed, count=stop - first_byte * 8)[start - first_byte * 8:]
+
+    def to_int(self, start:int=0, width:int|None=None)->int:
+        width = self._len - start if width is None else width
+        assert 0 <= start and start + width <= self._len, f"Field [{start}:{start+width}] out of {self._len} bits"
+        if width == 0:
+            return 0
+        first_byte = start // 8
+        last_byte = (start + width + 7) // 8
+        value = int.from_bytes(self._data[first_byte:last_byte], byteorder='big')
+        return (value >> (last_byte * 8 - start - width)) & ((1 << width) - 1)
+
+    def tobytes(self)->bytes:
+        # The last byte is padded with 0s if the bits number is not a multiple of 8
+        return self._data if isinstance(self._data, bytes) else bytes(self._data)
+
+    def memoryview(self)->memoryview:
+        return memoryview(self._data)
+
+    def find(self, sub:"BitBuffer|str", start:int=0, end:int|None=None)->int:
+        if isinstance(sub, str):
+            sub = BitBuffer.from_str(sub)
+        end = self._len if end is None else min(end, self._len)
+        if end <= start:
+            return -1 if len(sub) else start
+        index = self.to_array(start, end).tobytes().find(sub.to_array().tobytes())
+        return index if index < 0 else index + start
+
+    def count_leading(self, bit:int)->int:
+        bits = self.to_array()
+        others = np.flatnonzero(bits != bit)
+        return int(others[0]) if len(others) else self._len
@@ -0,0 +1,68 @@
+import math
+import zlib
+import numpy as np
+from .bitbuffer import BitBuffer
+from .reedsolomon import ReedSolomon
+
+
+class ChunkFec:
+    # Error control of the data of a chunk. With crc, the CRC-32 of the data is appended to it to check the chunk on its own.
+    # The chunk bytes are split evenly into Reed-Solomon codewords of parity_number parity bytes, 0 to send them as is.
+    # The codewords are interleaved byte by byte (byte j of the codeword c is the byte j*codeword_number+c of the chunk),
+    # so that a burst of bad cycles is spread over all of them
+    MAX_PARITY_NUMBER = 128
+    CRC_BYTE_SIZE = 4
+
+    def __init__(self, parity_number:int, chunk_bit_size:int, crc:bool=False) -> None:
+        assert 0 <= parity_number <= self.MAX_PARITY_NUMBER, f"Unexpected parity bytes number {parity_number}. Expect between 0 and {self.MAX_PARITY_NUMBER}."
+        assert chunk_bit_size % 8 == 0, f"Unexpected chunk bit size {chunk_bit_size}. Expect whole bytes."
+        self.parity_number = parity_number
+        self.crc = crc
+        self._chunk_byte_size = chunk_bit_size // 8
+        self._payload_size = self._chunk_byte_size + (self.CRC_BYTE_SIZE if crc else 0) # bytes protected by the Reed-Solomon code
+        if parity_number:
+            self._codeword_number = math.ceil(self._payload_size / (ReedSolomon.MAX_CODEWORD_SIZE - parity_number))
+            self._data_size = math.ceil(self._payload_size / self._codeword_number)
+            self._rs = ReedSolomon(parity_number, self._data_size)
+
+    @property
+    def frame_bits_number(self)->int:
+        # Bits sent for the data of a chunk
+        if not self.parity_number:
+            return self._payload_size * 8
+        return self._codeword_number * (self._data_size + self.parity_number) * 8
+
+    def encode(self, chunk_bits:BitBuffer)->BitBuffer:
+        # chunk_bits is a whole chunk (the last one completed with zeros)
+        if self.crc:
+            chunk_bits = chunk_bits + BitBuffer.from_int(zlib.crc32(chunk_bits.tobytes()), self.CRC_BYTE_SIZE * 8)
+        if not self.parity_number:
+            return chunk_bits
+        data = np.zeros(self._codeword_number * self._data_size, dtype=np.uint8)
+        data[:self._payload_size] = np.frombuffer(chunk_bits.tobytes(), dtype=np.uint8)
+        codewords = self._rs.encode(data.reshape(self._codeword_number, self._data_size))
+        return BitBuffer.from_bytes(codewords.T.tobytes())
+
+    def decode(self, frame_bits:BitBuffer, erasures:list|None=None)->BitBuffer:
+        # erasures gives the indexes of the unreliable bits of frame_bits.
+        # Raises a ValueError when the chunk is truncated, has too many errors or does not match its CRC
+        if len(frame_bits) < self.frame_bits_number:
+            raise ValueError(f"The chunk is truncated: {len(frame_bits)} bits out of {self.frame_bits_number}.")
+        if self.parity_number:
+            frame_bits = self._correct(frame_bits, erasures)
+        if not self.crc:
+            return frame_bits
+        chunk_bits = frame_bits[:self._chunk_byte_size * 8]
+        if zlib.crc32(chunk_bits.tobytes()) != frame_bits.to_int(self._chunk_byte_size * 8, self.CRC_BYTE_SIZE * 8):
+            raise ValueError("Chunk CRC does not match.")
+        return chunk_bits
+
+    def _correct(self, frame_bits:BitBuffer, erasures:list|None)->BitBuffer:
+        codewords = np.frombuffer(frame_bits.tobytes(), dtype=np.uint8).reshape(-1, self._codeword_number).T
+        codeword_erasures = None
+        if erasures:
+            codeword_erasures = [[] for _ in range(self._codeword_number)]
+            for byte_index in sorted({bit_index // 8 for bit_index in erasures}):
+                codeword_erasures[byte_index % self._codeword_number].append(byte_index // self._codeword_number)
+        data = self._rs.decode(codewords, codeword_erasures)
+        return BitBuffer.from_bytes(data.reshape(-1)[:self._payload_size].tobytes())
@@ -0,0 +1,94 @@
+import bz2
+import logging
+import lzma
+import os
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+
+class Codec:
+    # Compression of the file content. The id is sent in the header, 0 for a content sent as is
+    SAMPLE_NUMBER = 4 # blocks read across the file to estimate the compression ratios
+    SAMPLE_SIZE = 64*1024
+    MAX_RATIO = 0.9 # the content is sent as is if it does not get smaller than that
+
+    def __init__(self, codec_id:int, name:str, compressor_factory, decompressor_factory) -> None:
+        self.codec_id = codec_id
+        self.name = name
+        self._compressor_factory = compressor_factory
+        self._decompressor_factory = decompressor_factory
+
+    def __repr__(self)->str:
+        return f"Codec({self.name})"
+
+    def compressor(self):
+        # Object with compress(data) and flush(), as zlib.compressobj
+        return self._compressor_factory()
+
+    def decompressor(self):
+        # Object with decompress(data), as zlib.decompressobj
+        return self._decompressor_factory()
+
+    def compress(self, data:bytes)->bytes:
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data:bytes)->bytes:
+        return self.decompressor().decompress(data)
+
+    @classmethod
+    def by_name(cls, name:str)->"Codec":
+        for codec in CODECS:
+            if codec.name == name:
+                return codec
+        raise ValueError(f"Unknown codec: {name}. Expect one of {[codec.name for codec in CODECS]}")
+
+    @classmethod
+    def by_id(cls, codec_id:int)->"Codec":
+        for codec in CODECS:
+            if codec.codec_id == codec_id:
+                return codec
+        raise ValueError(f"Unknown codec id: {codec_id}")
+
+    @classmethod
+    def estimate(cls, file_path:str)->"Codec":
+        # Compresses a few blocks taken across the file with every codec and returns the one giving the smallest content
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            if file_size <= cls.SAMPLE_NUMBER * cls.SAMPLE_SIZE:
+                sample = f.read()
+            else:
+                blocks = []
+                for i in range(cls.SAMPLE_NUMBER):
+                    f.seek((file_size - cls.SAMPLE_SIZE) * i // (cls.SAMPLE_NUMBER - 1))
+                    blocks.append(f.read(cls.SAMPLE_SIZE))
+                sample = b"".join(blocks)
+        if not sample:
+            return CODECS[0]
+        sizes = {codec.name: len(codec.compress(sample)) for codec in CODECS[1:]}
+        _logger.debug(f"Sample of {len(sample)} bytes compressed to {sizes}")
+        best = min(CODECS[1:], key=lambda codec: sizes[codec.name])
+        if sizes[best.name] > cls.MAX_RATIO * len(sample):
+            return CODECS[0]
+        return best
+
+
+class _Identity:
+    # Compressor and decompressor of the content sent as is
+    def compress(self, data:bytes)->bytes:
+        return data
+
+    def decompress(self, data:bytes)->bytes:
+        return data
+
+    def flush(self)->bytes:
+        return b""
+
+
+CODECS = [
+    Codec(0, "none", _Identity, _Identity),
+    Codec(1, "zlib", lambda: zlib.compressobj(9), zlib.decompressobj),
+    Codec(2, "bz2", bz2.BZ2Compressor, bz2.BZ2Decompressor),
+    Codec(3, "lzma", lzma.LZMACompressor, lzma.LZMADecompressor),
+]
@@ -0,0 +1,60 @@
+import math
+import numpy as np
+
+
+class Constellation:
+    # Maps groups of bits_per_symbol bits (most significant first) to complex points and back.
+    # 2 bits: QPSK, 3 bits: 8-PSK, 4 bits: 16-QAM. All are Gray coded, so a point mistaken for a neighbour costs 1 bit.
+    # The farthest points have a magnitude of 1, which is the amplitude of a "1" cycle used as reference.
+    MIN_BITS_PER_SYMBOL = 2
+    MAX_BITS_PER_SYMBOL = 4
+
+    def __init__(self, bits_per_symbol:int) -> None:
+        assert self.MIN_BITS_PER_SYMBOL <= bits_per_symbol <= self.MAX_BITS_PER_SYMBOL, f"Unexpected bits per symbol {bits_per_symbol}. Expect between {self.MIN_BITS_PER_SYMBOL} and {self.MAX_BITS_PER_SYMBOL}."
+        self._bits_per_symbol = bits_per_symbol
+        self._points = self._gen_points(bits_per_symbol)
+        self._weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+
+    @staticmethod
+    def _gray_positions(bits_number:int)->np.ndarray:
+        # Position of each value in a Gray sequence (inverse Gray code)
+        values = np.arange(1 << bits_number)
+        positions = values.copy()
+        shift = values >> 1
+        while shift.any():
+            positions ^= shift
+            shift >>= 1
+        return positions
+
+    @classmethod
+    def _gen_points(cls, bits_per_symbol:int)->np.ndarray:
+        if bits_per_symbol == 4:
+            # 2 Gray coded bits per axis, levels -3, -1, 1, 3
+            levels = 2 * cls._gray_positions(2) - 3
+            values = np.arange(16)
+            return (levels[values >> 2] + 1j * levels[values & 3]) / (3 * math.sqrt(2))
+        positions = cls._gray_positions(bits_per_symbol)
+        return np.exp(1j * (2 * np.pi * positions / (1 << bits_per_symbol) + np.pi / 4))
+
+    @property
+    def bits_per_symbol(self)->int:
+        return self._bits_per_symbol
+
+    @property
+    def points(self)->np.ndarray:
+        return self._points
+
+    def symbol_number(self, bits_number:int)->int:
+        return math.ceil(bits_number / self._bits_per_symbol)
+
+    def map(self, bits:np.ndarray)->np.ndarray:
+        # bits is an array of 0/1 values, completed with 0s up to a whole number of symbols
+        padded = np.zeros(self.symbol_number(len(bits)) * self._bits_per_symbol, dtype=np.int64)
+        padded[:len(bits)] = bits
+        return self._points[padded.reshape(-1, self._bits_per_symbol) @ self._weights]
+
+    def demap(self, symbols:np.ndarray):
+        # Nearest points of the received symbols, returns the bits and the decided points
+        values = np.argmin(np.abs(symbols[:, None] - self._points[None, :]), axis=1)
+        bits = ((values[:, None] & self._weights[None, :]) != 0).astype(np.uint8).ravel()
+        return bits, self._points[values]
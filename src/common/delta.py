@@ -0,0 +1,79 @@
+import hashlib
+import struct
+import zlib
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class DeltaHeader:
+    base_size:int # bytes of the base file
+    base_checksum:int # Adler-32 of the base file
+    size:int # bytes of the new file
+    checksum:int # Adler-32 of the new file
+    block_size:int # bytes of the blocks of the base file
+
+
+class Delta:
+    # Binary diff of a file against a base file the receiver has (rsync-style): the new file is made of blocks of the base file and
+    # of literal bytes. The delta starts with its version (1 byte), the size (8 bytes) and the Adler-32 (4 bytes) of the base file
+    # and of the new file, and the block size (4 bytes). It's followed by the operations: COPY (1 byte) with the index of the 1st
+    # base block and the number of blocks (4 bytes each), or LITERAL (1 byte) with the number of bytes (4 bytes) and the bytes. Big-endian.
+    # The blocks are matched by a weak rolling checksum (the one of rsync) confirmed by a strong hash
+    VERSION = 1
+    CONTENT_TYPE = 2 # in the header, the content is a delta
+    COPY = 0
+    LITERAL = 1
+    HEADER = struct.Struct(">BQIQII")
+    COPY_ARGS = struct.Struct(">II")
+    LITERAL_ARGS = struct.Struct(">I")
+    READ_SIZE = 1024*1024
+
+    @classmethod
+    def get_file_checksum(cls, file_path:str):
+        # Size and Adler-32 of a file
+        size = 0
+        checksum = zlib.adler32(b"")
+        with open(file_path, 'rb') as f:
+            while block := f.read(cls.READ_SIZE):
+                size += len(block)
+                checksum = zlib.adler32(block, checksum)
+        return size, checksum
+
+    @classmethod
+    def pack_header(cls, header:DeltaHeader)->bytes:
+        return cls.HEADER.pack(cls.VERSION, header.base_size, header.base_checksum, header.size, header.checksum, header.block_size)
+
+    @classmethod
+    def read_header(cls, f)->DeltaHeader:
+        data = f.read(cls.HEADER.size)
+        if len(data) != cls.HEADER.size:
+            raise ValueError("The delta is truncated")
+        version, *values = cls.HEADER.unpack(data)
+        if version != cls.VERSION:
+            raise ValueError(f"Unexpected delta version {version}. Expect {cls.VERSION}")
+        return DeltaHeader(*values)
+
+    @staticmethod
+    def get_weak_checksums(data:np.ndarray, block_size:int)->np.ndarray:
+        # Weak checksum of the block_size bytes starting at each position of data: a = sum of the bytes, b = sum of the bytes weighted
+        # by their distance to the block end, both modulo 2^16. Computed from cumulative sums instead of rolled byte by byte
+        values = data.astype(np.int64)
+        sums = np.concatenate(([0], np.cumsum(values)))
+        weighted_sums = np.concatenate(([0], np.cumsum(values * np.arange(len(values)))))
+        starts = np.arange(len(values) - block_size + 1)
+        a = sums[starts + block_size] - sums[starts]
+        b = block_size * a - (weighted_sums[starts + block_size] - weighted_sums[starts]) + starts * a
+        return (a & 0xffff) | ((b & 0xffff) << 16)
+
+    @staticmethod
+    def get_block_weak_checksums(data:np.ndarray, block_size:int)->np.ndarray:
+        # Weak checksum of each block of data, whose size is a multiple of block_size
+        values = data.reshape(-1, block_size).astype(np.int64)
+        a = values.sum(axis=1)
+        b = values @ np.arange(block_size, 0, -1, dtype=np.int64)
+        return (a & 0xffff) | ((b & 0xffff) << 16)
+
+    @staticmethod
+    def get_strong_hash(block:bytes)->bytes:
+        return hashlib.blake2b(block, digest_size=16).digest()
@@ -0,0 +1,126 @@
+import json
+import logging
+import math
+import sys
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError: # not on Windows, the peak RSS is not reported
+    resource = None
+
+_logger = logging.getLogger(__name__)
+
+class Metrics:
+    # Instrumentation of a workflow: the time spent in each stage and what it processed (bytes, bits, samples), the events of the
+    # workflow (e.g. each demodulated chunk) and the peak RSS of the process.
+    # A stage is timed without the stages run inside it, so that the stages of a stream, which pull their blocks from each other,
+    # are timed apart. Only the thread running the workflow is instrumented.
+    # The hooks are called as hook(kind, data) after each run of a stage (kind "stage", data with its name, its seconds and its counts)
+    # and with each event (kind the event name, data the event data)
+    VERSION = 1
+    RATE_COUNTS = ("bytes", "bits", "samples") # counts reported per second of their stage too
+
+    def __init__(self, hooks:list|None=None) -> None:
+        self._hooks = list(hooks or [])
+        self._stages:dict[str, dict] = {}
+        self._events:dict[str, list[dict]] = {}
+        self._running:list[list] = [] # [start, time of the nested stages] of the stages being run, innermost last
+        self._start = time.perf_counter()
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    @contextmanager
+    def stage(self, name:str, **counts):
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, counts)
+
+    def iter_stage(self, name:str, iterable, counter=None):
+        # Iterates over iterable timing each item as a run of the stage. counter(item) gives the counts of an item
+        iterator = iter(iterable)
+        while True:
+            self._enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, {})
+                return
+            except BaseException:
+                self._exit(name, {})
+                raise
+            self._exit(name, counter(item) if counter is not None else {})
+            yield item
+
+    def count(self, name:str, **counts):
+        # Adds counts to a stage without timing it
+        stage = self._get_stage(name)
+        for key, value in counts.items():
+            stage["counts"][key] = stage["counts"].get(key, 0) + value
+
+    def event(self, kind:str, **data):
+        self._events.setdefault(kind, []).append(data)
+        self._call_hooks(kind, data)
+
+    def _get_stage(self, name:str)->dict:
+        if name not in self._stages:
+            self._stages[name] = {"seconds": 0.0, "calls": 0, "counts": {}}
+        return self._stages[name]
+
+    def _enter(self):
+        self._running.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name:str, counts:dict):
+        start, nested_seconds = self._running.pop()
+        seconds = time.perf_counter() - start
+        if self._running:
+            self._running[-1][1] += seconds
+        stage = self._get_stage(name)
+        stage["seconds"] += seconds - nested_seconds
+        stage["calls"] += 1
+        self.count(name, **counts)
+        if self._hooks:
+            self._call_hooks("stage", {"name": name, "seconds": seconds - nested_seconds, **counts})
+
+    def _call_hooks(self, kind:str, data:dict):
+        for hook in self._hooks:
+            hook(kind, data)
+
+    @staticmethod
+    def get_peak_rss()->dict:
+        # Bytes, of the process and of its terminated children (the demodulation jobs), None when not available
+        if resource is None:
+            return {"self": None, "children": None}
+        scale = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+        return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+    def report(self)->dict:
+        # Each stage gets its seconds, its number of runs, its counts and the rates of the RATE_COUNTS
+        stages = {}
+        for name, stage in self._stages.items():
+            stages[name] = {"seconds": stage["seconds"], "calls": stage["calls"], **stage["counts"]}
+            for key in self.RATE_COUNTS:
+                if key in stage["counts"]:
+                    stages[name][f"{key}_per_second"] = stage["counts"][key] / stage["seconds"] if stage["seconds"] > 0 else None
+        return self._to_json({"version": self.VERSION, "seconds": time.perf_counter() - self._start, "peak_rss": self.get_peak_rss(),
+                              "stages": stages, "events": self._events})
+
+    @classmethod
+    def _to_json(cls, value):
+        # NaN and infinities are not valid JSON, they are reported as None
+        if isinstance(value, dict):
+            return {key: cls._to_json(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls._to_json(item) for item in value]
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return value
+
+    def save(self, file_path:str):
+        with open(file_path, 'w') as f:
+            json.dump(self.report(), f, indent=2, allow_nan=False)
+        _logger.info(f"Metrics saved to {file_path}")
@@ -0,0 +1,205 @@
+import logging
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+
+def _gen_tables():
+    # Exponents and logarithms of GF(256) built on the primitive polynomial x^8+x^4+x^3+x^2+1 (0x11d), the generator is 2
+    exp = [0] * 512
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11d
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+_EXP, _LOG = _gen_tables()
+
+def _gen_mul_table()->np.ndarray:
+    logs = np.array(_LOG)
+    table = np.array(_EXP, dtype=np.uint8)[logs[:, None] + logs[None, :]]
+    table[0, :] = 0
+    table[:, 0] = 0
+    return table
+
+_MUL = _gen_mul_table() # _MUL[a, b] is a*b, used to compute many codewords at once
+
+
+def _mul(a:int, b:int)->int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def _div(a:int, b:int)->int:
+    if b == 0:
+        raise ZeroDivisionError()
+    if a == 0:
+        return 0
+    return _EXP[(_LOG[a] + 255 - _LOG[b]) % 255]
+
+def _pow(x:int, power:int)->int:
+    return _EXP[(_LOG[x] * power) % 255]
+
+def _inverse(x:int)->int:
+    return _EXP[255 - _LOG[x]]
+
+# Polynomials are lists of coefficients, the highest degree first
+def _poly_scale(p:list, x:int)->list:
+    return [_mul(c, x) for c in p]
+
+def _poly_add(p:list, q:list)->list:
+    r = [0] * max(len(p), len(q))
+    r[len(r) - len(p):] = p
+    for i, c in enumerate(q):
+        r[i + len(r) - len(q)] ^= c
+    return r
+
+def _poly_mul(p:list, q:list)->list:
+    r = [0] * (len(p) + len(q) - 1)
+    for j, b in enumerate(q):
+        for i, a in enumerate(p):
+            r[i + j] ^= _mul(a, b)
+    return r
+
+def _poly_eval(p:list, x:int)->int:
+    y = p[0]
+    for c in p[1:]:
+        y = _mul(y, x) ^ c
+    return y
+
+
+class ReedSolomon:
+    # Reed-Solomon code over GF(256): parity_number bytes are added to codewords of at most 255 bytes.
+    # It corrects e errors and f erasures (bytes known to be unreliable) as long as 2e + f <= parity_number.
+    # The codewords are encoded and checked together with numpy, only the ones with errors are corrected one by one
+    MAX_CODEWORD_SIZE = 255
+
+    def __init__(self, parity_number:int, data_size:int) -> None:
+        assert 0 < parity_number and 0 < data_size and parity_number + data_size <= self.MAX_CODEWORD_SIZE, f"Unexpected codeword of {data_size} data bytes and {parity_number} parity bytes"
+        self._parity_number = parity_number
+        self._data_size = data_size
+        self._generator = self._gen_generator(parity_number)
+        self._remainders = self._gen_remainders()
+        codeword_size = data_size + parity_number
+        # _powers[i, j] is alpha^(j*(n-1-i)), the syndrome j of a codeword c is the xor of the c[i]*_powers[i, j]
+        exponents = (codeword_size - 1 - np.arange(codeword_size))[:, None] * np.arange(parity_number)[None, :]
+        self._powers = np.array(_EXP, dtype=np.uint8)[exponents % 255]
+
+    @staticmethod
+    def _gen_generator(parity_number:int)->list:
+        generator = [1]
+        for i in range(parity_number):
+            generator = _poly_mul(generator, [1, _pow(2, i)])
+        return generator
+
+    def _gen_remainders(self)->np.ndarray:
+        # _remainders[i] is x^(k-1-i+parity_number) mod generator, the parity bytes are the xor of the data[i]*_remainders[i]
+        remainders = np.zeros((self._data_size, self._parity_number), dtype=np.uint8)
+        remainder = self._generator[1:] # x^parity_number mod generator
+        for i in range(self._data_size - 1, -1, -1):
+            remainders[i] = remainder
+            lead = remainder[0]
+            remainder = remainder[1:] + [0]
+            if lead:
+                remainder = [c ^ _mul(lead, g) for c, g in zip(remainder, self._generator[1:])]
+        return remainders
+
+    def encode(self, data:np.ndarray)->np.ndarray:
+        # data is an array of codeword number x data_size bytes, returns the codewords with their parity bytes at the end
+        assert data.shape[1] == self._data_size, f"Unexpected data size {data.shape[1]}, expect {self._data_size}"
+        parity = np.bitwise_xor.reduce(_MUL[data[:, :, None], self._remainders[None, :, :]], axis=1)
+        return np.concatenate((data, parity), axis=1)
+
+    def syndromes(self, codewords:np.ndarray)->np.ndarray:
+        # All zeros for a codeword without errors
+        return np.bitwise_xor.reduce(_MUL[codewords[:, :, None], self._powers[None, :, :]], axis=1)
+
+    def decode(self, codewords:np.ndarray, erasures:list|None=None)->np.ndarray:
+        # erasures gives the positions of the unreliable bytes of each codeword (None if there are none).
+        # Returns the corrected data bytes, raises a ValueError when a codeword cannot be corrected
+        codewords = np.array(codewords, dtype=np.uint8)
+        if erasures is not None:
+            for cw, positions in enumerate(erasures):
+                codewords[cw, positions] = 0
+        syndromes = self.syndromes(codewords)
+        for cw in np.flatnonzero(syndromes.any(axis=1)):
+            positions = [] if erasures is None else sorted(set(erasures[cw]))
+            codewords[cw] = self._correct(codewords[cw].tolist(), syndromes[cw].tolist(), positions)
+            _logger.debug(f"Codeword {cw} corrected with {len(positions)} erasures")
+        return codewords[:, :self._data_size]
+
+    def _correct(self, codeword:list, syndromes:list, erasure_positions:list)->list:
+        if len(erasure_positions) > self._parity_number:
+            raise ValueError(f"Too many erasures to correct: {len(erasure_positions)}")
+        forney_syndromes = self._get_forney_syndromes(syndromes, erasure_positions, len(codeword))
+        error_locator = self._find_error_locator(forney_syndromes, len(erasure_positions))
+        error_positions = self._find_errors(error_locator[::-1], len(codeword))
+        codeword = self._correct_errata(codeword, [0] + syndromes, erasure_positions + error_positions)
+        if self.syndromes(np.array([codeword], dtype=np.uint8)).any():
+            raise ValueError("Cannot correct the codeword")
+        return codeword
+
+    def _get_forney_syndromes(self, syndromes:list, erasure_positions:list, codeword_size:int)->list:
+        # Syndromes without the erasures, to find the errors only
+        forney_syndromes = list(syndromes)
+        for position in erasure_positions:
+            x = _pow(2, codeword_size - 1 - position)
+            for j in range(len(forney_syndromes) - 1):
+                forney_syndromes[j] = _mul(forney_syndromes[j], x) ^ forney_syndromes[j + 1]
+        return forney_syndromes
+
+    def _find_error_locator(self, syndromes:list, erasure_number:int)->list:
+        # Berlekamp-Massey
+        locator, old_locator = [1], [1]
+        for i in range(self._parity_number - erasure_number):
+            delta = syndromes[i]
+            for j in range(1, len(locator)):
+                delta ^= _mul(locator[-(j + 1)], syndromes[i - j])
+            old_locator = old_locator + [0]
+            if delta != 0:
+                if len(old_locator) > len(locator):
+                    new_locator = _poly_scale(old_locator, delta)
+                    old_locator = _poly_scale(locator, _inverse(delta))
+                    locator = new_locator
+                locator = _poly_add(locator, _poly_scale(old_locator, delta))
+        while len(locator) and locator[0] == 0:
+            del locator[0]
+        error_number = len(locator) - 1
+        if error_number * 2 + erasure_number > self._parity_number:
+            raise ValueError(f"Too many errors to correct: {error_number} errors and {erasure_number} erasures")
+        return locator
+
+    def _find_errors(self, locator:list, codeword_size:int)->list:
+        # Chien search of the roots of the error locator
+        positions = [codeword_size - 1 - i for i in range(codeword_size) if _poly_eval(locator, _pow(2, i)) == 0]
+        if len(positions) != len(locator) - 1:
+            raise ValueError("Cannot locate the errors")
+        return positions
+
+    def _correct_errata(self, codeword:list, syndromes:list, positions:list)->list:
+        # Forney algorithm, syndromes starts with a 0
+        coefficient_positions = [len(codeword) - 1 - p for p in positions]
+        locator = [1]
+        for p in coefficient_positions:
+            locator = _poly_mul(locator, _poly_add([1], [_pow(2, p), 0]))
+        product = _poly_mul(syndromes[::-1], locator)
+        evaluator = product[len(product) - len(locator):][::-1] # product mod x^len(locator)
+        xs = [_pow(2, p) for p in coefficient_positions]
+        codeword = list(codeword)
+        for i, x in enumerate(xs):
+            x_inverse = _inverse(x)
+            locator_prime = 1
+            for j, other in enumerate(xs):
+                if j != i:
+                    locator_prime = _mul(locator_prime, 1 ^ _mul(x_inverse, other))
+            if locator_prime == 0:
+                raise ValueError("Cannot correct the codeword")
+            y = _mul(x, _poly_eval(evaluator[::-1], x_inverse))
+            codeword[positions[i]] ^= _div(y, locator_prime)
+        return codeword
@@ -0,0 +1,91 @@
+import numpy as np
+from .bitbuffer import BitBuffer
+
+
+class CalibrationSweep:
+    # A sound to measure a link before choosing the frequency and the chunk size: the meta data at 1 kHz (with the highest frequency of
+    # the sweep, and the wave version 0 that no transmission uses), then for each frequency of FREQUENCIES up to a sixth of the frame rate,
+    # GAP_SEC of silence and a segment of the wave version 1 at this frequency: PREAMBLE_ONES_NUMBER "1"s, VOID_ZERO_NUMBER "0"s and the pattern.
+    # The pattern is DROOP_REPEAT times the runs of ZERO_RUNS "0"s each followed by RUN_ONES_NUMBER "1"s (the amplitude of the 1st "1" after
+    # a run gives the droop), then PRBS_BITS_NUMBER bits of a PRBS-15 (the bit error rate).
+    # The segments are placed by their duration in seconds, so they are found whatever the frame rate of the recording
+    VERSION = 1 # sent as the reader version of the meta data
+    WAVE_VERSION = 0
+    FREQUENCIES = (4000, 6000, 8000, 10000, 12000, 16000, 20000, 24000, 28000, 32000, 40000, 48000)
+    GAP_SEC = 0.05
+    PREAMBLE_ONES_NUMBER = 100
+    PREAMBLE_ONES_THRESHOLD = 17
+    VOID_ZERO_NUMBER = 7
+    ZERO_RUNS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+    RUN_ONES_NUMBER = 8
+    DROOP_REPEAT = 4
+    PRBS_BITS_NUMBER = 8192
+
+    @classmethod
+    def get_max_frequency(cls, frame_rate:int)->int:
+        # Highest frequency of the sweep sent at frame_rate
+        frequencies = [freq for freq in cls.FREQUENCIES if freq * 6 <= frame_rate]
+        assert frequencies, f"The frame rate is too low for a calibration sweep ({frame_rate})"
+        return frequencies[-1]
+
+    @classmethod
+    def get_frequencies(cls, max_frequency:int)->list[int]:
+        return [freq for freq in cls.FREQUENCIES if freq <= max_frequency]
+
+    @classmethod
+    def get_segment_bits(cls)->BitBuffer:
+        bits = BitBuffer.repeat(1, cls.PREAMBLE_ONES_NUMBER)
+        bits.append(BitBuffer.repeat(0, cls.VOID_ZERO_NUMBER))
+        bits.append(cls.get_pattern())
+        return bits
+
+    @classmethod
+    def get_pattern(cls)->BitBuffer:
+        return BitBuffer.from_array(np.concatenate((np.tile(cls._get_droop_bits(), cls.DROOP_REPEAT), cls._get_prbs(cls.PRBS_BITS_NUMBER))))
+
+    @classmethod
+    def get_droop_indexes(cls)->dict[int, list[int]]:
+        # Indexes in the pattern of the 1st "1" after each run of "0"s
+        indexes = {run: [] for run in cls.ZERO_RUNS}
+        position = 0
+        for _ in range(cls.DROOP_REPEAT):
+            for run in cls.ZERO_RUNS:
+                indexes[run].append(position + run)
+                position += run + cls.RUN_ONES_NUMBER
+        return indexes
+
+    @classmethod
+    def get_prbs_start(cls)->int:
+        # Index in the pattern of the 1st bit of the PRBS
+        return cls.DROOP_REPEAT * (sum(cls.ZERO_RUNS) + len(cls.ZERO_RUNS) * cls.RUN_ONES_NUMBER)
+
+    @classmethod
+    def get_segment_duration(cls, freq:int)->float:
+        # Seconds of the segment of freq, without its gap
+        return (cls.PREAMBLE_ONES_NUMBER + cls.VOID_ZERO_NUMBER + cls.get_prbs_start() + cls.PRBS_BITS_NUMBER) / freq
+
+    @classmethod
+    def get_segment_start(cls, max_frequency:int, freq:int)->float:
+        # Seconds from the end of the meta data to the 1st cycle of the segment of freq
+        start = 0.0
+        for previous in cls.get_frequencies(max_frequency):
+            start += cls.GAP_SEC
+            if previous == freq:
+                return start
+            start += cls.get_segment_duration(previous)
+        raise ValueError(f"{freq} is not a frequency of the sweep")
+
+    @classmethod
+    def _get_droop_bits(cls)->np.ndarray:
+        return np.concatenate([np.concatenate((np.zeros(run, dtype=np.uint8), np.ones(cls.RUN_ONES_NUMBER, dtype=np.uint8))) for run in cls.ZERO_RUNS])
+
+    @staticmethod
+    def _get_prbs(bits_number:int)->np.ndarray:
+        # PRBS-15 (x^15 + x^14 + 1) from the all ones state
+        state = 0x7fff
+        bits = np.empty(bits_number, dtype=np.uint8)
+        for i in range(bits_number):
+            bit = ((state >> 14) ^ (state >> 13)) & 1
+            state = ((state << 1) | bit) & 0x7fff
+            bits[i] = bit
+        return bits
@@ -0,0 +1,162 @@
+import logging
+import math
+import numpy as np
+from .demodclass import BlockDataDemod
+from .soundprofile import BlockSoundProfile
+from .soundwindow import SampleWindow
+from .waveutils import WaveUtils
+from .readwave import WaveReader
+from .timingrecovery import TimingRecovery
+from .softdetector import SoftDetector
+from ..common import BitBuffer
+from ..common.sweep import CalibrationSweep
+
+_logger = logging.getLogger(__name__)
+
+
+class SweepSegmentDemod(BlockDataDemod):
+    # Demodulates a segment of the calibration sweep as a header: the cycles are tracked from its preamble, the cycles which are
+    # neither a "0" nor a "1" are erasures instead of errors, and the margins of the cycles are kept
+    def __init__(self, bsp:BlockSoundProfile, wutils:WaveUtils) -> None:
+        super().__init__(bsp, wutils)
+        self._timing = TimingRecovery(bsp.cycle_length)
+        self._erasures = []
+        self._margins = []
+        raw_bits = self._get_raw_bit()
+        purged_bits, starting_ones_count = self._purge_block_start(raw_bits)
+        self._pattern_length = bsp.block_bits_number - bsp.beginning_ones_number - bsp.beginning_void_zero_number
+        self.bits:BitBuffer = purged_bits[bsp.beginning_void_zero_number:bsp.beginning_void_zero_number + self._pattern_length]
+        self._pattern_start = starting_ones_count + bsp.beginning_void_zero_number # cycle of the 1st bit of the pattern
+
+    @property
+    def rate_ratio(self)->float:
+        return self._timing.cycle_length / (self._bsp.frame_rate / self._bsp.freq)
+
+    @property
+    def max_volume(self)->float:
+        return float(self._max_volume)
+
+    @property
+    def erasure_number(self)->int:
+        return sum(1 for i in self._erasures if self._pattern_start <= i < self._pattern_start + self._pattern_length)
+
+    @property
+    def margins(self)->np.ndarray:
+        # Of the cycles of the pattern, see WaveUtils.demod_to_bits
+        return np.concatenate(self._margins)[self._pattern_start:self._pattern_start + len(self.bits)]
+
+    def get_peaks(self, start:int, stop:int)->np.ndarray:
+        # Peak of the absolute samples of the cycles of the pattern from start to stop
+        bounds = np.array([self._first_cycle_index + self._timing.get_position(self._pattern_start + i) for i in range(start, stop + 1)]).astype(np.int64)
+        block = np.abs(np.asarray(self._bsp.sound_data[int(bounds[0]):int(bounds[-1])], dtype=np.float64))
+        return np.maximum.reduceat(block, bounds[:-1] - bounds[0]) if len(block) else np.zeros(0)
+
+
+class SweepAnalyzer:
+    # Measures a link on a recording of the calibration sweep (see CalibrationSweep): for each frequency, the bit error rate of its
+    # segment, its erasures and its smallest margin (see WaveUtils.demod_to_bits), the droop (the peak of the 1st "1" after each
+    # run of "0"s over the median peak of the "1"s) and the clock drift (the recorded cycle length over the nominal one).
+    # A segment is too short to see the errors of long chunks, so the bit error probability is estimated from the margins of its "0"s and
+    # of its "1"s (signed, negative for a wrong bit), each taken as a normal distribution: the probability of a margin under the one of an
+    # erasure. The chunk sizes kept for a frequency lose less than MAX_CHUNK_LOSS of their chunks, and their cycles are moved by less
+    # than MAX_CHUNK_SHIFT cycle by the change of the drift across the sweep (the drift the header measures not being the one of the chunks).
+    # The recommended frequency is the highest one without bit error nor erasure and with chunk sizes kept, with the largest of them
+    CHUNK_KB_SIZES = (1, 2, 4, 8, 16, 32, 64)
+    MAX_CHUNK_LOSS = 0.01
+    MAX_CHUNK_SHIFT = 0.25
+    SEARCH_MARGIN_SEC = CalibrationSweep.GAP_SEC / 2 # around the expected start of a segment
+
+    def __init__(self, reader:WaveReader, wutils:WaveUtils, soft_detection:bool=False) -> None:
+        self._reader = reader
+        self._wutils = wutils
+        self._soft_detection = soft_detection
+        self._pattern = CalibrationSweep.get_pattern().to_array()
+
+    def analyze(self, max_frequency:int, meta_end:int)->dict:
+        # meta_end is the sample index of the end of the meta data of the sweep, max_frequency the highest frequency they give
+        segments = [self._analyze_segment(freq, max_frequency, meta_end) for freq in CalibrationSweep.get_frequencies(max_frequency)]
+        drifts = [segment["clock_drift_ppm"] for segment in segments if segment.get("bit_errors") == 0]
+        clock_wander_ppm = max(drifts) - min(drifts) if drifts else 0.0
+        recommended = None
+        for segment in segments:
+            if segment.get("bit_errors") == 0 and segment["erasures"] == 0:
+                segment["chunk_sizes"] = self._get_chunk_sizes(segment["bit_error_probability"], clock_wander_ppm)
+                segment["reliable"] = bool(segment["chunk_sizes"])
+                if segment["reliable"]:
+                    recommended = segment
+        return {"frame_rate": self._reader.frame_rate,
+                "soft_detection": self._soft_detection,
+                "clock_drift_ppm": float(np.median(drifts)) if drifts else None,
+                "clock_wander_ppm": clock_wander_ppm,
+                "frequency": recommended["frequency"] if recommended else None,
+                "chunk_size": recommended["chunk_sizes"][-1] if recommended else None,
+                "segments": segments}
+
+    def _get_chunk_sizes(self, bit_error_probability:float, clock_wander_ppm:float)->list[int]:
+        max_loss_bits = math.log1p(-self.MAX_CHUNK_LOSS) / math.log1p(-bit_error_probability) if bit_error_probability > 0 else math.inf
+        max_shift_bits = self.MAX_CHUNK_SHIFT / (clock_wander_ppm * 1e-6) if clock_wander_ppm > 0 else math.inf
+        return [kb for kb in self.CHUNK_KB_SIZES if kb * 8 * 1024 <= min(max_loss_bits, max_shift_bits)]
+
+    def _get_bit_error_probability(self, margins:np.ndarray)->float:
+        # margins are the signed margins of the cycles of the pattern
+        failure_margin = SoftDetector.ERASURE_MARGIN if self._soft_detection else 0.0
+        probabilities = []
+        for bit in (0, 1):
+            bit_margins = margins[self._pattern[:len(margins)] == bit]
+            mean, deviation = float(np.mean(bit_margins)), float(np.std(bit_margins))
+            if deviation == 0:
+                probabilities.append(0.0 if mean > failure_margin else 1.0)
+            else:
+                probabilities.append(0.5 * math.erfc((mean - failure_margin) / (deviation * math.sqrt(2))))
+        return float(np.mean(probabilities))
+
+    def _analyze_segment(self, freq:int, max_frequency:int, meta_end:int)->dict:
+        result = {"frequency": freq, "reliable": False, "error": None}
+        if freq * 6 > self._reader.frame_rate:
+            result["error"] = "Above a sixth of the frame rate of the recording"
+            return result
+        frame_rate = self._reader.frame_rate
+        search_start = meta_end + int((CalibrationSweep.get_segment_start(max_frequency, freq) - self.SEARCH_MARGIN_SEC) * frame_rate)
+        bsp = BlockSoundProfile(
+            sound_data = SampleWindow(self._reader, max(search_start, 0)),
+            freq = freq,
+            frame_rate = frame_rate,
+            block_bits_number = CalibrationSweep.PREAMBLE_ONES_NUMBER + CalibrationSweep.VOID_ZERO_NUMBER + len(self._pattern),
+            search_sec = 2 * self.SEARCH_MARGIN_SEC + CalibrationSweep.PREAMBLE_ONES_NUMBER / freq,
+            beginning_ones_number = CalibrationSweep.PREAMBLE_ONES_NUMBER,
+            beginning_ones_threshold = CalibrationSweep.PREAMBLE_ONES_THRESHOLD,
+            beginning_void_zero_number = CalibrationSweep.VOID_ZERO_NUMBER,
+            preamble_sync = True,
+            soft_detection = self._soft_detection
+        )
+        try:
+            segment = SweepSegmentDemod(bsp, self._wutils)
+        except ValueError as e:
+            _logger.debug(f"Segment of {freq}Hz: {e}")
+            result["error"] = str(e)
+            return result
+        bits = segment.bits.to_array()
+        right = bits == self._pattern[:len(bits)]
+        bit_errors = int(np.count_nonzero(~right)) + len(self._pattern) - len(bits) # the missing bits are errors
+        margins = np.where(right, segment.margins, -segment.margins)
+        bit_error_probability = self._get_bit_error_probability(margins) if len(margins) else 1.0
+        result.update({"bits": len(self._pattern),
+                       "bit_errors": bit_errors,
+                       "bit_error_rate": bit_errors / len(self._pattern),
+                       "bit_error_probability": bit_error_probability,
+                       "erasures": segment.erasure_number,
+                       "min_margin": float(margins.min()) if len(margins) else None,
+                       "max_volume": segment.max_volume,
+                       "droop": self._get_droop(segment) if len(bits) == len(self._pattern) else None,
+                       "clock_drift_ppm": (segment.rate_ratio - 1) * 1e6,
+                       "chunk_sizes": []})
+        _logger.info(f"{freq}Hz: {bit_errors} bit errors, {result['erasures']} erasures, estimated bit error probability {bit_error_probability:.1e}")
+        return result
+
+    def _get_droop(self, segment:SweepSegmentDemod)->dict:
+        # Peak of the 1st "1" after each run of "0"s over the median peak of the "1"s of the PRBS, by run length
+        prbs_start = CalibrationSweep.get_prbs_start()
+        prbs_peaks = segment.get_peaks(prbs_start, len(self._pattern))
+        ones_peak = float(np.median(prbs_peaks[self._pattern[prbs_start:] == 1]))
+        peaks = segment.get_peaks(0, prbs_start)
+        return {run: float(np.mean(peaks[indexes])) / ones_peak for run, indexes in CalibrationSweep.get_droop_indexes().items()}
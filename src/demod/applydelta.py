@@ -0,0 +1,75 @@
+import logging
+import os
+import tempfile
+from ..common.delta import Delta, DeltaHeader
+from .bytesutils import BytesUtils
+
+_logger = logging.getLogger(__name__)
+
+class DeltaDecoder:
+    # Rebuilds a file from its base file and a Delta, checking the base file before and the rebuilt file after
+    def __init__(self, base_file_path:str) -> None:
+        self._base_file_path = base_file_path
+
+    def check_base(self, base_checksum:int):
+        # Raises a ValueError if the base file is not the one the delta was made against
+        _, checksum = Delta.get_file_checksum(self._base_file_path)
+        if checksum != base_checksum:
+            raise ValueError(f"{self._base_file_path} is not the base file of the delta")
+
+    def apply(self, delta_f, output_file_path:str)->DeltaHeader:
+        # delta_f is the delta, read from its beginning. The file is rebuilt in a temporary file replacing the output one once
+        # checked, so that the base file can be the output file
+        header = Delta.read_header(delta_f)
+        if Delta.get_file_checksum(self._base_file_path) != (header.base_size, header.base_checksum):
+            raise ValueError(f"{self._base_file_path} is not the base file of the delta")
+        output_dir = os.path.dirname(os.path.abspath(output_file_path))
+        with tempfile.NamedTemporaryFile(dir=output_dir, prefix=".buzzdelta", delete=False) as output, open(self._base_file_path, 'rb') as base:
+            try:
+                size, checksum = self._rebuild(delta_f, base, output, header.block_size)
+            except BaseException:
+                output.close()
+                os.remove(output.name)
+                raise
+        if (size, checksum) != (header.size, header.checksum):
+            os.remove(output.name)
+            raise ValueError("The rebuilt file does not match its checksum")
+        os.replace(output.name, output_file_path)
+        _logger.info(f"Rebuilt {output_file_path} ({size} bytes) from {self._base_file_path}")
+        return header
+
+    def _rebuild(self, delta_f, base, output, block_size:int):
+        # Returns the size and the checksum of the rebuilt file
+        size = 0
+        checksum = BytesUtils.checksum(b"")
+        while operation := delta_f.read(1):
+            if operation[0] == Delta.COPY:
+                block_index, block_number = Delta.COPY_ARGS.unpack(self._read_exactly(delta_f, Delta.COPY_ARGS.size))
+                base.seek(block_index * block_size)
+                pieces = self._iter_pieces(base, block_number * block_size)
+            elif operation[0] == Delta.LITERAL:
+                literal_size, = Delta.LITERAL_ARGS.unpack(self._read_exactly(delta_f, Delta.LITERAL_ARGS.size))
+                pieces = self._iter_pieces(delta_f, literal_size)
+            else:
+                raise ValueError(f"Unexpected delta operation {operation[0]}")
+            for piece in pieces:
+                output.write(piece)
+                checksum = BytesUtils.checksum(piece, checksum)
+                size += len(piece)
+        return size, checksum
+
+    @staticmethod
+    def _iter_pieces(f, size:int):
+        while size:
+            piece = f.read(min(size, Delta.READ_SIZE))
+            if not piece:
+                raise ValueError("The delta is truncated or does not match its base file")
+            size -= len(piece)
+            yield piece
+
+    @staticmethod
+    def _read_exactly(f, size:int)->bytes:
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("The delta is truncated")
+        return data
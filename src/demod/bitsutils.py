@@ -1,15 +1,14 @@
+from ..common import BitBuffer
 
 
 class BitsUtils:
     @classmethod
-    def purge_beginning_ones(cls, raw_bits:str):
-        original_len = len(raw_bits)
-        purged_bits = raw_bits.lstrip("1")
-        purged_len = len(purged_bits)
-        starting_ones_count = original_len - purged_len
+    def purge_beginning_ones(cls, raw_bits:BitBuffer):
+        starting_ones_count = raw_bits.count_leading(1)
+        purged_bits = raw_bits[starting_ones_count:]
         return purged_bits, starting_ones_count
 
     @classmethod
-    def bits_to_int(cls, bits:str):
-        return int(bits, 2)
+    def bits_to_int(cls, bits:BitBuffer):
+        return bits.to_int()
     
\ No newline at end of file
@@ -1,17 +1,16 @@
 
-import struct
 import zlib
+from ..common import BitBuffer
 
 class BytesUtils:
     @classmethod
-    def bits_to_bytes(cls, bits:str)->bytes:
-        fmt = 'B' * ((len(bits) + 7) // 8)
-        packed = struct.pack(fmt, *[sum(b << 7-i for i, b in enumerate(map(int, bits[n:n+8]))) for n in range(0, len(bits), 8)])
-        return packed
+    def bits_to_bytes(cls, bits:BitBuffer)->bytes:
+        return bits.tobytes()
     
     @classmethod
-    def checksum(cls, bytes_content:bytes)->int:
-        return zlib.adler32(bytes_content)
+    def checksum(cls, bytes_content:bytes, value:int=1)->int:
+        # value is the checksum of the previous content to compute a running checksum, 1 is the initial adler32 value
+        return zlib.adler32(bytes_content, value)
     
     @classmethod
     def save_bytes_to_file(cls, bytes_content:bytes, file_path):
@@ -2,6 +2,9 @@ import logging
 from .waveutils import WaveUtils
 from .soundprofile import BlockSoundProfile
 from .bitsutils import BitsUtils
+from .timingrecovery import TimingRecovery
+from .softdetector import SoftDetector
+from ..common import BitBuffer
 
 _logger = logging.getLogger(__name__)
 
@@ -12,23 +15,72 @@ class BlockDataDemod:
         self._first_cycle_index = None
         self._block_data = None
         self._remaining_sound_data_index = None
+        self._erasures:list[int]|None = None # cycles of the last block which are neither a "0" nor a "1", None to raise an error on them
+        self._timing:TimingRecovery|None = None # follows the drift of the cycles, None for cycles of the nominal length
+        self._detector = SoftDetector() if bsp.soft_detection else None
+        self._max_volume = None # of the last block
+        self._margins:list|None = None # receives the margins of the cycles of the last block (see WaveUtils.demod_to_bits), None not to measure them
+        self._first_cycle_fraction = 0.0 # where the 1st cycle starts after the sample _first_cycle_index, with the timing recovery
+        self._remaining_fraction = 0.0 # where the previous block ends after the 1st sample of the remaining sound, with the timing recovery
 
     def _get_raw_bit(self):
         block_sound, self._first_cycle_index = self._wutils.find_sound_data_block(self._bsp.sound_data,
                                                                                   self._bsp.freq,
                                                                                   self._bsp.block_bits_number,
-                                                                                  search_time_in_sec=self._bsp.search_sec)
+                                                                                  search_time_in_sec=self._bsp.search_sec,
+                                                                                  preamble_cycle_number=self._bsp.beginning_ones_number if self._bsp.preamble_sync else 0)
+        self._first_cycle_fraction = 0.0
+        if self._timing is not None:
+            block_sound = self._bsp.sound_data[self._first_cycle_index:self._first_cycle_index + self._get_max_block_length()]
+        return self._demod_block(block_sound)
+
+    def _get_raw_bit_at(self, first_cycle_position:float, cycle_number:int|None=None):
+        # Same as _get_raw_bit when the position of the 1st cycle is already known, cycle_number limits it to the first cycles
+        self._first_cycle_index = int(first_cycle_position)
+        self._first_cycle_fraction = first_cycle_position - self._first_cycle_index
+        return self._demod_block(self._bsp.sound_data[self._first_cycle_index:self._first_cycle_index + self._get_max_block_length()], cycle_number)
+
+    @property
+    def _cycle_length(self)->float:
+        return self._bsp.cycle_length if self._timing is None else self._timing.cycle_length
+
+    def _get_max_block_length(self)->int:
+        # Samples of a block, with a margin for the drift when the cycles are tracked
+        if self._timing is None:
+            return int(self._bsp.cycle_length * self._bsp.block_bits_number) + 100
+        return int(self._timing.cycle_length * self._bsp.block_bits_number * (1 + TimingRecovery.MAX_DRIFT)) + 100
+
+    def _demod_block(self, block_sound, cycle_number:int|None=None):
+        # cycle_number limits the demodulation to the first cycles of the block
         max_volume = self._wutils.find_max_volume(block_sound, search_time_in_sec=self._bsp.beginning_ones_number*2/self._bsp.freq)
-        return self._wutils.demod_to_bits(block_sound, self._bsp.freq, 0, max_volume)
+        self._max_volume = max_volume
+        if cycle_number is not None:
+            block_sound = block_sound[:int((cycle_number + 1) * self._bsp.cycle_length) + 1]
+        if self._erasures is not None:
+            self._erasures = []
+        if self._margins is not None:
+            self._margins = []
+        return self._wutils.demod_to_bits(block_sound, self._bsp.freq, self._first_cycle_fraction, max_volume, self._erasures, self._timing, self._detector, self._margins)
     
-    def _get_block_bits(self, raw_bits:str):
+    def _get_block_bits(self, raw_bits:BitBuffer):
+        purged_bits, _ = self._purge_block_start(raw_bits)
+        return purged_bits[self._bsp.beginning_void_zero_number:self._bsp.beginning_void_zero_number + self._bsp.block_bits_number - self._bsp.beginning_ones_number - self._bsp.beginning_void_zero_number]
+
+    def _purge_block_start(self, raw_bits:BitBuffer):
+        # Checks the beginning ones of the block, removes them and sets where the remaining sound begins
         if raw_bits[:self._bsp.beginning_ones_number].find("1"*self._bsp.beginning_ones_threshold)<0: # Find in the first ${block_bits_number} bits if there are ${beginning_ones_threshold} continue "1"s then it's considered as the header.
             _logger.debug(f"Beginning bits: {raw_bits[:self._bsp.beginning_ones_number]}")
             raise ValueError("Cannot find the block data")
         purged_bits, starting_ones_count = BitsUtils.purge_beginning_ones(raw_bits)
-        self._remaining_sound_data_index = int(self._first_cycle_index + (self._bsp.cycle_length * (self._bsp.block_bits_number - self._bsp.beginning_ones_number + starting_ones_count)))
+        end_cycle = self._bsp.block_bits_number - self._bsp.beginning_ones_number + starting_ones_count
+        if self._timing is None:
+            self._remaining_sound_data_index = int(self._first_cycle_index + (self._bsp.cycle_length * end_cycle))
+        else:
+            end_position = self._first_cycle_index + self._timing.get_position(end_cycle)
+            self._remaining_sound_data_index = int(end_position)
+            self._remaining_fraction = end_position - self._remaining_sound_data_index
         _logger.debug(f"Starting ones: {starting_ones_count}, First cycle index: {self._first_cycle_index}, Remining index: {self._remaining_sound_data_index}")
-        return purged_bits[self._bsp.beginning_void_zero_number:self._bsp.beginning_void_zero_number + self._bsp.block_bits_number - self._bsp.beginning_ones_number - self._bsp.beginning_void_zero_number]
+        return purged_bits, starting_ones_count
     
     @property
     def remaining_sound_data(self):
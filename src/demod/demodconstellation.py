@@ -0,0 +1,173 @@
+import logging
+import numpy as np
+from ..common import BitBuffer
+from ..common.chunkfec import ChunkFec
+from ..common.constellation import Constellation
+from .waveutils import WaveUtils
+from .soundwindow import SampleWindow
+from .demodmeta import MetaData
+from .demodheader import Header, HeaderDataDemod
+
+_logger = logging.getLogger(__name__)
+
+class ConstellationDemod:
+    # Coherent demodulation of the sound of the ConstellationWaveProcessor (wave version 3).
+    # Each cycle is projected on the carrier, which gives a complex value proportional to its point.
+    # The ones of the header starter, then the start ones of each chunk, give the phase and the amplitude of the point 1.
+    # The cycles are not searched again, they follow each other from the header. As every cycle starts at the phase 0 of the carrier,
+    # the phase of the chunk start ones regarding to the header ones gives how far the chunk is from its expected position.
+    # Inside a chunk, the reference follows the decided points every TRACKING_CYCLE_NUMBER cycles. How much it turned along the chunk
+    # gives the drift of the cycles (the clock difference between the sender and the recorder), which corrects the cycle length of the next chunks.
+    WAVE_VERSION = 3
+    HEADER_STARTER_BITS_NUMBER = HeaderDataDemod.BEGINNING_ONES_NUMBER + HeaderDataDemod.BEGINNING_VOID_ZERO_NUMBER
+    HEADER_DATA_BITS_NUMBER = HeaderDataDemod.BLOCK_BITS_NUMBER - HEADER_STARTER_BITS_NUMBER
+    CHUNK_VOID_NUMBER = 3
+    CHUNK_START_ONES_NUMBER = 3
+    CHUNK_STARTER_BITS_NUMBER = 3+3+1
+    CHUNK_END_BITS_NUMBER = 3
+    REFERENCE_EDGE_CYCLE_NUMBER = 2 # cycles ignored at both sides of the header ones, they can be distorted
+    TRACKING_CYCLE_NUMBER = 64
+    MIN_REFERENCE_RATIO = 0.5 # minimum amplitude of the chunk start ones regarding to the header ones
+    MAX_TIMING_ERROR = 0.1 # samples, the chunk is demodulated again beyond it
+    RESYNC_CYCLE_NUMBER = 1024 # cycles before and after where a chunk is expected where it's searched when it's not there (a gap, dropped samples)
+
+    def __init__(self, sound_data:SampleWindow, wutils:WaveUtils, frame_rate:int, meta:MetaData) -> None:
+        self._sound_data = sound_data
+        self._wutils = wutils
+        self._freq = meta.frequency
+        self._frame_rate = frame_rate
+        self._cycle_length = frame_rate / meta.frequency
+        self._constellation = Constellation(meta.wave_option)
+        self._header_reference = None
+        self._first_cycle_index = None # of the header
+        self._cycle_count = 0 # cycles from the header to the end of the last demodulated block
+        self._timing_offset = 0.0 # samples between the nominal and the real position of the last chunk start ones
+        self._drift = 0.0 # samples the cycles move along a chunk
+        _logger.debug(f"Bits per cycle: {meta.wave_option}, Cycle length: {self._cycle_length}")
+
+    def _project(self, cycle_index:int, cycle_number:int, timing_offset:float=0.0, cycle_length:float|None=None)->np.ndarray:
+        # Complex value (I + jQ) of cycle_number cycles from the cycle_index-th one after the header start.
+        # They are timing_offset samples away from their nominal position, cycle_length is their length in the recording (the nominal one by default).
+        # The sender cuts the cycles at whole samples (see WaveProcessor._get_bit_ends), the same cuts are used here.
+        # Only the samples surely inside a cycle are used, I and Q are the least squares fit of a sine and a cosine on them
+        # (a plain projection when the cycle length is a whole number of samples)
+        scale = 1.0 if cycle_length is None else cycle_length / self._cycle_length
+        sent_starts = np.floor((cycle_index + np.arange(cycle_number)) * self._cycle_length)
+        start = self._first_cycle_index + timing_offset + sent_starts[0]
+        starts = np.floor(start + (sent_starts - sent_starts[0]) * scale + 0.5).astype(np.int64) # rounded, the recorded samples can be anywhere between 2 sent ones
+        width = int(self._cycle_length * min(scale, 1.0))
+        if starts[-1] + width > len(self._sound_data):
+            raise ValueError("Meet the end of sound")
+        block = np.asarray(self._sound_data[int(starts[0]):int(starts[-1]) + width], dtype=np.float64)
+        offsets = (starts - starts[0])[:, None] + np.arange(width)[None, :]
+        cycles = block[offsets]
+        sent_positions = sent_starts[0] + (offsets + starts[0] - start) / scale
+        phases = 2 * np.pi * sent_positions / self._cycle_length # the carrier starts at the phase 0 with the header
+        sines, cosines = np.sin(phases), np.cos(phases)
+        xs, xc = (cycles * sines).sum(axis=1), (cycles * cosines).sum(axis=1)
+        ss, cc, sc = (sines**2).sum(axis=1), (cosines**2).sum(axis=1), (sines * cosines).sum(axis=1)
+        determinants = ss * cc - sc**2
+        return ((cc * xs - sc * xc) + 1j * (ss * xc - sc * xs)) / determinants
+
+    def _demap(self, cycles:np.ndarray, reference:complex):
+        # Decides the points block by block, the reference is corrected by the average error of the previous block.
+        # Returns the bits and the reference at the end of the cycles
+        bits = []
+        for start in range(0, len(cycles), self.TRACKING_CYCLE_NUMBER):
+            symbols = cycles[start:start + self.TRACKING_CYCLE_NUMBER] / reference
+            block_bits, points = self._constellation.demap(symbols)
+            bits.append(block_bits)
+            gain = np.vdot(points, symbols) / np.vdot(points, points)
+            if abs(gain) > 0: # a silent block (a gap of the recording) does not move the reference
+                reference *= gain
+        return (np.concatenate(bits) if bits else np.zeros(0, dtype=np.uint8)), reference
+
+    @property
+    def header_data(self)->Header:
+        ones_number = HeaderDataDemod.BEGINNING_ONES_NUMBER
+        first_cycle_index = self._wutils.find_preamble_index(self._sound_data, self._freq, ones_number, search_time_in_sec=ones_number * 4 / self._freq)
+        data_cycle_number = self._constellation.symbol_number(self.HEADER_DATA_BITS_NUMBER)
+        edge = self.REFERENCE_EDGE_CYCLE_NUMBER
+        self._first_cycle_index = first_cycle_index
+        cycles = self._project(0, self.HEADER_STARTER_BITS_NUMBER + data_cycle_number)
+        reference = cycles[edge:ones_number - edge].mean()
+        if not abs(reference) > 0:
+            raise ValueError("Cannot find the header")
+        # The header ones are sent at the phase 0, their phase gives the fraction of cycle the 1st cycle index is off
+        self._first_cycle_index = max(first_cycle_index + self._get_timing_error(reference, 1.0), 0.0)
+        cycles = self._project(0, self.HEADER_STARTER_BITS_NUMBER + data_cycle_number)
+        self._header_reference = cycles[edge:ones_number - edge].mean()
+        bits, _ = self._demap(cycles[self.HEADER_STARTER_BITS_NUMBER:], self._header_reference)
+        self._cycle_count = len(cycles)
+        _logger.debug(f"Header first cycle index: {self._first_cycle_index}, Reference: {self._header_reference}")
+        return Header.from_bits(BitBuffer.from_array(bits[:self.HEADER_DATA_BITS_NUMBER]))
+
+    def _get_timing_error(self, reference:complex, start_reference:complex|None=None)->float:
+        # Samples between the real and the supposed position of cycles, from the phase of their reference regarding to the start one
+        start_reference = self._header_reference if start_reference is None else start_reference
+        return -float(np.angle(reference / start_reference)) / (2 * np.pi) * self._cycle_length
+
+    def _demod_chunk(self, cycle_index:int, timing_offset:float, drift:float, data_cycle_number:int):
+        # Returns the reference given by the chunk start ones, the bits and how much the cycles slipped regarding to the drift along the chunk
+        start_length = self.CHUNK_STARTER_BITS_NUMBER - self.CHUNK_START_ONES_NUMBER # start ones and void
+        cycle_length = self._cycle_length + drift / (self.CHUNK_STARTER_BITS_NUMBER + data_cycle_number + self.CHUNK_END_BITS_NUMBER)
+        cycles = self._project(cycle_index, start_length + data_cycle_number, timing_offset, cycle_length)
+        reference = cycles[:self.CHUNK_START_ONES_NUMBER].mean()
+        if not abs(reference) >= self.MIN_REFERENCE_RATIO * abs(self._header_reference):
+            raise ValueError("Cannot find the start of the chunk")
+        bits, end_reference = self._demap(cycles[start_length:], reference)
+        return reference, bits, self._get_timing_error(end_reference, reference)
+
+    def iter_file_data(self, header:Header):
+        # Yields the file bits chunk by chunk, must be called after header_data.
+        # With the chunk CRC, a chunk which cannot be demodulated is yielded as None
+        remaining_file_length = header.file_length
+        fec = header.chunk_fec
+        data_cycle_number = self._constellation.symbol_number(fec.frame_bits_number)
+        for cn in range(header.chunk_number):
+            timing_offset, drift = self._timing_offset, self._drift
+            try:
+                chunk_data = fec.decode(self._demod_next_chunk(cn, data_cycle_number)[:fec.frame_bits_number])
+            except ValueError as e:
+                chunk_data = self._search_chunk(cn, data_cycle_number, fec, timing_offset, drift)
+                if chunk_data is None:
+                    if not fec.crc:
+                        raise
+                    _logger.warning(f"Chunk {cn} is lost: {e}")
+            self._cycle_count += self.CHUNK_STARTER_BITS_NUMBER + data_cycle_number + self.CHUNK_END_BITS_NUMBER
+            if chunk_data is not None and remaining_file_length < header.chunk_size:
+                chunk_data = chunk_data[:remaining_file_length]
+            yield chunk_data
+            remaining_file_length = remaining_file_length - header.chunk_size
+
+    def _search_chunk(self, cn:int, data_cycle_number:int, fec:ChunkFec, timing_offset:float, drift:float)->BitBuffer|None:
+        # Searches the chunk among the cycles which follow the silence of its voids, at most RESYNC_CYCLE_NUMBER cycles away from where it's
+        # expected with the timing of the previous chunk, the nearest first: the phase of the start ones only corrects less than a cycle.
+        # A candidate is kept when its data is right (its CRC or its FEC, when the chunks have any), the timing is restored when none is.
+        # None when it cannot be found
+        expected = self._first_cycle_index + timing_offset + drift + np.floor((self._cycle_count + self.CHUNK_VOID_NUMBER) * self._cycle_length)
+        for start in WaveUtils.find_block_starts(self._sound_data, expected, int(self.RESYNC_CYCLE_NUMBER * self._cycle_length),
+                                                 (self.CHUNK_VOID_NUMBER - 1) * self._cycle_length):
+            self._timing_offset, self._drift = timing_offset + start - expected, drift
+            try:
+                chunk_data = fec.decode(self._demod_next_chunk(cn, data_cycle_number)[:fec.frame_bits_number])
+                _logger.debug(f"Chunk {cn} found {start - expected} samples away from where expected")
+                return chunk_data
+            except ValueError as e:
+                _logger.debug(f"No chunk at {start}: {e}")
+        self._timing_offset, self._drift = timing_offset, drift
+        return None
+
+    def _demod_next_chunk(self, cn:int, data_cycle_number:int)->BitBuffer:
+        # Bits of the chunk following the last demodulated block, the timing is corrected by its start ones and its drift
+        cycle_index = self._cycle_count + self.CHUNK_VOID_NUMBER
+        timing_offset = self._timing_offset + self._drift
+        reference, bits, slip = self._demod_chunk(cycle_index, timing_offset, self._drift, data_cycle_number)
+        timing_error = self._get_timing_error(reference)
+        if abs(timing_error) >= self.MAX_TIMING_ERROR or abs(slip) >= self.MAX_TIMING_ERROR:
+            _logger.debug(f"Chunk {cn} moved by {timing_error} samples, slipped by {slip} samples")
+            timing_offset += timing_error
+            self._drift += slip
+            reference, bits, _ = self._demod_chunk(cycle_index, timing_offset, self._drift, data_cycle_number)
+        self._timing_offset = timing_offset
+        return BitBuffer.from_array(bits)
@@ -1,35 +1,252 @@
+import logging
+import numpy as np
 from .demodclass import BlockDataDemod
 from .soundprofile import BlockSoundProfile
 from .waveutils import WaveUtils
 from .demodmeta import MetaData
 from .demodheader import Header
+from .timingrecovery import TimingRecovery
+from ..common import BitBuffer
+from ..common.metrics import Metrics
+
+_logger = logging.getLogger(__name__)
 
 
 class FileDataDemod(BlockDataDemod):
     BEGINNING_ONES_NUMBER = 3
     BEGINNING_ONES_THRESHOLD = 1
     BEGINNING_VOID_ZERO_NUMBER = 1
+    SCAN_CYCLE_NUMBER = 16 # number of cycles demodulated at the beginning of a chunk to locate the next one
+    CHUNK_VOID_NUMBER = 3 # void cycles at both ends of a chunk
+    WEAK_MARGIN = 0.1 # cycles closer than this to a threshold are counted as weak in the chunk stats
+    RESYNC_CYCLE_NUMBER = 1024 # cycles before and after where a chunk is expected where it's searched when it's not there (a gap, dropped samples)
+    LOUD_LEVEL = 0.5 # fraction of the max volume of the chunks over which a sample belongs to a "1" cycle, to search a chunk
 
-    def __init__(self, bsd:BlockSoundProfile, wutils:WaveUtils, meta:MetaData, header:Header) -> None:
+    def __init__(self, bsd:BlockSoundProfile, wutils:WaveUtils, meta:MetaData, header:Header, metrics:Metrics|None=None) -> None:
         super().__init__(bsd, wutils)
+        self._metrics = metrics if metrics is not None else Metrics() # gets a "chunk" event with the chunk_stats of each chunk
+        self._margins = []
+        self._chunk_error:str|None = None # why the last chunk is lost
         self._header = header
         self._meta = meta
+        self._fec = header.chunk_fec
+        self._timing = TimingRecovery(bsd.cycle_length) # continues from chunk to chunk
+        self._previous_chunk_start:float|None = None # of the last chunk located
+        self._start_cycle_length = self._timing.cycle_length # before the last chunk, its cycles can be noise when it's lost
+        self._chunk_max_volume:float|None = None # of the last chunk demodulated, to search the next ones
+        if self._fec.parity_number or self._fec.crc:
+            self._erasures = [] # the unreadable cycles are corrected by the FEC or make the chunk fail its CRC
 
-    def demod_file_data(self)->str:
-        file_bits = ""
-        remaining_file_length = self._header.file_length
-        for cn in range(self._header.chunk_number):
-            raw_bits = self._get_raw_bit()
-            chunk_data = self._get_block_bits(raw_bits)
-            self._bsp.sound_data = self.remaining_sound_data
-            
-            if remaining_file_length >= self._header.chunk_size:
-                file_bits = f"{file_bits}{chunk_data}"
-                remaining_file_length = remaining_file_length - self._header.chunk_size
-            else:
-                file_bits = f"{file_bits}{chunk_data[:remaining_file_length]}"
-                remaining_file_length = 0
-                break
+    def demod_file_data(self)->BitBuffer:
+        file_bits = BitBuffer()
+        for chunk_data in self.iter_file_data():
+            file_bits.append(chunk_data)
         return file_bits
-    
-    
\ No newline at end of file
+
+    def iter_file_data(self):
+        # Yields the file bits chunk by chunk, the sound window is advanced after each chunk.
+        # With the chunk CRC, a chunk which cannot be demodulated is yielded as None
+        for cn in range(self._header.chunk_number):
+            self._start_chunk()
+            expected = self._get_expected_start(cn)
+            try:
+                chunk_data = self._demod_chunk(cn, expected)
+                self._chunk_max_volume = self._max_volume
+            except ValueError as e:
+                if not self._fec.crc:
+                    raise
+                _logger.warning(f"Chunk {cn} is lost: {e}")
+                chunk_data = None
+                self._chunk_error = str(e)
+                self._skip_block(expected)
+            stats = self.chunk_stats
+            self._metrics.count("chunk", samples=stats["samples"])
+            self._metrics.event("chunk", index=cn * self._meta.channel_number + self._meta.channel_index, **stats)
+            self._next_chunk()
+            yield None if chunk_data is None else chunk_data[:self.chunk_bits_number(cn)]
+
+    def _start_chunk(self):
+        self._first_cycle_index = None
+        self._remaining_sound_data_index = None
+        self._max_volume = None
+        self._margins = []
+        self._chunk_error = None
+        self._start_cycle_length = self._timing.cycle_length
+
+    @property
+    def chunk_stats(self)->dict:
+        # Measures of the last chunk: the sample index of its 1st cycle from the beginning of the recording, its samples, its max volume,
+        # how close its cycles came to the thresholds (the smallest margin, see WaveUtils.demod_to_bits), its weak cycles and its erasures
+        margins = np.concatenate(self._margins) if self._margins else np.zeros(0)
+        located = self._first_cycle_index is not None
+        return {"start": int(self._bsp.sound_data.offset + self._first_cycle_index) if located else None,
+                "samples": int(self._remaining_sound_data_index - self._first_cycle_index) if located and self._remaining_sound_data_index is not None else 0,
+                "max_volume": None if self._max_volume is None else float(self._max_volume),
+                "cycles": len(margins),
+                "min_margin": float(margins.min()) if len(margins) and np.isfinite(margins.min()) else None,
+                "weak_cycles": int(np.count_nonzero(margins < self.WEAK_MARGIN)),
+                "erasures": len(self._erasures) if self._erasures is not None else int(np.count_nonzero(margins < 0)),
+                "error": self._chunk_error}
+
+    def _get_void_number(self, cn:int)->int:
+        # Void cycles before the beginning ones of a chunk, the header is not followed by a void
+        return self.CHUNK_VOID_NUMBER if cn == 0 else self.CHUNK_VOID_NUMBER * 2
+
+    def _get_expected_start(self, cn:int)->float:
+        # Where the cycles tracked up to the end of the previous block lead, after the voids
+        return self._remaining_fraction + self._timing.cycle_length * self._get_void_number(cn)
+
+    def _demod_chunk(self, cn:int, expected:float)->BitBuffer:
+        # The chunk is demodulated where it's expected. It's searched only when it's not there or it's wrong (a lost chunk, a gap in the recording)
+        try:
+            raw_bits = self._get_raw_bit_at(expected)
+            if raw_bits.count_leading(1) == self._bsp.beginning_ones_number:
+                return self._get_chunk_data(raw_bits)
+            error = ValueError("Cannot find the block data")
+        except ValueError as e:
+            error = e
+        _logger.debug(f"Chunk {cn} is not where expected ({error}), search it")
+        found = self._search_chunk(expected)
+        if found is None:
+            raise error
+        return found[1]
+
+    def _search_chunk(self, expected:float):
+        # Searches the chunk among the cycles which follow a silence of its beginning voids around where it's expected, the nearest first.
+        # A candidate is kept only when it starts with the beginning ones and the void zero of a chunk and its data is right (its CRC
+        # or its FEC, when the chunks have any), the 1st loud cycle after a gap being most often in the data of a chunk.
+        # Returns the raw bits and the data of the chunk, None when it cannot be found
+        for start in self._find_chunk_starts(expected):
+            self._timing.cycle_length = self._start_cycle_length
+            try:
+                if self._get_raw_bit_at(start, self.SCAN_CYCLE_NUMBER).count_leading(1) != self._bsp.beginning_ones_number:
+                    continue
+                self._timing.cycle_length = self._start_cycle_length
+                raw_bits = self._get_raw_bit_at(start)
+                if raw_bits.count_leading(1) == self._bsp.beginning_ones_number:
+                    chunk_data = self._get_chunk_data(raw_bits)
+                    _logger.debug(f"Chunk found {start - expected:.1f} samples away from where expected")
+                    return raw_bits, chunk_data
+            except ValueError as e:
+                _logger.debug(f"No chunk at {start:.1f}: {e}")
+        self._timing.cycle_length = self._start_cycle_length
+        return None
+
+    def _find_chunk_starts(self, expected:float)->list[float]:
+        # Positions of the cycles which follow the silent cycles of the beginning voids of a chunk (some of them can be dropped),
+        # at most RESYNC_CYCLE_NUMBER cycles away from expected, the nearest first.
+        # A cycle starts a quarter of a cycle before its 1st peak, as in WaveUtils.find_1st_cycle_index
+        cycle_length = self._timing.cycle_length
+        onsets = WaveUtils.find_block_starts(self._bsp.sound_data, expected, int(cycle_length * self.RESYNC_CYCLE_NUMBER),
+                                             (self.CHUNK_VOID_NUMBER - 1) * cycle_length, self._chunk_max_volume, self.LOUD_LEVEL)
+        starts = []
+        for onset in onsets:
+            cycles = np.asarray(self._bsp.sound_data[onset:onset + int(cycle_length * 2)], dtype=np.float64)
+            if len(cycles) and cycles.max() > 0:
+                first_peak = onset + int(np.flatnonzero(cycles >= 0.9 * cycles.max())[0])
+                starts.append(max(first_peak - cycle_length / 4, 0.0))
+        return starts
+
+    def _skip_block(self, first_cycle_position:float):
+        # Sets the remaining sound after a block which cannot be demodulated, from where it's expected and its nominal length:
+        # the cycles tracked in a damaged block, and its length, cannot be trusted
+        self._timing.cycle_length = self._start_cycle_length
+        self._first_cycle_index = int(first_cycle_position)
+        end_position = first_cycle_position + self._timing.cycle_length * self._bsp.block_bits_number
+        self._remaining_sound_data_index = int(end_position)
+        self._remaining_fraction = end_position - self._remaining_sound_data_index
+
+    def _next_chunk(self):
+        # Moves the sound window to the remaining sound. It starts RESYNC_CYCLE_NUMBER cycles before the end of the block,
+        # so that the next chunk can be searched there when samples were dropped from the recording (the end of a block
+        # which is only scanned or lost is not measured)
+        margin = min(int(self._timing.cycle_length * self.RESYNC_CYCLE_NUMBER), self._remaining_sound_data_index - self._first_cycle_index)
+        self._remaining_sound_data_index -= margin
+        self._remaining_fraction += margin
+        self._bsp.sound_data = self.remaining_sound_data
+
+    def chunk_bits_number(self, chunk_index:int)->int:
+        # Number of file bits carried by a chunk, the last one is completed with zeros
+        return max(min(self._header.chunk_size, self._header.file_length - chunk_index * self._header.chunk_size), 0)
+
+    def locate_chunks(self)->list[int]:
+        # Fast scan giving the sample index of the 1st cycle of every chunk (from the beginning of the recording).
+        # Only the beginning of each chunk is demodulated, which is enough to know where the next chunk starts
+        # (the first chunk, and the one after a lost chunk, are demodulated whole to track the length of the cycles).
+        # With the chunk CRC, the position of a chunk which cannot be found is None, the next one is expected after its nominal length.
+        # The distance between two chunks gives the length of the recorded cycles, the chunks are demodulated from it
+        positions = []
+        chunk_cycle_number = self._bsp.block_bits_number + self.CHUNK_VOID_NUMBER * 2 # from the 1st cycle of a chunk to the next one
+        for cn in range(self._header.chunk_number):
+            self._start_chunk()
+            expected = self._get_expected_start(cn)
+            try:
+                raw_bits = self._scan_chunk(cn, expected)
+                _, starting_ones_count = self._purge_block_start(raw_bits)
+                self._chunk_max_volume = self._max_volume
+                positions.append(self._bsp.sound_data.offset + self._first_cycle_index)
+                # a missed "1" is counted back
+                chunk_start = positions[-1] + self._timing.get_position(0) - (self._bsp.beginning_ones_number - starting_ones_count) * self._timing.cycle_length
+                self._measure_cycle_length(chunk_start, chunk_cycle_number)
+            except ValueError as e:
+                if not self._fec.crc:
+                    raise
+                _logger.warning(f"Cannot locate the chunk {cn}: {e}")
+                positions.append(None)
+                self._previous_chunk_start = None
+                self._skip_block(expected)
+            self._next_chunk()
+        self._bsp.rate_ratio = self._timing.cycle_length / (self._bsp.frame_rate / self._bsp.freq)
+        return positions
+
+    def _scan_chunk(self, cn:int, expected:float)->BitBuffer:
+        # Demodulates the beginning of the chunk where the previous one leads, as _demod_chunk. Without the distance from a previous
+        # chunk, the whole chunk is demodulated. A chunk which is not there is searched around, and checked whole (see _search_chunk)
+        cycle_number = self.SCAN_CYCLE_NUMBER if self._previous_chunk_start is not None else None
+        try:
+            raw_bits = self._get_raw_bit_at(expected, cycle_number)
+            if raw_bits.count_leading(1) == self._bsp.beginning_ones_number:
+                return raw_bits
+            error = ValueError("Cannot find the block data")
+        except ValueError as e:
+            error = e
+        _logger.debug(f"Chunk {cn} is not where expected ({error}), search it")
+        found = self._search_chunk(expected)
+        if found is None:
+            raise error
+        return found[0]
+
+    def _measure_cycle_length(self, chunk_start:float, chunk_cycle_number:int):
+        # Sets the cycle length from the starts of the last two chunks, chunk_cycle_number cycles apart.
+        # A chunk found more than half a cycle away from where the previous one leads is not measured
+        if self._previous_chunk_start is not None:
+            distance = chunk_start - self._previous_chunk_start
+            if abs(distance - chunk_cycle_number * self._timing.cycle_length) < self._timing.cycle_length / 2:
+                self._timing.cycle_length = distance / chunk_cycle_number
+        self._previous_chunk_start = chunk_start
+
+    def demod_chunk_at(self, first_cycle_index:int|None)->BitBuffer|None:
+        # Demodulates the chunk starting at first_cycle_index of the sound data (as found by locate_chunks).
+        # With the chunk CRC, None when the chunk cannot be demodulated
+        self._start_chunk()
+        if first_cycle_index is None:
+            self._chunk_error = "The chunk cannot be located"
+            return None
+        try:
+            return self._get_chunk_data(self._get_raw_bit_at(first_cycle_index))
+        except ValueError as e:
+            if not self._fec.crc:
+                raise
+            _logger.warning(f"Chunk at {first_cycle_index} is lost: {e}")
+            self._chunk_error = str(e)
+            return None
+
+    def _get_chunk_data(self, raw_bits:BitBuffer)->BitBuffer:
+        frame_bits = self._get_block_bits(raw_bits)
+        if self._erasures is None:
+            return self._fec.decode(frame_bits)
+        data_start = raw_bits.count_leading(1) + self._bsp.beginning_void_zero_number
+        erasures = [i - data_start for i in self._erasures if 0 <= i - data_start < len(frame_bits)]
+        if erasures:
+            _logger.debug(f"{len(erasures)} unreadable cycles in the chunk")
+        return self._fec.decode(frame_bits, erasures)
@@ -3,6 +3,9 @@ from .demodclass import BlockDataDemod
 from .soundprofile import BlockSoundProfile
 from .waveutils import WaveUtils
 from .bitsutils import BitsUtils
+from .timingrecovery import TimingRecovery
+from ..common import BitBuffer
+from ..common.chunkfec import ChunkFec
 
 
 
@@ -13,6 +16,31 @@ class Header:
     chunk_number:int
     chunk_size:int
     file_length:int
+    codec_id:int = 0 # compression of the file content, 0 when sent as is
+    fec_parity_number:int = 0 # Reed-Solomon parity bytes per codeword of the chunk data, 0 without FEC
+    chunk_crc:int = 0 # 1 when the data of each chunk is followed by its CRC-32
+    content_type:int = 0 # 0 for a file, BatchManifest.CONTENT_TYPE for a batch of files, Delta.CONTENT_TYPE for a delta against a base file
+    base_checksum:int = 0 # Adler-32 of the base file of a delta
+
+    @classmethod
+    def from_bits(cls, header_bits:BitBuffer):
+        # header_bits starts after the beginning ones and void zeros of the header
+        version = BitsUtils.bits_to_int(header_bits[:32])
+        checksum = BitsUtils.bits_to_int(header_bits[32:32+32])
+        chunk_number = BitsUtils.bits_to_int(header_bits[32+32:32+32+32])
+        chunk_size = BitsUtils.bits_to_int(header_bits[32+32+32:32+32+32+32])
+        file_length = BitsUtils.bits_to_int(header_bits[32+32+32+32:32+32+32+32+64])
+        codec_id = BitsUtils.bits_to_int(header_bits[32+32+32+32+64:32+32+32+32+64+8])
+        fec_parity_number = BitsUtils.bits_to_int(header_bits[32+32+32+32+64+8:32+32+32+32+64+8+8])
+        chunk_crc = BitsUtils.bits_to_int(header_bits[32+32+32+32+64+8+8:32+32+32+32+64+8+8+8])
+        content_type = BitsUtils.bits_to_int(header_bits[32+32+32+32+64+8+8+8:32+32+32+32+64+8+8+8+8])
+        base_checksum = BitsUtils.bits_to_int(header_bits[32+32+32+32+64+8+8+8+8:32+32+32+32+64+8+8+8+8+32])
+        return cls(version, checksum, chunk_number, chunk_size, file_length, codec_id, fec_parity_number, chunk_crc, content_type, base_checksum)
+
+    @property
+    def chunk_fec(self)->ChunkFec:
+        # Error control of the chunk data, gives the bits sent per chunk
+        return ChunkFec(self.fec_parity_number, self.chunk_size, bool(self.chunk_crc))
 
 class HeaderDataDemod(BlockDataDemod):
     BLOCK_BITS_NUMBER=377
@@ -23,17 +51,18 @@ class HeaderDataDemod(BlockDataDemod):
     def __init__(self, bsd:BlockSoundProfile, wutils:WaveUtils) -> None:
         super().__init__(bsd, wutils)
         self._header_data = None
+        self._timing = TimingRecovery(bsd.cycle_length) # the drift of the clocks is first measured on the cycles of the header
         _ = self.header_data
 
+    @property
+    def rate_ratio(self)->float:
+        # Recorder frame rate over the sender one, as measured on the header
+        return self._timing.cycle_length / (self._bsp.frame_rate / self._bsp.freq)
+
     @property
     def header_data(self):
         if self._header_data is None:
             raw_bits = self._get_raw_bit()
             header_bits = self._get_block_bits(raw_bits)
-            version = BitsUtils.bits_to_int(header_bits[:32])
-            checksum = BitsUtils.bits_to_int(header_bits[32:32+32])
-            chunk_number = BitsUtils.bits_to_int(header_bits[32+32:32+32+32])
-            chunk_size = BitsUtils.bits_to_int(header_bits[32+32+32:32+32+32+32])
-            file_length = BitsUtils.bits_to_int(header_bits[32+32+32+32:32+32+32+32+64])
-            self._header_data = Header(version, checksum, chunk_number, chunk_size, file_length)
+            self._header_data = Header.from_bits(header_bits)
         return self._header_data
\ No newline at end of file
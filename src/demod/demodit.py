@@ -1,43 +1,233 @@
+import asyncio
+import json
 import logging
+import os
+import sys
+from dataclasses import asdict, replace
 from .waveutils import WaveUtils
-from .bytesutils import BytesUtils
 from .soundprofile import BlockSoundProfile
 from .readwave import WaveReader
+from .readlive import LiveReader
+from .soundwindow import SampleWindow
 from .demodmeta import MetaDataDemod, MetaData
-from .demodheader import HeaderDataDemod
+from .demodheader import HeaderDataDemod, Header
 from .demodfile import FileDataDemod
+from .demodpool import ChunkDemodPool
+from .writefile import FileWriter
+from .demodmulticarrier import MultiCarrierDemod
+from .demodconstellation import ConstellationDemod
+from .scantransmissions import TransmissionScanner, ScannedTransmission
+from .analyzesweep import SweepAnalyzer
+from ..common.sweep import CalibrationSweep
+from ..common.metrics import Metrics
 
 _logger = logging.getLogger(__name__)
 
 class DemodWorkflow:
     VERSION=1
+    _END = object() # end of the chunks of a channel, a lost chunk is None
+    LIVE_READ_SIZE = 64*1024 # bytes read at once from a live stream
+    SCAN_INDEX_NAME = "scan.json" # in the output directory of a scan, the transmissions found
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, streaming:bool=False, jobs:int=1, soft_detection:bool=False, metrics:Metrics|None=None) -> None:
+        self._streaming = streaming # assemble the file in a temporary file instead of in memory
+        self._jobs = jobs # number of processes demodulating the chunks
+        self._soft_detection = soft_detection # decide the cycles of the meta data and of the wave version 1 by their carrier level instead of their peaks
+        # stages: read, scan (the search of the transmissions of a recording), calibration (the analysis of a sweep), sync (preamble and block searches), meta, header, locate and chunk (the wait for the jobs with a pool), write, checksum, save.
+        # Each chunk of the wave version 1 gets a "chunk" event with its stats (see FileDataDemod.chunk_stats)
+        self.metrics = metrics if metrics is not None else Metrics()
 
-    def execute(self, wave_file_path:str, output_file_path:str, start_at:int):
-        reader = WaveReader(wave_file_path)
-        wutils = WaveUtils(reader)
-        
+    def execute(self, wave_file_path:str, output_file_path:str, start_at:float|None=None, merge_with:list[str]|None=None, base_file_path:str|None=None)->list[int]:
+        # start_at limits the search of the transmission to the first seconds, it's searched in the whole recording if None.
+        # merge_with are other recordings of the same transmission, the chunks lost in a recording are taken from the next ones.
+        # base_file_path is the file a delta transmission was made against, the output file is rebuilt from it.
+        # Returns the indexes of the chunks which could not be recovered (only with the chunk CRC, the demodulation fails otherwise)
+        writer = None
+        for recording_path in [wave_file_path] + list(merge_with or []):
+            with self._open_recording(recording_path) as reader: # the chunks are demodulated while they are added
+                header_data, chunks = self._demod_reader(reader, start_at)
+                if writer is None:
+                    writer = FileWriter(header_data, output_file_path, self._streaming, self.metrics, base_file_path)
+                elif not writer.matches(header_data):
+                    raise ValueError(f"{recording_path} is not a recording of the same transmission")
+                writer.add_chunks(chunks)
+            if not writer.missing_chunks:
+                break
+        return writer.save()
+
+    def execute_scan(self, wave_file_path:str, output_dir:str, base_file_path:str|None=None)->list[ScannedTransmission]:
+        # Demodulates every transmission of a long recording to output_dir, each to a file named after its rank and its offset in the
+        # recording (a directory for a batch). A transmission which cannot be demodulated is skipped with its error, the transmissions
+        # found are listed in the SCAN_INDEX_NAME file. base_file_path is the base file of the delta transmissions
+        with self._open_recording(wave_file_path) as reader:
+            return self._scan(reader, output_dir, base_file_path)
+
+    def _scan(self, reader:WaveReader, output_dir:str, base_file_path:str|None)->list[ScannedTransmission]:
+        os.makedirs(output_dir, exist_ok=True)
+        scanner = TransmissionScanner(reader)
+        transmissions:list[ScannedTransmission] = []
+        position = 0
+        while True:
+            with self.metrics.stage("scan"):
+                preamble_index = scanner.find_next(position)
+            if preamble_index is None:
+                break
+            position = scanner.get_next_start(preamble_index)
+            offset = preamble_index / reader.frame_rate
+            search_start = scanner.get_search_start(preamble_index)
+            try:
+                meta_data, remaining_sound_data = self._get_meta_data(reader, scanner.SEARCH_SEC, search_start)
+            except ValueError as e: # a burst of noise or a tone which is not a transmission
+                _logger.debug(f"No transmission at {offset:.3f}s: {e}")
+                continue
+            transmission = ScannedTransmission(preamble_index, offset, os.path.join(output_dir, f"{len(transmissions) + 1:03d}_at_{offset:.3f}s"))
+            _logger.info(f"Transmission at {offset:.3f}s")
+            try:
+                header_data, chunks = self._demod_transmission(reader, meta_data, remaining_sound_data, scanner.SEARCH_SEC, search_start)
+                writer = FileWriter(header_data, transmission.output_path, self._streaming, self.metrics, base_file_path)
+                writer.add_chunks(chunks)
+                transmission.missing_chunks = writer.save()
+            except ValueError as e:
+                _logger.warning(f"Cannot demodulate the transmission at {offset:.3f}s: {e}")
+                transmission.error = str(e)
+            transmissions.append(transmission)
+        with open(os.path.join(output_dir, self.SCAN_INDEX_NAME), 'w') as f:
+            json.dump([asdict(transmission) for transmission in transmissions], f, indent=1)
+        return transmissions
+
+    def execute_calibration(self, wave_file_path:str, report_file_path:str, start_at:float|None=None)->dict:
+        # Measures the link on a recording of the calibration sweep (SonifyWorkflow.execute_calibration), the report with the
+        # recommended frequency and chunk size (see SweepAnalyzer) is saved as JSON
+        with self._open_recording(wave_file_path) as reader:
+            meta_data, remaining_sound_data = self._demod_meta_data(reader, start_at)
+            if meta_data.wave_version != CalibrationSweep.WAVE_VERSION or meta_data.reader_version != CalibrationSweep.VERSION:
+                raise ValueError("The sound is not a calibration sweep.")
+            with self.metrics.stage("calibration"):
+                report = SweepAnalyzer(reader, WaveUtils(reader, self.metrics), self._soft_detection).analyze(meta_data.frequency, remaining_sound_data.offset)
+        with open(report_file_path, 'w') as f:
+            json.dump(report, f, indent=1)
+        return report
+
+    async def execute_live(self, input_path:str, output_file_path:str, frame_rate:int, sample_width:int=2, channel_number:int=1, base_file_path:str|None=None)->list[int]:
+        # Demodulates raw PCM frames (little endian, interleaved channels) read from a pipe ("-" for the standard input) as they arrive.
+        # The demodulation runs in a thread waiting for the samples it needs, each chunk is written as soon as it's demodulated.
+        # It ends with the last chunk of the transmission, or with the stream. Returns the indexes of the missing chunks as execute
+        reader = LiveReader(frame_rate, sample_width, channel_number)
+        demodulation = asyncio.create_task(asyncio.to_thread(self._demod_live, reader, output_file_path, base_file_path))
+        try:
+            await self._feed_live(reader, input_path, demodulation)
+        finally:
+            reader.close()
+        return await demodulation
+
+    def _demod_live(self, reader:LiveReader, output_file_path:str, base_file_path:str|None)->list[int]:
+        header_data, chunks = self._demod_reader(reader, None)
+        writer = FileWriter(header_data, output_file_path, streaming=True, metrics=self.metrics, base_file_path=base_file_path)
+        writer.add_chunks(chunks)
+        return writer.save()
+
+    async def _feed_live(self, reader:LiveReader, input_path:str, demodulation:asyncio.Task):
+        # Feeds the reader until the end of the stream or of the demodulation
+        pipe = sys.stdin.buffer if input_path == "-" else open(input_path, 'rb')
+        blocks = self._iter_live_blocks(pipe)
+        try:
+            while not demodulation.done():
+                read = asyncio.ensure_future(anext(blocks, b""))
+                await asyncio.wait((read, demodulation), return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    await asyncio.gather(read, return_exceptions=True) # lets the blocks iterator end before it's closed
+                    break
+                data = read.result()
+                if not data:
+                    _logger.info("End of the stream")
+                    break
+                reader.feed(data)
+        finally:
+            await blocks.aclose()
+            if pipe is not sys.stdin.buffer:
+                pipe.close()
+
+    async def _iter_live_blocks(self, pipe):
+        loop = asyncio.get_running_loop()
+        stream = asyncio.StreamReader()
+        try:
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream), pipe)
+        except ValueError: # a regular file, which cannot be watched by the event loop
+            while data := await asyncio.to_thread(pipe.read, self.LIVE_READ_SIZE):
+                yield data
+            return
+        try:
+            while data := await stream.read(self.LIVE_READ_SIZE):
+                yield data
+        finally:
+            transport.close()
+
+    def _open_recording(self, wave_file_path:str)->WaveReader:
+        with self.metrics.stage("read"):
+            reader = WaveReader(wave_file_path)
+        self.metrics.count("read", frames=reader.num_frames) # memory-mapped, the samples are read by the next stages
+        return reader
+
+    def _demod_reader(self, reader:WaveReader, start_at:float|None, start:int=0):
+        # Returns the header of the transmission and an iterator of its chunks, None for a lost one.
+        # The transmission is searched from the sample start, in the start_at seconds after it
+        meta_data, remaining_sound_data = self._get_meta_data(reader, start_at, start)
+        return self._demod_transmission(reader, meta_data, remaining_sound_data, start_at, start)
+
+    def _demod_transmission(self, reader:WaveReader, meta_data:MetaData, remaining_sound_data:SampleWindow, start_at:float|None, start:int=0):
+        # Same as _demod_reader once the meta data are demodulated
+        if meta_data.channel_number > 1:
+            header_data, chunks = self._get_channels_chunks(reader, meta_data, remaining_sound_data, start_at, start)
+        else:
+            channel = self._get_channel(reader, meta_data, remaining_sound_data)
+            header_data = channel.header
+            chunks = ChunkDemodPool(self._jobs, reader.path, self.metrics).iter_file_data([channel]) if self._use_pool(reader, [channel]) else channel.iter_file_data()
+        return header_data, self.metrics.iter_stage("chunk", chunks, lambda chunk_bits: {"bits": 0 if chunk_bits is None else len(chunk_bits), "lost": int(chunk_bits is None)})
+
+    def _get_meta_data(self, reader:WaveReader, start_at:float|None, start:int=0):
+        meta_data, remaining_sound_data = self._demod_meta_data(reader, start_at, start)
+        if not MetaData.compatible_check(meta_data):
+            raise ValueError("The sound is not compatible.")
+        return meta_data, remaining_sound_data
+
+    def _demod_meta_data(self, reader:WaveReader, start_at:float|None, start:int=0):
         meta_bsp = BlockSoundProfile(
-            sound_data = reader.data, 
-            freq = MetaDataDemod.META_FREQ, 
-            frame_rate = reader.frame_rate, 
+            sound_data = SampleWindow(reader, start),
+            freq = MetaDataDemod.META_FREQ,
+            frame_rate = reader.frame_rate,
             block_bits_number = MetaDataDemod.BLOCK_BITS_NUMBER,
-            search_sec = start_at, 
+            search_sec = start_at,
             beginning_ones_number = MetaDataDemod.BEGINNING_ONES_NUMBER,
-            beginning_ones_threshold = MetaDataDemod.BEGINNING_ONES_THRESHOLD, 
-            beginning_void_zero_number = MetaDataDemod.BEGINNING_VOID_ZERO_NUMBER
+            beginning_ones_threshold = MetaDataDemod.BEGINNING_ONES_THRESHOLD,
+            beginning_void_zero_number = MetaDataDemod.BEGINNING_VOID_ZERO_NUMBER,
+            preamble_sync = True,
+            soft_detection = self._soft_detection
         )
 
-        meta_mod = MetaDataDemod(meta_bsp, wutils)
-        meta_data = meta_mod.meta_data
-        remaining_sound_data = meta_mod.remaining_sound_data
+        with self.metrics.stage("meta", bits=MetaDataDemod.BLOCK_BITS_NUMBER):
+            meta_mod = MetaDataDemod(meta_bsp, WaveUtils(reader, self.metrics))
+            meta_data = meta_mod.meta_data
         _logger.debug("Meta data: %s", meta_data)
+        return meta_data, meta_mod.remaining_sound_data
+
+    def _get_channel(self, reader:WaveReader, meta_data:MetaData, remaining_sound_data:SampleWindow)->"ChannelDemod":
+        with self.metrics.stage("header", bits=HeaderDataDemod.BLOCK_BITS_NUMBER):
+            return self._demod_channel(reader, meta_data, remaining_sound_data)
+
+    def _demod_channel(self, reader:WaveReader, meta_data:MetaData, remaining_sound_data:SampleWindow)->"ChannelDemod":
+        wutils = WaveUtils(reader, self.metrics)
+        if meta_data.wave_version == MultiCarrierDemod.WAVE_VERSION:
+            mc_demod = MultiCarrierDemod(remaining_sound_data, reader.frame_rate, meta_data)
+            header_data = mc_demod.header_data
+            _logger.debug("Header data: %s", header_data)
+            return ChannelDemod(reader.channel, meta_data, header_data, mc_demod)
+        if meta_data.wave_version == ConstellationDemod.WAVE_VERSION:
+            const_demod = ConstellationDemod(remaining_sound_data, wutils, reader.frame_rate, meta_data)
+            header_data = const_demod.header_data
+            _logger.debug("Header data: %s", header_data)
+            return ChannelDemod(reader.channel, meta_data, header_data, const_demod)
 
-        if not MetaData.compatible_check(meta_data):
-            raise ValueError("The sound is not compatible.")
-        
         header_bsp = BlockSoundProfile(
             sound_data = remaining_sound_data,
             freq = meta_data.frequency,
@@ -46,7 +236,9 @@ class DemodWorkflow:
             search_sec = HeaderDataDemod.BEGINNING_ONES_NUMBER * 4 / meta_data.frequency,
             beginning_ones_number=HeaderDataDemod.BEGINNING_ONES_NUMBER,
             beginning_ones_threshold=HeaderDataDemod.BEGINNING_ONES_THRESHOLD,
-            beginning_void_zero_number=HeaderDataDemod.BEGINNING_VOID_ZERO_NUMBER
+            beginning_void_zero_number=HeaderDataDemod.BEGINNING_VOID_ZERO_NUMBER,
+            preamble_sync=True,
+            soft_detection=self._soft_detection
         )
 
         header_mod = HeaderDataDemod(header_bsp, wutils)
@@ -58,16 +250,67 @@ class DemodWorkflow:
             sound_data = remaining_sound_data,
             freq = meta_data.frequency,
             frame_rate = reader.frame_rate,
-            block_bits_number = FileDataDemod.BEGINNING_ONES_NUMBER + FileDataDemod.BEGINNING_VOID_ZERO_NUMBER + header_data.chunk_size,
+            block_bits_number = FileDataDemod.BEGINNING_ONES_NUMBER + FileDataDemod.BEGINNING_VOID_ZERO_NUMBER + header_data.chunk_fec.frame_bits_number,
             search_sec = FileDataDemod.BEGINNING_ONES_NUMBER * 4 / meta_data.frequency,
             beginning_ones_number=FileDataDemod.BEGINNING_ONES_NUMBER,
             beginning_ones_threshold=FileDataDemod.BEGINNING_ONES_THRESHOLD,
-            beginning_void_zero_number=FileDataDemod.BEGINNING_VOID_ZERO_NUMBER
+            beginning_void_zero_number=FileDataDemod.BEGINNING_VOID_ZERO_NUMBER,
+            rate_ratio=header_mod.rate_ratio,
+            soft_detection=self._soft_detection
         )
-        file_bits = FileDataDemod(chunk_bsp, wutils, meta_data, header_data).demod_file_data()
-        file_bytes = BytesUtils.bits_to_bytes(file_bits)
-        checksum = BytesUtils.checksum(file_bytes)
-        if checksum != header_data.checksum:
-            raise ValueError("Checksum does not match.")
-        BytesUtils.save_bytes_to_file(file_bytes, output_file_path)
-        
\ No newline at end of file
+        _logger.debug(f"Rate ratio: {header_mod.rate_ratio}")
+        return ChannelDemod(reader.channel, meta_data, header_data, FileDataDemod(chunk_bsp, wutils, meta_data, header_data, self.metrics), chunk_bsp)
+
+    def _get_channels_chunks(self, reader:WaveReader, meta_data:MetaData, remaining_sound_data:SampleWindow, start_at:float|None, start:int=0):
+        # The chunks are striped across the channels of the transmission, which can be recorded in any order.
+        # Each channel is demodulated on its own, the chunks are taken from the channels in turn
+        if reader.channel_number < meta_data.channel_number:
+            raise ValueError(f"The sound is sent on {meta_data.channel_number} channels, the recording has only {reader.channel_number}")
+        channels:dict[int, ChannelDemod] = {meta_data.channel_index: self._get_channel(reader, meta_data, remaining_sound_data)}
+        for recorded_channel in range(1, reader.channel_number):
+            if len(channels) == meta_data.channel_number:
+                break
+            channel_reader = reader.with_channel(recorded_channel)
+            channel_meta_data, channel_sound_data = self._get_meta_data(channel_reader, start_at, start)
+            if channel_meta_data.channel_number != meta_data.channel_number or channel_meta_data.channel_index in channels:
+                raise ValueError(f"Unexpected channel {channel_meta_data.channel_index} of {channel_meta_data.channel_number} on the recorded channel {recorded_channel}")
+            channels[channel_meta_data.channel_index] = self._get_channel(channel_reader, channel_meta_data, channel_sound_data)
+        if len(channels) != meta_data.channel_number:
+            raise ValueError(f"Cannot find the channels {sorted(set(range(meta_data.channel_number)) - set(channels))}")
+        channels = [channels[channel_index] for channel_index in range(meta_data.channel_number)]
+        _logger.debug(f"Recorded channels: {[channel.recorded_channel for channel in channels]}")
+
+        # The header of each channel counts its own chunks only
+        header_data = replace(channels[0].header, chunk_number=sum(channel.header.chunk_number for channel in channels),
+                              file_length=sum(channel.header.file_length for channel in channels))
+        if self._use_pool(reader, channels):
+            return header_data, ChunkDemodPool(self._jobs, reader.path, self.metrics).iter_file_data(channels)
+        return header_data, self._interleave([channel.iter_file_data() for channel in channels])
+
+    def _interleave(self, channels_chunks:list):
+        # Chunk i comes from the channel i % channel_number, until a channel has no more chunks
+        while True:
+            for chunks in channels_chunks:
+                chunk_bits = next(chunks, self._END)
+                if chunk_bits is self._END:
+                    return
+                yield chunk_bits
+
+    def _use_pool(self, reader:WaveReader, channels:list)->bool:
+        # Only the chunks of wave version 1 recorded in a file are demodulated in processes, the others are fast enough
+        return self._jobs > 1 and reader.path is not None and all(channel.chunk_bsp is not None for channel in channels)
+
+
+class ChannelDemod:
+    # The header of one channel of the transmission and what demodulates its chunks
+    def __init__(self, recorded_channel:int, meta:MetaData, header:Header, chunk_demod, chunk_bsp:BlockSoundProfile|None=None) -> None:
+        self.recorded_channel = recorded_channel
+        self.meta = meta
+        self.header = header
+        self.chunk_demod = chunk_demod # FileDataDemod for the wave version 1
+        self.chunk_bsp = chunk_bsp # only for the wave version 1
+
+    def iter_file_data(self):
+        if isinstance(self.chunk_demod, FileDataDemod):
+            return self.chunk_demod.iter_file_data()
+        return self.chunk_demod.iter_file_data(self.header)
@@ -15,13 +15,34 @@ class MetaData:
     bitp_version:int
     wave_version:int
 
+    @property
+    def wave_option(self)->int:
+        # Wave version specific parameter, in the last reserved byte
+        return self.reserved & 0xFF
+
+    @property
+    def channel_index(self)->int:
+        # Channel of the transmission carrying these meta data
+        return (self.reserved >> 8) & 0xFF
+
+    @property
+    def channel_number(self)->int:
+        # Number of channels the chunks are striped across
+        return ((self.reserved >> 16) & 0xFF) + 1
+
     @classmethod
     def compatible_check(cls, meta)->bool:
-        if meta.reader_version != 1:
+        if meta.reader_version not in (1, 2, 3, 4): # 2 when the content is compressed, 3 for a batch of files, 4 for a delta
+            return False
+        if meta.bitp_version not in (1, 2): # 2 when the chunk data is framed with a FEC or a CRC
+            return False
+        if meta.channel_index >= meta.channel_number:
+            return False
+        if meta.wave_version not in (1, 2, 3):
             return False
-        if meta.bitp_version != 1:
+        if meta.wave_version == 2 and meta.wave_option < 2: # number of subcarriers
             return False
-        if meta.wave_version != 1:
+        if meta.wave_version == 3 and not 2 <= meta.wave_option <= 4: # bits per cycle
             return False
         return True
 
@@ -0,0 +1,119 @@
+import logging
+import math
+import numpy as np
+from ..common import BitBuffer
+from ..common.chunkfec import ChunkFec
+from .soundwindow import SampleWindow
+from .waveutils import WaveUtils
+from .demodmeta import MetaData
+from .demodheader import Header, HeaderDataDemod
+
+_logger = logging.getLogger(__name__)
+
+class MultiCarrierDemod:
+    # Demodulates the sound of the MultiCarrierWaveProcessor (wave version 2), one FFT per symbol.
+    # Each block (the header and every chunk) starts with 1 silent symbol and REFERENCE_SYMBOL_NUMBER symbols with all subcarriers on.
+    # The reference symbols give the start of the block and the level of each subcarrier, a bit is "1" when its subcarrier is above half of its level.
+    WAVE_VERSION = 2
+    REFERENCE_SYMBOL_NUMBER = 2
+    ONSET_THRESHOLD = 0.3 # fraction of the max volume from which the reference symbols are considered started
+    HEADER_BITS_NUMBER = HeaderDataDemod.BLOCK_BITS_NUMBER
+    CHUNK_DATA_START = 3+3+1 # void, start and void bits before the chunk data
+    CHUNK_FRAME_BITS_NUMBER = CHUNK_DATA_START+3 # and the void bits after
+    RESYNC_SYMBOL_NUMBER = 1024 # symbols before and after where a chunk is expected where it's searched when it's not there (a gap, dropped samples)
+
+    def __init__(self, sound_data:SampleWindow, frame_rate:int, meta:MetaData) -> None:
+        self._sound_data = sound_data
+        self._meta = meta
+        self._spacing = meta.frequency
+        self._carrier_number = meta.wave_option
+        if frame_rate % self._spacing:
+            raise ValueError(f"The frame rate of the recording ({frame_rate}) must be a multiple of the subcarrier spacing ({self._spacing})")
+        self._symbol_length = frame_rate // self._spacing
+        self._prefix_length = self._symbol_length // 4
+        if self._carrier_number >= self._symbol_length // 2:
+            raise ValueError(f"The frame rate of the recording ({frame_rate}) is too low for {self._carrier_number} subcarriers")
+        self._position = 0 # where the next block (its silent symbol) is expected
+        _logger.debug(f"Subcarriers: {self._carrier_number} x {self._spacing}Hz, Symbol length: {self._symbol_length}")
+
+    @property
+    def _full_symbol_length(self)->int:
+        return self._prefix_length + self._symbol_length
+
+    def _locate_block(self)->int:
+        # Index of the 1st reference symbol (start of its cyclic prefix), searched from the middle of the silent symbol
+        search_start = self._position + self._full_symbol_length // 2
+        search_sound = np.abs(np.asarray(self._sound_data[search_start:search_start + (2 + self.REFERENCE_SYMBOL_NUMBER) * self._full_symbol_length], dtype=np.float64))
+        if not len(search_sound) or not search_sound.max() > 0:
+            raise ValueError("Cannot find the block data")
+        onsets = np.flatnonzero(search_sound >= self.ONSET_THRESHOLD * search_sound.max())
+        return search_start + int(onsets[0])
+
+    def _demod_block(self, bits_number:int, block_start:int|None=None)->BitBuffer:
+        # block_start is the index of the 1st reference symbol, located after the silent symbol by default
+        block_start = self._locate_block() if block_start is None else block_start
+        symbol_number = self.REFERENCE_SYMBOL_NUMBER + math.ceil(bits_number / self._carrier_number)
+        # The windows start in the middle of the cyclic prefixes, it tolerates an error of half a prefix on the block start
+        first_window = block_start + self._prefix_length // 2
+        block_sound = np.asarray(self._sound_data[first_window:first_window + symbol_number * self._full_symbol_length], dtype=np.float64)
+        if len(block_sound) < (symbol_number - 1) * self._full_symbol_length + self._symbol_length:
+            raise ValueError("Meet the end of sound")
+        window_starts = np.arange(symbol_number) * self._full_symbol_length
+        windows = block_sound[window_starts[:, None] + np.arange(self._symbol_length)[None, :]]
+        levels = np.abs(np.fft.rfft(windows, axis=1))[:, 1:self._carrier_number + 1] # bin k is the subcarrier k*spacing
+        reference = levels[:self.REFERENCE_SYMBOL_NUMBER].mean(axis=0)
+        bits = (levels[self.REFERENCE_SYMBOL_NUMBER:] > 0.5 * reference).ravel()[:bits_number]
+        self._position = block_start + symbol_number * self._full_symbol_length
+        _logger.debug(f"Block start: {self._sound_data.offset + block_start}, Symbols: {symbol_number}, Weakest subcarrier: {reference.min()}")
+        return BitBuffer.from_array(bits)
+
+    @property
+    def header_data(self)->Header:
+        header_bits = self._demod_block(self.HEADER_BITS_NUMBER)
+        starter_length = HeaderDataDemod.BEGINNING_ONES_NUMBER
+        if header_bits[:starter_length].count_leading(1) != starter_length:
+            raise ValueError("Cannot find the header")
+        return Header.from_bits(header_bits[starter_length + HeaderDataDemod.BEGINNING_VOID_ZERO_NUMBER:])
+
+    def iter_file_data(self, header:Header):
+        # Yields the file bits chunk by chunk, must be called after header_data.
+        # With the chunk CRC, a chunk which cannot be demodulated is yielded as None
+        remaining_file_length = header.file_length
+        fec = header.chunk_fec
+        bits_number = fec.frame_bits_number + self.CHUNK_FRAME_BITS_NUMBER
+        for cn in range(header.chunk_number):
+            position = self._position
+            try:
+                chunk_data = self._demod_chunk(cn, bits_number, fec)
+            except ValueError as e:
+                chunk_data = self._search_chunk(cn, position, bits_number, fec)
+                if chunk_data is None:
+                    if not fec.crc:
+                        raise
+                    _logger.warning(f"Chunk {cn} is lost: {e}")
+                    # skipped by its nominal length (silent symbol included), where a wrong block ended cannot be trusted
+                    self._position = position + (1 + self.REFERENCE_SYMBOL_NUMBER + math.ceil(bits_number / self._carrier_number)) * self._full_symbol_length
+            if chunk_data is not None and remaining_file_length < header.chunk_size:
+                chunk_data = chunk_data[:remaining_file_length]
+            yield chunk_data
+            remaining_file_length = remaining_file_length - header.chunk_size
+
+    def _demod_chunk(self, cn:int, bits_number:int, fec:ChunkFec, block_start:int|None=None)->BitBuffer:
+        chunk_bits = self._demod_block(bits_number, block_start)
+        if chunk_bits[3:6] != "111":
+            raise ValueError(f"Cannot find the start of the chunk {cn}")
+        return fec.decode(chunk_bits[self.CHUNK_DATA_START:self.CHUNK_DATA_START + fec.frame_bits_number])
+
+    def _search_chunk(self, cn:int, position:int, bits_number:int, fec:ChunkFec)->BitBuffer|None:
+        # Searches the chunk expected at position (its silent symbol) among the symbols which follow a silence, at most
+        # RESYNC_SYMBOL_NUMBER symbols away, the nearest first. A candidate is kept when its start bits and its data are right
+        # (its CRC or its FEC, when the chunks have any). None when it cannot be found
+        for block_start in WaveUtils.find_block_starts(self._sound_data, position + self._full_symbol_length, self.RESYNC_SYMBOL_NUMBER * self._full_symbol_length,
+                                                       self._full_symbol_length / 2, level=self.ONSET_THRESHOLD):
+            try:
+                chunk_data = self._demod_chunk(cn, bits_number, fec, block_start)
+                _logger.debug(f"Chunk {cn} found {block_start - position - self._full_symbol_length} samples away from where expected")
+                return chunk_data
+            except ValueError as e:
+                _logger.debug(f"No chunk at {block_start}: {e}")
+        return None
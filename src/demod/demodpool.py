@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+from multiprocessing.util import Finalize
+from dataclasses import replace
+from .readwave import WaveReader
+from .waveutils import WaveUtils
+from .soundwindow import SampleWindow
+from .demodfile import FileDataDemod
+from ..common.metrics import Metrics
+
+_logger = logging.getLogger(__name__)
+
+_worker_demods:dict[int, FileDataDemod] = {}
+_worker_reader:WaveReader|None = None
+
+def _init_worker(wave_file_path:str, channels:list):
+    # Each worker memory-maps the recording once, the samples are shared through the page cache instead of being copied.
+    # The map is closed when the worker exits
+    global _worker_reader
+    _worker_reader = WaveReader(wave_file_path)
+    Finalize(None, _close_worker, exitpriority=10)
+    for recorded_channel, chunk_bsp, meta, header in channels:
+        reader = _worker_reader.with_channel(recorded_channel)
+        chunk_bsp.sound_data = SampleWindow(reader)
+        _worker_demods[recorded_channel] = FileDataDemod(chunk_bsp, WaveUtils(reader), meta, header)
+
+def _close_worker():
+    _worker_demods.clear()
+    if _worker_reader is not None:
+        _worker_reader.close()
+
+def _demod_chunk(task):
+    recorded_channel, first_cycle_index = task
+    chunk_demod = _worker_demods[recorded_channel]
+    chunk_data = chunk_demod.demod_chunk_at(first_cycle_index)
+    return chunk_data, chunk_demod.chunk_stats
+
+
+class ChunkDemodPool:
+    # Demodulates the chunks located by FileDataDemod.locate_chunks in a pool of processes.
+    # The chunks of all the channels of the transmission share the same pool
+    def __init__(self, jobs:int, wave_file_path:str, metrics:Metrics|None=None) -> None:
+        self._jobs = jobs
+        self._wave_file_path = wave_file_path
+        self._metrics = metrics if metrics is not None else Metrics() # gets a "chunk" event with the chunk stats of each chunk
+
+    def iter_file_data(self, channels:list):
+        # channels are the ChannelDemod of the transmission channels in order, the chunk i being on the channel i % len(channels).
+        # Yields the file bits chunk by chunk, in order (None for a lost chunk)
+        _logger.info("Locating chunks...")
+        with self._metrics.stage("locate"):
+            positions = [channel.chunk_demod.locate_chunks() for channel in channels]
+        tasks = []
+        for cn in range(sum(len(channel_positions) for channel_positions in positions)):
+            channel_index, channel_cn = cn % len(channels), cn // len(channels)
+            if channel_cn >= len(positions[channel_index]):
+                break
+            tasks.append((channels[channel_index].recorded_channel, positions[channel_index][channel_cn]))
+        _logger.info(f"Demodulating {len(tasks)} chunks with {self._jobs} processes...")
+        worker_channels = [(channel.recorded_channel, replace(channel.chunk_bsp, sound_data=None), channel.meta, channel.header) for channel in channels]
+        received = 0
+        with multiprocessing.Pool(self._jobs, initializer=_init_worker, initargs=(self._wave_file_path, worker_channels)) as pool:
+            try:
+                for cn, (chunk_data, stats) in enumerate(pool.imap(_demod_chunk, tasks, chunksize=max(1, len(tasks) // (self._jobs * 8)))):
+                    received += 1
+                    bits_number = channels[cn % len(channels)].chunk_demod.chunk_bits_number(cn // len(channels))
+                    if bits_number == 0:
+                        break
+                    self._metrics.count("chunk", samples=stats["samples"])
+                    self._metrics.event("chunk", index=cn, **stats)
+                    yield None if chunk_data is None else chunk_data[:bits_number]
+            finally:
+                if received == len(tasks): # also when the last chunks are not asked for
+                    pool.close()
+                    pool.join() # the workers exit on their own, closing their memory maps, instead of being terminated
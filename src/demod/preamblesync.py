@@ -0,0 +1,84 @@
+import logging
+import numpy as np
+from .soundwindow import SampleWindow
+
+_logger = logging.getLogger(__name__)
+
+class PreambleSync:
+    # Finds a preamble (a run of "1" cycles, i.e. a tone burst) by cross-correlation against a sine and a cosine template.
+    # The sound is decimated to a few samples per cycle and correlated block by block with FFTs, in one pass, until the preamble is found.
+    # The correlation is normalized by the energy of the sound under the template, so the match does not depend on the volume.
+    # The blocks too quiet for a preamble are not correlated.
+    # On a live stream a block is limited to the samples already received (but not below MIN_BLOCK_SIZE), the preamble is found as soon as it's received
+    DECIMATED_CYCLE_SAMPLES = 8
+    BLOCK_SIZE = 2**16 # decimated samples correlated at once
+    MIN_BLOCK_SIZE = 2**10
+    MATCH_THRESHOLD = 0.7
+
+    def __init__(self, frame_rate:int, freq:int, cycle_number:int, min_amplitude:float=0.0) -> None:
+        self._decimation = max(1, int(frame_rate / (freq * self.DECIMATED_CYCLE_SAMPLES)))
+        decimated_frame_rate = frame_rate / self._decimation
+        template_length = max(int(cycle_number * decimated_frame_rate / freq), 1)
+        phases = 2 * np.pi * freq * np.arange(template_length) / decimated_frame_rate
+        self._templates = np.stack((np.sin(phases), np.cos(phases)))
+        self._template_norms = np.sqrt(np.sum(self._templates**2, axis=1))
+        self._min_energy = (min_amplitude**2 / 2) * template_length # energy of a sine with the min amplitude under the template
+        self._template_spectrums:dict[int, np.ndarray] = {}
+        _logger.debug(f"Preamble sync: decimation {self._decimation}, template length {template_length}")
+
+    @property
+    def template_length(self)->int:
+        return self._templates.shape[1]
+
+    def find(self, sound_data, search_length:int|None=None)->int|None:
+        # Returns the index in sound_data where the preamble best matches the template, None if not found
+        search_length = len(sound_data) if search_length is None else min(search_length, len(sound_data))
+        template_length = self.template_length
+        overlap = 2 * template_length * self._decimation
+        block_start = 0
+        while block_start < search_length:
+            received = sound_data.received if isinstance(sound_data, SampleWindow) else len(sound_data)
+            step = min(max(received - block_start - overlap, self.MIN_BLOCK_SIZE * self._decimation), self.BLOCK_SIZE * self._decimation)
+            # Blocks overlap by 2 templates, so a match and its peak are always seen entirely in one block
+            block_end = min(block_start + step + overlap, search_length)
+            decimated = self._decimate(sound_data[block_start:block_end])
+            scores = self._get_scores(decimated)
+            matches = np.flatnonzero(scores >= self.MATCH_THRESHOLD)
+            if len(matches):
+                first_match = int(matches[0])
+                if first_match + template_length <= len(scores) or block_end >= search_length:
+                    peak = first_match + int(np.argmax(scores[first_match:first_match + template_length]))
+                    _logger.debug(f"Preamble found at {block_start + peak * self._decimation}, score: {scores[peak]}")
+                    return block_start + peak * self._decimation
+                block_start += first_match * self._decimation # the peak is in the next block
+                continue
+            block_start += step
+        return None
+
+    def _decimate(self, sound_data)->np.ndarray:
+        # Averages groups of samples, which also filters out the frequencies above the preamble one
+        sound_data = np.asarray(sound_data, dtype=np.float64)
+        length = len(sound_data) // self._decimation * self._decimation
+        return sound_data[:length].reshape(-1, self._decimation).mean(axis=1)
+
+    def _get_scores(self, decimated:np.ndarray)->np.ndarray:
+        # Normalized correlation (between 0 and 1) for every position of the template in the block
+        template_length = self.template_length
+        if len(decimated) < template_length:
+            return np.zeros(0)
+        valid_length = len(decimated) - template_length + 1
+        squares = np.concatenate(([0.0], np.cumsum(decimated**2)))
+        energies = squares[template_length:] - squares[:valid_length]
+        loud = energies >= max(self._min_energy, 1e-12)
+        if not loud.any(): # silence, no need to correlate
+            return np.zeros(valid_length)
+        fft_length = 1 << int(len(decimated) + template_length - 1).bit_length()
+        spectrum = np.fft.rfft(decimated, fft_length)
+        if fft_length not in self._template_spectrums:
+            self._template_spectrums[fft_length] = np.conj(np.fft.rfft(self._templates, fft_length, axis=1))
+        template_spectrums = self._template_spectrums[fft_length]
+        correlations = np.fft.irfft(spectrum * template_spectrums, fft_length, axis=1)[:, :valid_length]
+        correlation = np.sqrt(np.sum((correlations / self._template_norms[:, None])**2, axis=0))
+        scores = correlation / np.sqrt(np.maximum(energies, 1e-12))
+        scores[~loud] = 0.0
+        return scores
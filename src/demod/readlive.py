@@ -0,0 +1,107 @@
+import logging
+import threading
+import numpy as np
+from .readwave import WaveReader
+
+_logger = logging.getLogger(__name__)
+
+class LiveReader(WaveReader):
+    # Samples of raw PCM frames (little endian, interleaved channels) fed while they are received.
+    # Reading samples which are not received yet waits for them, the number of frames is unknown (LIVE_FRAMES) until the stream is closed.
+    # Only the last KEEP_SEC seconds before the latest read are kept, the demodulation never goes back further
+    LIVE_FRAMES = 2**62
+    KEEP_SEC = 10
+
+    def __init__(self, frame_rate:int, sample_width:int=2, channel_number:int=1, channel:int=0, stream:"_LiveStream|None"=None) -> None:
+        if not 0 <= channel < channel_number:
+            raise ValueError(f"Cannot read channel {channel}, the stream has {channel_number} channel(s)")
+        self._data = None
+        self._path = None
+        self._frame_rate = frame_rate
+        self._sample_width = sample_width
+        self._num_channels = channel_number
+        self._channel = channel
+        self._block_align = sample_width * channel_number
+        self._is_float = False
+        self._dtype = None if sample_width == 3 else self._get_dtype(self.WAVE_FORMAT_PCM)
+        self._stream = _LiveStream(self._block_align, frame_rate * self.KEEP_SEC) if stream is None else stream
+
+    def with_channel(self, channel:int)->"LiveReader":
+        return LiveReader(self._frame_rate, self._sample_width, self._num_channels, channel, self._stream)
+
+    def feed(self, data:bytes):
+        self._stream.feed(data)
+
+    def close(self):
+        # End of the stream, the readers waiting for samples get the ones received
+        self._stream.close()
+
+    def samples(self, start:int, stop:int)->np.ndarray:
+        frames = self._stream.frames(start, stop)
+        if self._sample_width == 3:
+            raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, self._num_channels, 3)[:, self._channel]
+        else:
+            raw = np.frombuffer(frames, dtype=self._dtype).reshape(-1, self._num_channels)[:, self._channel]
+        return self._to_signed(raw)
+
+    @property
+    def data(self)->np.ndarray:
+        raise ValueError("The samples of a live stream cannot be read at once")
+
+    @property
+    def num_frames(self)->int:
+        return self._stream.num_frames
+
+    @property
+    def received_frames(self)->int:
+        return self._stream.received_frames
+
+
+class _LiveStream:
+    # Frames received so far, shared by the readers of all the channels
+    def __init__(self, block_align:int, keep_frames:int) -> None:
+        self._block_align = block_align
+        self._keep_frames = keep_frames
+        self._buffer = bytearray()
+        self._buffer_start = 0 # frame index of the 1st frame of the buffer
+        self._latest_start = 0 # of the reads
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def _received_frames(self)->int:
+        return self._buffer_start + len(self._buffer) // self._block_align
+
+    @property
+    def num_frames(self)->int:
+        with self._condition:
+            return self._received_frames if self._closed else LiveReader.LIVE_FRAMES
+
+    @property
+    def received_frames(self)->int:
+        with self._condition:
+            return self._received_frames
+
+    def feed(self, data:bytes):
+        with self._condition:
+            self._buffer += data
+            discarded = self._latest_start - self._keep_frames - self._buffer_start
+            if discarded > self._keep_frames: # discarded by large blocks, not to move the buffer at every feed
+                del self._buffer[:discarded * self._block_align]
+                self._buffer_start += discarded
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def frames(self, start:int, stop:int)->bytes:
+        # Waits until the frames [start, stop) are received or the stream is closed
+        with self._condition:
+            if start < self._buffer_start:
+                raise ValueError(f"The frame {start} is not kept anymore, the first kept one is {self._buffer_start}")
+            self._latest_start = max(self._latest_start, start)
+            self._condition.wait_for(lambda: self._closed or self._received_frames >= stop)
+            stop = min(stop, self._received_frames)
+            return bytes(self._buffer[(start - self._buffer_start) * self._block_align:(max(start, stop) - self._buffer_start) * self._block_align])
@@ -1,46 +1,162 @@
 import logging
-import wave
+import mmap
+import struct
+import numpy as np
 
 _logger = logging.getLogger(__name__)
 
 class WaveReader:
     VERSION=1
+    WAVE_FORMAT_PCM = 0x0001
+    WAVE_FORMAT_IEEE_FLOAT = 0x0003
+    WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
-    def __init__(self, wave_file_path) -> None:
-        self._read(wave_file_path)
-
-    def _read(self, wave_file_path:str):
-        channel = 0
-        with wave.open(wave_file_path, 'rb') as wave_file:
-            self._num_channels = wave_file.getnchannels()
-            self._sample_width = wave_file.getsampwidth()
-            self._frame_rate = wave_file.getframerate()
-            self._num_frames = wave_file.getnframes()
-            raw_data = wave_file.readframes(self._num_frames)
-            wave_file.close()
-        self._data = []
-        for i in range(self._num_frames*self._num_channels):
-            if i % self._num_channels == channel:
-                start = i * self._sample_width
-                end = start + self._sample_width
-                self._data.append(int.from_bytes(raw_data[start:end], byteorder='little', signed=True))
-
-    @property
-    def data(self)->list[int]:
+    def __init__(self, wave_file_path, channel:int=0, mapping:mmap.mmap|None=None) -> None:
+        # mapping is the memory map of the file made by another reader, which closes it
+        self._data = None
+        self._raw = None
+        self._path = wave_file_path
+        self._owns_mapping = mapping is None
+        self._channel_readers:list[WaveReader] = []
+        self._read(wave_file_path, channel, mapping)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def with_channel(self, channel:int)->"WaveReader":
+        # Reader of another channel of the same recording, through the same memory map. It's closed with this reader
+        reader = WaveReader(self._path, channel, self._mmap)
+        self._channel_readers.append(reader)
+        return reader
+
+    def close(self):
+        # Releases the memory map, the file can then be replaced or deleted (on Windows, not while it's mapped).
+        # The samples read from the reader must not be used anymore
+        for reader in self._channel_readers:
+            reader.close()
+        self._channel_readers = []
+        self._data = None
+        self._raw = None
+        if self._owns_mapping and self._mmap is not None and not self._mmap.closed:
+            try:
+                self._mmap.close()
+            except BufferError: # samples are still referenced, the map is released with them
+                _logger.debug(f"{self._path} is still mapped by samples in use")
+
+    def _read(self, wave_file_path:str, channel:int, mapping:mmap.mmap|None):
+        # The data chunk is memory mapped, the samples of the channel are read through a strided view of it
+        if mapping is None:
+            with open(wave_file_path, 'rb') as wave_file:
+                mapping = mmap.mmap(wave_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mmap = mapping
+        try:
+            self._map_channel(channel)
+        except BaseException:
+            if self._owns_mapping:
+                mapping.close()
+            raise
+
+    def _map_channel(self, channel:int):
+        format_tag, data_offset, data_size = self._parse_chunks(self._mmap)
+        self._is_float = format_tag == self.WAVE_FORMAT_IEEE_FLOAT
+        if not 0 <= channel < self._num_channels:
+            raise ValueError(f"Cannot read channel {channel}, the wave file has {self._num_channels} channel(s)")
+        self._channel = channel
+        data_size = min(data_size, len(self._mmap) - data_offset) # recordings which were not closed properly can have a wrong size
+        self._num_frames = data_size // self._block_align
+        offset = data_offset + channel * self._sample_width
+        if self._sample_width == 3:
+            self._raw = np.ndarray((self._num_frames, 3), dtype=np.uint8, buffer=self._mmap, offset=offset, strides=(self._block_align, 1))
+        else:
+            self._raw = np.ndarray((self._num_frames,), dtype=self._get_dtype(format_tag), buffer=self._mmap, offset=offset, strides=(self._block_align,))
+        _logger.debug(f"Channels: {self._num_channels}, Sample width: {self._sample_width}, Frame rate: {self._frame_rate}, Frames: {self._num_frames}")
+
+    def _parse_chunks(self, content):
+        riff, _, wave = struct.unpack_from('<4sI4s', content, 0)
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError("Not a RIFF/WAVE file")
+        format_tag = None
+        position = 12
+        while position + 8 <= len(content):
+            chunk_id, chunk_size = struct.unpack_from('<4sI', content, position)
+            position += 8
+            if chunk_id == b'fmt ':
+                format_tag, self._num_channels, self._frame_rate, _, self._block_align, bits_per_sample = struct.unpack_from('<HHIIHH', content, position)
+                if format_tag == self.WAVE_FORMAT_EXTENSIBLE:
+                    format_tag, = struct.unpack_from('<H', content, position + 24) # the first 2 bytes of the sub format GUID
+                self._sample_width = (bits_per_sample + 7) // 8
+            elif chunk_id == b'data':
+                if format_tag is None:
+                    raise ValueError("The fmt chunk is missing before the data chunk")
+                return format_tag, position, chunk_size
+            position += chunk_size + chunk_size % 2 # chunks are word aligned
+        raise ValueError("Cannot find the data chunk")
+
+    def _get_dtype(self, format_tag:int):
+        if format_tag == self.WAVE_FORMAT_IEEE_FLOAT and self._sample_width in (4, 8):
+            return f'<f{self._sample_width}'
+        if format_tag != self.WAVE_FORMAT_PCM:
+            raise ValueError(f"Unsupported wave format: {format_tag}")
+        if self._sample_width == 1:
+            return np.uint8 # 8 bits samples are unsigned
+        if self._sample_width in (2, 4):
+            return f'<i{self._sample_width}'
+        raise ValueError(f"Unsupported sample width: {self._sample_width}")
+
+    def samples(self, start:int, stop:int)->np.ndarray:
+        # Signed samples of the channel in [start, stop). For 16/32 bits and float samples it's a view without copy
+        return self._to_signed(self._raw[start:stop])
+
+    def _to_signed(self, raw:np.ndarray)->np.ndarray:
+        # raw are the samples as stored, 3 bytes samples are given as an array of 3 columns
+        if self._sample_width == 1:
+            return raw.astype(np.int16) - 128
+        if self._sample_width == 3:
+            value = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+            return (value ^ 0x800000) - 0x800000
+        return raw
+
+    @property
+    def data(self)->np.ndarray:
+        if self._data is None:
+            self._data = self.samples(0, self._num_frames)
         return self._data
-    
+
+    @property
+    def full_scale(self)->float:
+        # Absolute value of the lowest possible sample
+        return 1.0 if self._is_float else float(2**(8*self._sample_width-1))
+
+    @property
+    def path(self)->str|None:
+        # Path of the recording, None when it's not a file
+        return self._path
+
     @property
     def frame_rate(self)->int:
         return self._frame_rate
-    
+
     @property
     def sample_width(self)->int:
         return self._sample_width
-    
+
+    @property
+    def channel(self)->int:
+        # The channel read by this reader
+        return self._channel
+
     @property
     def channel_number(self)->int:
         return self._num_channels
-    
+
     @property
     def num_frames(self)->int:
+        return self._num_frames
+
+    @property
+    def received_frames(self)->int:
+        # Frames which can be read without waiting, all of them in a file (see LiveReader)
         return self._num_frames
\ No newline at end of file
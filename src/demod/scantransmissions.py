@@ -0,0 +1,46 @@
+import logging
+from dataclasses import dataclass, field
+from .readwave import WaveReader
+from .soundwindow import SampleWindow
+from .preamblesync import PreambleSync
+from .waveutils import WaveUtils
+from .demodmeta import MetaDataDemod
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScannedTransmission:
+    start:int # sample index of the meta data preamble in the recording
+    offset:float # seconds from the beginning of the recording
+    output_path:str
+    missing_chunks:list[int] = field(default_factory=list)
+    error:str|None = None # why the transmission cannot be demodulated
+
+
+class TransmissionScanner:
+    # Finds the transmissions of a long recording by the preamble of their meta data (a burst of the 1 kHz meta frequency) without
+    # demodulating anything: the recording is decimated to a few samples per meta cycle and correlated block by block (see PreambleSync),
+    # the blocks whose energy is too low for a preamble are skipped before the correlation
+    SEARCH_MARGIN_SEC = 0.02 # before the preamble found, from where the meta data are demodulated
+    SEARCH_SEC = 0.1 # from the search start, where the 1st cycle of the meta data is searched precisely
+
+    def __init__(self, reader:WaveReader) -> None:
+        self._reader = reader
+        self._sync = PreambleSync(reader.frame_rate, MetaDataDemod.META_FREQ, MetaDataDemod.BEGINNING_ONES_NUMBER,
+                                  min_amplitude=WaveUtils.MIN_PREAMBLE_VOLUME * reader.full_scale)
+
+    def find_next(self, start:int)->int|None:
+        # Sample index of the next meta data preamble from start, None when there are no more
+        preamble_index = self._sync.find(SampleWindow(self._reader, start))
+        if preamble_index is None:
+            return None
+        _logger.debug(f"Meta data preamble at {(start + preamble_index) / self._reader.frame_rate:.3f}s")
+        return start + preamble_index
+
+    def get_search_start(self, preamble_index:int)->int:
+        return max(preamble_index - int(self.SEARCH_MARGIN_SEC * self._reader.frame_rate), 0)
+
+    def get_next_start(self, preamble_index:int)->int:
+        # Where the scan goes on after a transmission, past its meta data. The chunks of the transmission are at other frequencies
+        return preamble_index + int(MetaDataDemod.BLOCK_BITS_NUMBER * self._reader.frame_rate / MetaDataDemod.META_FREQ)
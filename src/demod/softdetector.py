@@ -0,0 +1,55 @@
+import logging
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+class SoftDetector:
+    # Detects the carrier in each cycle with a matched filter instead of the peaks of its samples: the amplitude of the carrier
+    # is the projection of the cycle on a sine and a cosine of the cycle length (a one-cycle Goertzel).
+    # The amplitudes are normalized by a running envelope (AGC), the mean amplitude of the "1"s over the neighbouring cycles,
+    # so that the level of a cycle is its confidence of being a "1": near 1 for a "1", near 0 for a "0".
+    # A "1" after "0"s, which comes in with less than its full peak at high frequencies, keeps most of its energy
+    ENVELOPE_CYCLE_NUMBER = 64 # cycles of a segment of the envelope, which is measured over a segment and its two neighbours
+    MIN_ENVELOPE = 0.5 # fraction of the max volume under which the envelope does not go, a long run of "0"s is not amplified
+    DECISION_LEVEL = 0.5 # level over which a cycle is a "1"
+    ERASURE_MARGIN = 0.1 # cycles whose level is closer than this to the decision level are unreliable
+
+    def get_levels(self, sound_data, bounds:np.ndarray, cycle_length:float, max_volume:float)->np.ndarray:
+        # Level of each cycle between the bounds (sample indexes in sound_data)
+        samples = np.asarray(sound_data[bounds[0]:bounds[-1]])
+        offset = float(np.mean(samples)) # DC offset
+        starts = bounds[:-1] - bounds[0]
+        lengths = np.diff(bounds)
+        # The phase of the sine and the cosine starts with each cycle, the amplitude does not depend on it
+        phases = 2 * np.pi / cycle_length * np.arange(lengths.max())
+        in_phase = np.zeros(len(starts))
+        quadrature = np.zeros(len(starts))
+        for k in range(len(phases)): # a gather per sample of the cycles, the cycles shorter than k+1 samples take 0
+            cycle_samples = np.where(k < lengths, samples[np.minimum(starts + k, len(samples) - 1)] - offset, 0.0)
+            in_phase += np.cos(phases[k]) * cycle_samples
+            quadrature += np.sin(phases[k]) * cycle_samples
+        amplitudes = 2 * np.hypot(in_phase, quadrature) / np.maximum(lengths, 1)
+        return amplitudes / self._get_envelope(amplitudes, max_volume)
+
+    def _get_envelope(self, amplitudes:np.ndarray, max_volume:float)->np.ndarray:
+        # Mean amplitude of the "1"s of a segment and its two neighbours, the "1"s being over half of their max amplitude
+        # (the max itself is biased by the noise)
+        starts = np.arange(0, len(amplitudes), self.ENVELOPE_CYCLE_NUMBER)
+        peaks = self._get_neighbourhood(np.maximum.reduceat(amplitudes, starts), np.maximum)
+        ones = amplitudes >= 0.5 * np.repeat(peaks, self.ENVELOPE_CYCLE_NUMBER)[:len(amplitudes)]
+        sums = self._get_neighbourhood(np.add.reduceat(amplitudes * ones, starts), np.add)
+        counts = self._get_neighbourhood(np.add.reduceat(ones, starts), np.add)
+        envelope = np.repeat(sums / np.maximum(counts, 1), self.ENVELOPE_CYCLE_NUMBER)[:len(amplitudes)]
+        return np.maximum(envelope, self.MIN_ENVELOPE * max_volume)
+
+    @staticmethod
+    def _get_neighbourhood(values:np.ndarray, ufunc)->np.ndarray:
+        # ufunc of each value with its two neighbours
+        padded = np.concatenate(([0], values, [0]))
+        return ufunc(ufunc(padded[:-2], padded[1:-1]), padded[2:])
+
+    def get_bits(self, levels:np.ndarray):
+        # Returns the "1"s and the indexes of the unreliable cycles
+        ones = levels >= self.DECISION_LEVEL
+        unreliable = np.flatnonzero(np.abs(levels - self.DECISION_LEVEL) < self.ERASURE_MARGIN)
+        return ones, unreliable
@@ -1,17 +1,21 @@
 from dataclasses import dataclass
+from .soundwindow import SampleWindow
 
 
 @dataclass
 class BlockSoundProfile:
-    sound_data:list[int]
+    sound_data:SampleWindow
     freq:int
     frame_rate:int
     block_bits_number:int # total number of bits of a block including beginning ones
-    search_sec:float # till how many sec to search the max volume of the sound block
+    search_sec:float|None # till how many sec to search the max volume of the sound block (None for the whole sound with preamble_sync)
     beginning_ones_number:int
     beginning_ones_threshold:int
     beginning_void_zero_number:int=1
+    preamble_sync:bool=False # locate the block by correlation with its beginning ones instead of the 1st loud enough sample
+    rate_ratio:float=1.0 # recorder frame rate over the sender one, the sound card clocks differ slightly
+    soft_detection:bool=False # decide the cycles by their carrier level (SoftDetector) instead of their peaks
 
     @property
     def cycle_length(self):
-        return self.frame_rate/self.freq
\ No newline at end of file
+        return self.frame_rate/self.freq*self.rate_ratio
\ No newline at end of file
@@ -0,0 +1,37 @@
+import numpy as np
+from .readwave import WaveReader
+
+
+class SampleWindow:
+    # The samples of a WaveReader from an offset to the end, read on demand.
+    # A bounded slice reads only the requested samples, an open slice ([start:]) returns a window advanced by start without reading anything.
+    def __init__(self, wreader:WaveReader, offset:int=0) -> None:
+        self._wreader = wreader
+        self._offset = min(offset, wreader.num_frames)
+
+    def __len__(self)->int:
+        return self._wreader.num_frames - self._offset
+
+    def __getitem__(self, key:slice):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Only contiguous slices are supported")
+        if key.stop is None:
+            return self.shifted(key.start or 0)
+        start, stop, _ = key.indices(len(self))
+        return self._wreader.samples(self._offset + start, self._offset + max(start, stop))
+
+    def shifted(self, sample_number:int)->"SampleWindow":
+        assert sample_number >= 0, f"Cannot move a sample window backward ({sample_number})"
+        return SampleWindow(self._wreader, self._offset + sample_number)
+
+    def __array__(self, dtype=None, copy=None)->np.ndarray:
+        return np.asarray(self[0:len(self)], dtype=dtype)
+
+    @property
+    def received(self)->int:
+        # Samples which can be read without waiting for a live stream
+        return max(self._wreader.received_frames - self._offset, 0)
+
+    @property
+    def offset(self)->int:
+        return self._offset
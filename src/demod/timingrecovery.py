@@ -0,0 +1,116 @@
+import logging
+import math
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+class TimingRecovery:
+    # Follows the cycles of the carrier when the recorder clock differs from the sender one: a recorded cycle lasts cycle_length
+    # samples, a little more or less than frame_rate/freq. The carrier is continuous from the header to the last chunk and each
+    # cycle starts at the phase 0, so the timing error of a cycle is its phase measured from where it's expected to start.
+    # The cycles are tracked block by block: the errors of the "1" cycles are averaged by segment and interpolated between the
+    # segments to correct the cycle positions of the block, their slope corrects the cycle length for the next block.
+    # A segment whose errors disagree (noise) or whose error jumps away from the previous segment one is not followed
+    SEGMENT_CYCLE_NUMBER = 64 # cycles whose timing errors are averaged together
+    BLOCK_CYCLE_NUMBER = 64*1024 # cycles tracked at once at most, the drift over a block must stay under half a cycle
+    MEASURE_STEP = 8 # one cycle out of MEASURE_STEP is measured
+    MIN_AMPLITUDE = 0.5 # fraction of the max volume of a "1" cycle to measure its timing
+    MAX_DRIFT = 1e-3 # relative difference of the clocks that can be tracked
+    MIN_SEGMENT_COHERENCE = 0.8 # length of the mean of the phases of a segment (1 when they all agree) under which it's noise
+    MAX_SEGMENT_JUMP = 0.25 # fraction of a cycle, the errors of neighbouring segments differ by much less with any drift up to MAX_DRIFT
+
+    def __init__(self, cycle_length:float) -> None:
+        self.cycle_length = cycle_length # of the recorded cycles, updated while tracking
+        self._bounds = np.zeros(1) # of the last tracked cycles
+
+    def track(self, sound_data, first_cycle_position:float, cycle_number:int, max_volume:float)->np.ndarray:
+        # Returns the cycle_number+1 boundaries (float sample positions in sound_data) of the cycles from first_cycle_position
+        bounds = np.empty(cycle_number + 1)
+        bounds[0] = first_cycle_position
+        # Blocks of the same size, a short last one would give a poor cycle length
+        block_number = max(math.ceil(cycle_number / self.BLOCK_CYCLE_NUMBER), 1)
+        block_cycle_number = max(math.ceil(cycle_number / block_number), 1)
+        for start in range(0, cycle_number, block_cycle_number):
+            number = min(block_cycle_number, cycle_number - start)
+            expected = bounds[start] + np.arange(number + 1) * self.cycle_length
+            corrections, slope = self._get_corrections(sound_data, expected, max_volume)
+            bounds[start:start + number + 1] = expected + corrections
+            if abs(slope) < self.cycle_length * self.MAX_DRIFT:
+                self.cycle_length += slope
+        self._bounds = bounds
+        return bounds
+
+    def get_position(self, cycle_index:int)->float:
+        # Position of the start of a cycle of the last tracked ones, extrapolated after them
+        if cycle_index < len(self._bounds):
+            return float(self._bounds[cycle_index])
+        return float(self._bounds[-1] + (cycle_index - len(self._bounds) + 1) * self.cycle_length)
+
+    def _get_corrections(self, sound_data, expected:np.ndarray, max_volume:float):
+        # Timing corrections of the expected boundaries and the error of the cycle length
+        cycle_indexes, errors = self._measure(sound_data, expected[:-1], max_volume)
+        if len(cycle_indexes) == 0:
+            return np.zeros(len(expected)), 0.0
+        centers, values = self._get_segment_errors(cycle_indexes, errors)
+        if len(centers) == 0:
+            return np.zeros(len(expected)), 0.0
+        corrections = np.interp(np.arange(len(expected)), centers, values)
+        slope = float(np.polyfit(centers, values, 1)[0]) if len(centers) > 1 else 0.0
+        _logger.debug(f"Timing: {len(cycle_indexes)} cycles measured, correction {corrections[0]:.3f} to {corrections[-1]:.3f}, cycle length error {slope:.2e}")
+        return corrections, slope
+
+    def _get_segment_errors(self, cycle_indexes:np.ndarray, errors:np.ndarray):
+        # Centers and errors of the segments which are followed. The phase is known modulo a cycle: the error of a segment is the mean of
+        # its errors around their circular mean, taken the nearest to the error of the previous segment followed (to 0 for the 1st one)
+        segments = cycle_indexes // self.SEGMENT_CYCLE_NUMBER
+        counts = np.bincount(segments)
+        kept = np.flatnonzero(counts)
+        phasors = np.exp(2j * np.pi * errors / self.cycle_length)
+        means = (np.bincount(segments, weights=phasors.real) + 1j * np.bincount(segments, weights=phasors.imag))[kept] / counts[kept]
+        circular_means = np.angle(means) * self.cycle_length / (2 * math.pi)
+        deviations = (errors - circular_means[np.searchsorted(kept, segments)] + self.cycle_length / 2) % self.cycle_length - self.cycle_length / 2
+        segment_errors = circular_means + np.bincount(segments, weights=deviations)[kept] / counts[kept]
+        centers = np.bincount(segments, weights=cycle_indexes)[kept] / counts[kept]
+        followed = []
+        previous = 0.0
+        for i in np.flatnonzero(np.abs(means) >= self.MIN_SEGMENT_COHERENCE).tolist():
+            value = previous + (segment_errors[i] - previous + self.cycle_length / 2) % self.cycle_length - self.cycle_length / 2
+            if followed and abs(value - previous) > self.cycle_length * self.MAX_SEGMENT_JUMP:
+                continue
+            followed.append(i)
+            segment_errors[i] = previous = value
+        if len(followed) < len(kept):
+            _logger.debug(f"Timing: {len(kept) - len(followed)} of {len(kept)} segments not followed")
+        return centers[followed], segment_errors[followed]
+
+    def _measure(self, sound_data, starts:np.ndarray, max_volume:float):
+        # Fits a*sin+b*cos of the carrier on the samples of a cycle out of MEASURE_STEP, the phase gives where the cycle starts.
+        # Returns the indexes of the measured cycles and their timing errors: the "1" cycles between two "1" cycles, which are whole sines
+        width = int(self.cycle_length)
+        first_samples = np.floor(starts).astype(np.int64)
+        first = max(int(first_samples[0]), 0)
+        samples = sound_data[first:int(first_samples[-1]) + width]
+        offset = float(np.mean(samples)) # DC offset
+        candidates = np.arange(1, len(starts) - 1, self.MEASURE_STEP)
+        candidates = candidates[(first_samples[candidates - 1] >= first) & (first_samples[candidates + 1] - first + width <= len(samples))]
+        # Least squares: the coefficients are the samples of the cycle weighted by the pseudo-inverse of the basis
+        phases = 2 * np.pi * np.arange(width) / self.cycle_length
+        basis = np.stack((np.sin(phases), np.cos(phases)), axis=1)
+        weights = basis @ np.linalg.inv(basis.T @ basis)
+        coefficients = []
+        for shift in (-1, 0, 1): # the cycle and its neighbours
+            indexes = first_samples[candidates + shift] - first
+            a = np.full(len(candidates), -offset * weights[:, 0].sum())
+            b = np.full(len(candidates), -offset * weights[:, 1].sum())
+            for k in range(width): # a gather per sample of the cycle, lighter than the matrix of all the cycle samples
+                cycle_samples = samples[indexes + k]
+                a += weights[k, 0] * cycle_samples
+                b += weights[k, 1] * cycle_samples
+            coefficients.append((a, b))
+        ones = [a * a + b * b >= (self.MIN_AMPLITUDE * max_volume) ** 2 for a, b in coefficients]
+        measured = ones[0] & ones[1] & ones[2]
+        a, b = (c[measured] for c in coefficients[1])
+        cycle_indexes = candidates[measured]
+        # a*sin(x)+b*cos(x) is a sine starting at -atan2(b, a), in the window starting at first_samples
+        errors = first_samples[cycle_indexes] - starts[cycle_indexes] - np.arctan2(b, a) * self.cycle_length / (2 * math.pi)
+        return cycle_indexes, errors
@@ -0,0 +1,51 @@
+import logging
+import os
+from ..common.codec import Codec
+from ..common.batch import BatchEntry, BatchManifest
+from .bytesutils import BytesUtils
+
+_logger = logging.getLogger(__name__)
+
+class BatchUnpacker:
+    # Unpacks the files of a batch (see BatchManifest) to a directory, checking the size and the checksum of each file
+    BLOCK_SIZE = 1024*1024
+
+    def __init__(self, output_dir:str) -> None:
+        self._output_dir = output_dir
+
+    def unpack(self, f)->list[BatchEntry]:
+        # f is the batch content, read from its beginning
+        entries = BatchManifest.read(f)
+        os.makedirs(self._output_dir, exist_ok=True)
+        for entry in entries:
+            self._unpack_file(f, entry)
+        _logger.info(f"{len(entries)} files unpacked to {self._output_dir}")
+        return entries
+
+    def _get_file_path(self, name:str)->str:
+        # The files stay in the output directory whatever their names
+        parts = name.split("/")
+        if not name or os.path.isabs(name) or any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Unexpected file name in the batch: {name}")
+        return os.path.join(self._output_dir, *parts)
+
+    def _unpack_file(self, f, entry:BatchEntry):
+        file_path = self._get_file_path(entry.name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        decompressor = Codec.by_id(entry.codec_id).decompressor()
+        checksum = BytesUtils.checksum(b"")
+        size = 0
+        remaining = entry.stored_size
+        with open(file_path, 'wb') as output:
+            while remaining:
+                block = f.read(min(remaining, self.BLOCK_SIZE))
+                if not block:
+                    raise ValueError(f"The batch is truncated in {entry.name}")
+                remaining -= len(block)
+                content = decompressor.decompress(block)
+                checksum = BytesUtils.checksum(content, checksum)
+                size += len(content)
+                output.write(content)
+        if size != entry.size or checksum != entry.checksum:
+            raise ValueError(f"{entry.name} does not match its checksum")
+        _logger.debug(f"{entry.name}: {entry.size} bytes")
@@ -1,30 +1,74 @@
 import logging
+import numpy as np
 from .readwave import WaveReader
+from .preamblesync import PreambleSync
+from .timingrecovery import TimingRecovery
+from .softdetector import SoftDetector
+from ..common import BitBuffer
+from ..common.metrics import Metrics
 
 _logger = logging.getLogger(__name__)
 
 class WaveUtils:
-    def __init__(self, wreader:WaveReader) -> None:
+    MIN_PREAMBLE_VOLUME = 0.01 # fraction of the full scale under which a preamble is considered as noise
+
+    def __init__(self, wreader:WaveReader, metrics:Metrics|None=None) -> None:
         self._wreader = wreader
+        self._metrics = metrics if metrics is not None else Metrics()
 
     def find_max_volume(self, sound_data, search_time_in_sec=5):
-        return max(sound_data[:int(self._wreader.frame_rate * search_time_in_sec)])
+        return np.max(sound_data[:int(self._wreader.frame_rate * search_time_in_sec)]).item()
 
     def find_1st_cycle_index(self, sound_data, freq, search_time_in_sec=5):
         max_volume = self.find_max_volume(sound_data, search_time_in_sec=search_time_in_sec)
         end_position = int(self._wreader.frame_rate * search_time_in_sec)
-        for i, d in enumerate(sound_data[:end_position]):
-            if d>=max_volume*0.90:
-                first_peak = i
-                return max((int(first_peak - ((0.25/freq) * self._wreader.frame_rate))+1, 0))
+        peaks = np.flatnonzero(np.asarray(sound_data[:end_position]) >= max_volume*0.90)
+        if len(peaks):
+            first_peak = int(peaks[0])
+            return max((int(first_peak - ((0.25/freq) * self._wreader.frame_rate))+1, 0))
         raise ValueError("Cannot find the 1st step index")
     
-    def find_sound_data_block(self, sound_data, freq, nominal_bit_length, search_time_in_sec=5):
-        first_cycle_index = self.find_1st_cycle_index(sound_data, freq, search_time_in_sec=search_time_in_sec)
+    def find_preamble_index(self, sound_data, freq, cycle_number, search_time_in_sec=None):
+        # Locates the preamble of cycle_number "1"s by correlation (search_time_in_sec None to search the whole sound),
+        # then finds its 1st cycle precisely in the samples around it
+        search_length = None if search_time_in_sec is None else int(self._wreader.frame_rate * search_time_in_sec)
+        sync = PreambleSync(self._wreader.frame_rate, freq, cycle_number, min_amplitude=self.MIN_PREAMBLE_VOLUME * self._wreader.full_scale)
+        preamble_index = sync.find(sound_data, search_length)
+        if preamble_index is None:
+            raise ValueError("Cannot find the preamble")
+        cycle_length = self._wreader.frame_rate/freq
+        start = max(preamble_index - int(2 * cycle_length) - 1, 0)
+        window = sound_data[start:start + int((cycle_number + 4) * cycle_length)]
+        return start + self.find_1st_cycle_index(window, freq, search_time_in_sec=len(window)/self._wreader.frame_rate)
+
+    def find_sound_data_block(self, sound_data, freq, nominal_bit_length, search_time_in_sec=5, preamble_cycle_number=0):
+        # preamble_cycle_number > 0 to locate the block by correlation with its beginning ones
+        with self._metrics.stage("sync"):
+            if preamble_cycle_number:
+                first_cycle_index = self.find_preamble_index(sound_data, freq, preamble_cycle_number, search_time_in_sec=search_time_in_sec)
+            else:
+                first_cycle_index = self.find_1st_cycle_index(sound_data, freq, search_time_in_sec=search_time_in_sec)
         cycle_length = self._wreader.frame_rate/freq
         max_header_length = cycle_length * nominal_bit_length
         return sound_data[first_cycle_index:int(first_cycle_index+max_header_length) + 100], first_cycle_index # +100 for fault torelance
     
+    @staticmethod
+    def find_block_starts(sound_data, expected:float, search_length:int, silence_length:float, volume:float|None=None, level:float=0.5)->list[int]:
+        # Indexes of the samples of sound_data which follow silence_length silent samples, at most search_length samples away from
+        # expected, the nearest first: where the blocks can start around where one is expected (it was lost, the recording has a gap
+        # or dropped samples). A sample is silent under level of the volume, the 99th percentile of the searched sound by default
+        start = max(int(expected) - search_length, 0)
+        search_sound = np.abs(np.asarray(sound_data[start:int(expected) + search_length + 1], dtype=np.float64))
+        if not len(search_sound):
+            return []
+        volume = volume if volume else float(np.percentile(search_sound, 99))
+        if not volume > 0:
+            return []
+        loud = np.flatnonzero(search_sound >= level * volume)
+        silences = np.diff(loud, prepend=0) # the 1st loud sample follows the start of the searched sound
+        starts = start + loud[silences > silence_length]
+        return starts[np.argsort(np.abs(starts - expected), kind="stable")].tolist()
+
     def _demod_cycle(self, cycle_data, max_volume, cycle_length):
         _maxv = max(cycle_data)
         _minv = min(cycle_data)
@@ -46,26 +90,88 @@ class WaveUtils:
         _logger.debug(f"Cycle data lengthe : {len(cycle_data)}, Max: {_maxv}, Min:{_minv}, Max volume: {max_volume}")
         raise ValueError(f"Unexpected cycle data: {cycle_data}")
     
-    def demod_to_bits(self, sound_data:list[int], freq:int, first_cycle_index:int, max_volume:int)->str:
+    def _get_borned_width(self, cycle_length:float)->int:
+        # Number of samples ignored at both sides of a cycle to check a "0" (see _demod_cycle)
+        if cycle_length == 2:
+            return 0
+        if cycle_length > 2 and cycle_length <= 10:
+            return 1
+        if cycle_length > 10:
+            return int(cycle_length * 0.1)
+        raise ValueError(f"Unexpected cycle length: {cycle_length}")
+
+    def _get_amplitudes(self, sound_data:np.ndarray)->np.ndarray:
+        # |x| >= v is the same as x >= v or x <= -v, integers are widened so that abs(-32768) does not overflow
+        if sound_data.dtype.kind in "iu":
+            sound_data = sound_data.astype(np.int64 if sound_data.dtype.itemsize >= 4 else np.int32)
+        return np.abs(sound_data)
+
+    def get_cycle_bounds(self, first_cycle_index:float, cycle_length:float, cycle_number:int)->np.ndarray:
+        # cycle_number+1 boundaries. Positions are accumulated to get the same float positions as a cycle by cycle walk
+        steps = np.full(cycle_number + 1, cycle_length)
+        steps[0] = first_cycle_index
+        return np.cumsum(steps).astype(np.int64)
+
+    def demod_to_bits(self, sound_data, freq:int, first_cycle_index:float, max_volume:int, erasures:list|None=None, timing:TimingRecovery|None=None,
+                      detector:SoftDetector|None=None, margins:list|None=None)->BitBuffer:
+        # erasures collects the indexes of the cycles which are neither a "0" nor a "1" (they are given as "0") instead of raising an error.
+        # With timing, the cycles are where the timing recovery tracks them instead of every frame_rate/freq samples.
+        # With detector, the cycles are decided by their carrier level, the unreliable ones are the erasures (no error is raised).
+        # margins receives the array of the distances of the cycles to the threshold of their decision, as a fraction of the max volume
+        # (of the level with detector), negative for the cycles which are neither a "0" nor a "1"
         assert first_cycle_index>=0, f"Unexpect first_cycle_index value {first_cycle_index}"
-        cycle_length = self._wreader.frame_rate/freq
-        current_index = first_cycle_index
-        current_real_position = first_cycle_index
-        sound_data_length = len(sound_data)
-        bits=""
-        for i in range(int((sound_data_length-first_cycle_index)//cycle_length)-1):
-            next_cycle_real_position = current_real_position + cycle_length
-            current_index = int(current_real_position)
-            next_cycle_index = int(next_cycle_real_position)
-            try:
-                cycle_data = sound_data[current_index:next_cycle_index]
-                bits=f"{bits}{self._demod_cycle(cycle_data, max_volume, cycle_length)}"
-            except Exception as e:
-                print(f"Error occured at {current_index}:{next_cycle_index}")
-                raise e
-            else:
-                current_real_position = next_cycle_real_position
-                if current_real_position>=sound_data_length:
-                    print("Meet the end of sound")
-                    break
-        return bits
\ No newline at end of file
+        cycle_length = self._wreader.frame_rate/freq if timing is None else timing.cycle_length
+        borned_width = self._get_borned_width(self._wreader.frame_rate/freq)
+        sound_data = np.asarray(sound_data)
+        cycle_number = max(int((len(sound_data)-first_cycle_index)//cycle_length)-1, 0)
+        if cycle_number == 0:
+            return BitBuffer()
+        if timing is None:
+            bounds = self.get_cycle_bounds(first_cycle_index, cycle_length, cycle_number)
+        else:
+            # a cycle starts with the 1st sample after its tracked start, the 1st cycle can start before the block
+            bounds = np.maximum(np.ceil(timing.track(sound_data, first_cycle_index, cycle_number, max_volume)), 0).astype(np.int64)
+            bounds = bounds[:np.searchsorted(bounds, len(sound_data), side='right')] # and the sound can end before the tracked cycles
+            cycle_number = len(bounds) - 1
+            if cycle_number <= 0:
+                return BitBuffer()
+        if max_volume <= 0: # silence (e.g. where a lost chunk is searched), none of the cycles can be decided
+            if margins is not None:
+                margins.append(np.zeros(cycle_number))
+            if erasures is not None:
+                erasures.extend(range(cycle_number))
+            elif detector is None:
+                raise ValueError(f"No sound in the cycles at {int(bounds[0])}:{int(bounds[-1])}")
+            return BitBuffer.repeat(0, cycle_number)
+        if detector is not None:
+            levels = detector.get_levels(sound_data, bounds, cycle_length, max_volume)
+            ones, unreliable = detector.get_bits(levels)
+            if margins is not None:
+                margins.append(np.abs(levels - detector.DECISION_LEVEL))
+            if erasures is not None:
+                erasures.extend(unreliable.tolist())
+            return BitBuffer.from_array(ones)
+        block = self._get_amplitudes(sound_data[bounds[0]:bounds[-1]])
+        starts = bounds[:-1] - bounds[0]
+        # Peak of each whole cycle and of each cycle without its borders, with one reduction over the whole block each
+        cycle_peak = np.maximum.reduceat(block, starts)
+        if borned_width:
+            borned_starts = np.empty(2 * cycle_number, dtype=np.int64)
+            borned_starts[0::2] = starts + borned_width
+            borned_starts[1::2] = bounds[1:] - bounds[0] - borned_width
+            borned_peak = np.maximum.reduceat(block, borned_starts)[0::2]
+        else:
+            borned_peak = cycle_peak
+
+        ones = cycle_peak >= 0.7 * max_volume
+        zeros = borned_peak < 0.3 * max_volume
+        unexpected = np.flatnonzero(~ones & ~zeros)
+        if margins is not None:
+            margins.append(np.maximum(cycle_peak / max_volume - 0.7, 0.3 - borned_peak / max_volume))
+        if erasures is not None:
+            erasures.extend(unexpected.tolist())
+        elif len(unexpected):
+            current_index, next_cycle_index = int(bounds[unexpected[0]]), int(bounds[unexpected[0] + 1])
+            _logger.debug(f"Error occurred at {current_index}:{next_cycle_index}")
+            self._demod_cycle(sound_data[current_index:next_cycle_index].tolist(), max_volume, cycle_length) # raises the error of the unexpected cycle
+        return BitBuffer.from_array(ones)
@@ -0,0 +1,162 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from ..common.codec import Codec
+from ..common.metrics import Metrics
+from ..common.batch import BatchManifest
+from ..common.delta import Delta
+from .bytesutils import BytesUtils
+from .demodheader import Header
+from .unpackbatch import BatchUnpacker
+from .applydelta import DeltaDecoder
+
+_logger = logging.getLogger(__name__)
+
+class FileWriter:
+    # Assembles the chunks of a transmission into the output file, possibly from several recordings of it.
+    # The missing chunks (yielded as None by the demodulation with the chunk CRC) are left as zeros: the content is saved as received,
+    # not decompressed, and their indexes are written to a sidecar file. Another recording of the same transmission (matched on the
+    # checksum and the length) completes it in a later run.
+    # When streaming, the content is assembled in a temporary file instead of in memory.
+    # A batch of files is unpacked to a directory at the output path, a delta is applied to its base file
+    SIDECAR_SUFFIX = ".missing.json"
+    BLOCK_SIZE = 1024*1024
+
+    def __init__(self, header:Header, output_file_path:str, streaming:bool=False, metrics:Metrics|None=None, base_file_path:str|None=None) -> None:
+        self._header = header
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._delta_decoder = None
+        if header.content_type == Delta.CONTENT_TYPE: # the base file is checked before the chunks are demodulated
+            if base_file_path is None:
+                raise ValueError("The transmission is a delta, the base file it was made against is needed")
+            self._delta_decoder = DeltaDecoder(base_file_path)
+            self._delta_decoder.check_base(header.base_checksum)
+        self._output_file_path = output_file_path
+        self._sidecar_path = f"{output_file_path}{self.SIDECAR_SUFFIX}"
+        self._temp_file_path = f"{output_file_path}.part"
+        self._streaming = streaming
+        self._chunk_byte_size = header.chunk_size // 8
+        self.missing_chunks = set(range(header.chunk_number))
+        partial = self._load_partial()
+        if streaming:
+            if partial:
+                shutil.copyfile(output_file_path, self._temp_file_path)
+            self._content = open(self._temp_file_path, 'r+b' if partial else 'w+b')
+            self._content.truncate(header.file_length // 8)
+        elif partial:
+            with open(output_file_path, 'rb') as f:
+                self._content = io.BytesIO(f.read())
+        else:
+            self._content = io.BytesIO(bytes(header.file_length // 8))
+
+    @staticmethod
+    def _get_transmission(header:Header)->dict:
+        # What identifies a transmission and the layout of its chunks
+        return {"checksum": header.checksum, "file_length": header.file_length, "chunk_size": header.chunk_size,
+                "chunk_number": header.chunk_number, "codec_id": header.codec_id}
+
+    def matches(self, header:Header)->bool:
+        # True if the header is the one of the same transmission
+        return self._get_transmission(header) == self._get_transmission(self._header)
+
+    def _load_partial(self)->bool:
+        # Takes the chunks already recovered by a previous run, if its sidecar is the one of the same transmission
+        if not os.path.exists(self._sidecar_path) or not os.path.exists(self._output_file_path):
+            return False
+        with open(self._sidecar_path) as f:
+            sidecar = json.load(f)
+        transmission = self._get_transmission(self._header)
+        if {key: sidecar.get(key) for key in transmission} != transmission or os.path.getsize(self._output_file_path) != self._header.file_length // 8:
+            _logger.warning(f"{self._sidecar_path} is not the one of this transmission, it is ignored")
+            return False
+        self.missing_chunks = set(sidecar["missing_chunks"])
+        _logger.info(f"Resume from {self._output_file_path}, {len(self.missing_chunks)} chunks are missing")
+        return True
+
+    def add_chunks(self, chunks):
+        # chunks yields the bits of the chunks in order, None for a lost one. Only the missing chunks are written
+        for chunk_index, chunk_bits in enumerate(chunks):
+            if chunk_bits is None or chunk_index not in self.missing_chunks:
+                continue
+            with self._metrics.stage("write"):
+                chunk_bytes = BytesUtils.bits_to_bytes(chunk_bits)
+                self._content.seek(chunk_index * self._chunk_byte_size)
+                self._content.write(chunk_bytes)
+                self._content.flush() # written as soon as demodulated
+            self._metrics.count("write", bytes=len(chunk_bytes))
+            self.missing_chunks.discard(chunk_index)
+            if not self.missing_chunks:
+                break
+
+    def save(self)->list[int]:
+        # Returns the indexes of the missing chunks, the file is decoded and saved only if there are none
+        missing_chunks = sorted(self.missing_chunks)
+        if missing_chunks:
+            self._save_partial(missing_chunks)
+            return missing_chunks
+        codec = Codec.by_id(self._header.codec_id)
+        with self._metrics.stage("checksum", bytes=self._header.file_length // 8):
+            checksum = BytesUtils.checksum(b"")
+            self._content.seek(0)
+            while block := self._content.read(self.BLOCK_SIZE):
+                checksum = BytesUtils.checksum(block, checksum)
+        if checksum != self._header.checksum:
+            self._close()
+            raise ValueError("Checksum does not match.")
+        with self._metrics.stage("save"):
+            self._save(codec)
+        if os.path.exists(self._sidecar_path):
+            os.remove(self._sidecar_path)
+        return missing_chunks
+
+    def _save(self, codec:Codec):
+        # Decodes the content to the output file
+        if self._header.content_type == BatchManifest.CONTENT_TYPE:
+            if os.path.isfile(self._output_file_path): # the content received by a previous run
+                os.remove(self._output_file_path)
+            self._content.seek(0)
+            BatchUnpacker(self._output_file_path).unpack(self._content)
+            self._close()
+        elif self._delta_decoder is not None:
+            self._content.seek(0)
+            if codec.codec_id == 0:
+                self._delta_decoder.apply(self._content, self._output_file_path)
+            else:
+                with tempfile.TemporaryFile() as delta:
+                    decompressor = codec.decompressor()
+                    while block := self._content.read(self.BLOCK_SIZE):
+                        delta.write(decompressor.decompress(block))
+                    delta.seek(0)
+                    self._delta_decoder.apply(delta, self._output_file_path)
+            self._close()
+        elif self._streaming and codec.codec_id == 0:
+            self._content.close()
+            os.replace(self._temp_file_path, self._output_file_path)
+        else:
+            # The content is decompressed block by block from the memory or the temporary file, straight to the output file
+            decompressor = codec.decompressor()
+            self._content.seek(0)
+            with open(self._output_file_path, 'wb') as output:
+                while block := self._content.read(self.BLOCK_SIZE):
+                    output.write(decompressor.decompress(block))
+            self._close()
+
+    def _save_partial(self, missing_chunks:list[int]):
+        if self._streaming:
+            self._content.close()
+            os.replace(self._temp_file_path, self._output_file_path)
+        else:
+            BytesUtils.save_bytes_to_file(self._content.getvalue(), self._output_file_path)
+        with open(self._sidecar_path, 'w') as f:
+            json.dump({**self._get_transmission(self._header), "missing_chunks": missing_chunks}, f)
+        _logger.warning(f"{len(missing_chunks)} of {self._header.chunk_number} chunks are missing, the received content is saved to {self._output_file_path} "
+                        f"and the missing chunks to {self._sidecar_path}. Demodulate another recording of the transmission to the same output to complete it.")
+
+    def _close(self):
+        # Removes the temporary file when streaming
+        self._content.close()
+        if self._streaming and os.path.exists(self._temp_file_path):
+            os.remove(self._temp_file_path)
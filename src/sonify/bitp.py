@@ -1,81 +1,96 @@
 import logging
 import math
+from ..common import BitBuffer
+from ..common.chunkfec import ChunkFec
 
 _logger = logging.getLogger(__name__)
 
 class BitProcessor:
     # Responsible of Bits
     VERSION = 1
-    def __init__(self, chunk_bit_size:int) -> None:
+    FRAMING_VERSION = 2 # the chunk data is framed as given in the header (Reed-Solomon parity bytes, CRC)
+    def __init__(self, chunk_bit_size:int, fec_parity_number:int=0, chunk_crc:bool=False) -> None:
         self._chunk_bit_size = chunk_bit_size
-        _logger.debug(f"Chunk bit size:{chunk_bit_size}")
+        self._fec = ChunkFec(fec_parity_number, chunk_bit_size, chunk_crc)
+        _logger.debug(f"Chunk bit size:{chunk_bit_size}, FEC parity bytes:{fec_parity_number}, CRC:{chunk_crc}, Chunk frame bit size:{self._fec.frame_bits_number}")
 
-    def bitit(self, file_obj, checksum:int, frequency:int, reader_version:int, wave_version:int):
-        file_bits = self._get_file_bits(file_obj)
-        file_bits_number = len(file_bits)
+    @property
+    def version(self)->int:
+        return self.VERSION if self._fec.parity_number == 0 and not self._fec.crc else self.FRAMING_VERSION
+
+    def bitit_stream(self, file_obj, file_size:int, checksum:int, frequency:int, reader_version:int, wave_version:int, wave_option:int=0,
+                     channel_index:int=0, channel_number:int=1, codec_id:int=0, content_type:int=0, base_checksum:int=0):
+        # Returns the meta bits and an iterator of the header bits then of the bits of each chunk, generated one at a time while reading the file.
+        # With several channels, the chunks are striped across them (chunk i on the channel i % channel_number). Each channel is a
+        # complete transmission of its own chunks: its header counts only them, the checksum is the one of the whole file.
+        assert 0 <= channel_index < channel_number <= 256, f"Unexpected channel {channel_index} of {channel_number}"
+        file_bits_number = file_size * 8
         _logger.debug(f"File bit number:{file_bits_number}")
-        meta_bits = self._gen_meta_bits(frequency, reader_version, wave_version)
-        header_bits = self._gen_header_bits(checksum, file_bits_number)
-        chunked_bits = self._chunknize(file_bits)
-        return meta_bits, f"{header_bits}{chunked_bits}"
+        meta_bits = self._gen_meta_bits(frequency, reader_version, wave_version, wave_option, channel_index, channel_number)
+        return meta_bits, self._iter_enhanced_bits(file_obj, checksum, file_bits_number, channel_index, channel_number, codec_id, content_type, base_checksum)
 
-    def _get_file_bits(self, file_obj)->str:
-        _logger.debug("Start get_file_bits")
-        rlt = ""
-        while True:
-            byte = file_obj.read(1)
-            if not byte:
-                break
-            rlt = f"{rlt}{bin(ord(byte))[2:].zfill(8)}"
-        _logger.debug("End get_file_bits")
-        return rlt
-    
-    def _gen_meta_bits(self, freq:int, reader_version:int, wave_version:int)->str:
-        starting_bits = "1"*20
-        starting_void_bits = "0"*1
-        reserved_bits = "0"*8*4 # reserved bits are places for future extensions for backward compatibilities
-        freq_data_bits = bin(freq)[2:].zfill(8*2)
-        reader_version_bits = bin(reader_version)[2:].zfill(8*2)
-        bitp_version_bits = bin(self.VERSION)[2:].zfill(8*2)
-        wave_version_bits = bin(wave_version)[2:].zfill(8*2)
-        ending_void_bits = "0"*3
-        bits = f"{starting_bits}{starting_void_bits}{reserved_bits}{freq_data_bits}{reader_version_bits}{bitp_version_bits}{wave_version_bits}{ending_void_bits}"
+    def _iter_enhanced_bits(self, file_obj, checksum:int, file_bits_number:int, channel_index:int=0, channel_number:int=1, codec_id:int=0, content_type:int=0, base_checksum:int=0):
+        chunk_indexes = range(channel_index, math.ceil(file_bits_number / self._chunk_bit_size), channel_number)
+        channel_bits_number = sum(min(self._chunk_bit_size, file_bits_number - i * self._chunk_bit_size) for i in chunk_indexes)
+        yield self._gen_header_bits(checksum, channel_bits_number, codec_id, content_type, base_checksum)
+        chunk_byte_size = self._chunk_bit_size // 8
+        for n, i in enumerate(chunk_indexes):
+            if channel_number > 1:
+                file_obj.seek(i * chunk_byte_size) # the channels read the file in turn
+            chunk_bytes = file_obj.read(chunk_byte_size)
+            yield self._frame_chunk(BitBuffer.from_bytes(chunk_bytes), n == len(chunk_indexes) - 1)
+
+    def get_meta_bits(self, frequency:int, reader_version:int, wave_version:int, wave_option:int=0)->BitBuffer:
+        # Meta data of a sound which is not a file transmission (e.g. a calibration sweep)
+        return self._gen_meta_bits(frequency, reader_version, wave_version, wave_option)
+
+    def _gen_meta_bits(self, freq:int, reader_version:int, wave_version:int, wave_option:int=0, channel_index:int=0, channel_number:int=1)->BitBuffer:
+        bits = BitBuffer()
+        bits.append(BitBuffer.repeat(1, 20)) # starting bits
+        bits.append(BitBuffer.repeat(0, 1)) # starting void bits
+        # reserved bits are places for future extensions for backward compatibilities
+        bits.append(BitBuffer.repeat(0, 8))
+        bits.append_int(channel_number - 1, 8) # number of channels carrying the file
+        bits.append_int(channel_index, 8) # channel carrying these bits
+        bits.append_int(wave_option, 8) # wave version specific parameter
+        bits.append_int(freq, 8*2)
+        bits.append_int(reader_version, 8*2)
+        bits.append_int(self.version, 8*2)
+        bits.append_int(wave_version, 8*2)
+        bits.append(BitBuffer.repeat(0, 3)) # ending void bits
         bit_length = len(bits)
         assert bit_length == 20+1+8*4+8*2+8*2+8*2+8*2+3, f"Unexpected meta bits length: {bit_length}" # expect 120
         return bits
 
-    def _gen_header_bits(self, checksum:int, file_bits_number:int):
+    def _gen_header_bits(self, checksum:int, file_bits_number:int, codec_id:int=0, content_type:int=0, base_checksum:int=0)->BitBuffer:
         # Responsible of sound wave 
         _logger.debug("Generating header bits...")
-        starter = '1'*100
-        starter_silent = '0'*7
-        version_sig_str = "0"*31+"1" # Version 1
-        checksum_sig_str = bin(checksum)[2:].zfill(32)
-        assert len(checksum_sig_str) == 32, f"Bad checksum value: {checksum_sig_str} from {bin(checksum)[2:]} of {checksum}"
+        assert 0 <= checksum < 2**32, f"Bad checksum value: {checksum}"
         chunk_number = math.ceil(file_bits_number / self._chunk_bit_size)
-        chunk_number_sig_str = bin(chunk_number)[2:].zfill(32)
-        chunk_size_sig_str = bin(self._chunk_bit_size)[2:].zfill(32)
-        file_length_sig_str = bin(file_bits_number)[2:].zfill(64)
-        reserved_sig_str = "0"*64
-        post_sig_silent = '0'*7
-        file_start_sig = '1'*7
-        header_bits = f"{starter}{starter_silent}{version_sig_str}{checksum_sig_str}{chunk_number_sig_str}{chunk_size_sig_str}{file_length_sig_str}{reserved_sig_str}{post_sig_silent}{file_start_sig}"
+        header_bits = BitBuffer()
+        header_bits.append(BitBuffer.repeat(1, 100)) # starter
+        header_bits.append(BitBuffer.repeat(0, 7)) # starter silent
+        header_bits.append_int(1, 32) # Version 1
+        header_bits.append_int(checksum, 32)
+        header_bits.append_int(chunk_number, 32)
+        header_bits.append_int(self._chunk_bit_size, 32)
+        header_bits.append_int(file_bits_number, 64)
+        header_bits.append_int(codec_id, 8) # compression of the file content, the checksum and the length are the ones of the compressed content
+        header_bits.append_int(self._fec.parity_number, 8) # Reed-Solomon parity bytes per codeword of the chunk data
+        header_bits.append_int(int(self._fec.crc), 8) # 1 when the data of each chunk is followed by its CRC-32
+        header_bits.append_int(content_type, 8) # 0 for a file, else what the content is (a batch of files, a delta)
+        header_bits.append_int(base_checksum, 32) # Adler-32 of the base file of a delta
+        header_bits.append(BitBuffer.repeat(0, 7)) # post signal silent
+        header_bits.append(BitBuffer.repeat(1, 7)) # file start signal
         assert len(header_bits) == 100+7+32+32+32+32+64+64+7+7, f"Unexpected header bits length: {len(header_bits)}"
         return header_bits
     
-    def _chunknize(self, bits:str)->str:
-        _logger.debug("Generating chunked bits...")
-        file_bits_number = len(bits)
-        rlt = ""
-        void = "0"*3
-        start = "1"*3
-        full_chunk_void = "0"*self._chunk_bit_size
-        chunk_number = math.ceil(file_bits_number/self._chunk_bit_size)
-        _logger.debug(f"Chunk number:{chunk_number}")
-        for i in range(chunk_number):
-            chunk_data = bits[i*self._chunk_bit_size:(i+1)*self._chunk_bit_size]
-            if i == chunk_number - 1:
-                chunk_data = f"{chunk_data}{full_chunk_void}"[:self._chunk_bit_size] # complete the last chunk with zeros
-            chunk_data = f"{void}{start}0{chunk_data}{void}"
-            rlt = f"{rlt}{chunk_data}"
-        return rlt
+    def _frame_chunk(self, chunk_data:BitBuffer, is_last:bool)->BitBuffer:
+        framed = BitBuffer.repeat(0, 3) # void
+        framed.append(BitBuffer.repeat(1, 3)) # start
+        framed.append(BitBuffer.repeat(0, 1))
+        if is_last:
+            chunk_data = chunk_data + BitBuffer.repeat(0, self._chunk_bit_size - len(chunk_data)) # complete the last chunk with zeros
+        framed.append(self._fec.encode(chunk_data))
+        framed.append(BitBuffer.repeat(0, 3)) # void
+        return framed
@@ -0,0 +1,65 @@
+import math
+import logging
+import numpy as np
+from ..common import BitBuffer
+from ..common.constellation import Constellation
+from .wavep import WaveProcessor
+
+_logger = logging.getLogger(__name__)
+
+class ConstellationWaveProcessor(WaveProcessor):
+    # Sends bits_per_symbol bits in each carrier cycle, by its phase and amplitude (see Constellation).
+    # A cycle is I*sin + Q*cos of the carrier, the point 1 (I=1, Q=0) being the same cycle as a "1" of the WaveProcessor.
+    # The starters of the blocks are kept on/off keyed, to locate the blocks as usual and to give the phase reference to the demodulation:
+    # the 100 ones and 7 zeros of the header, the void, start and void bits of the chunks (and the void bits at their end).
+    VERSION = 3
+    HEADER_STARTER_BITS_NUMBER = 100+7
+    CHUNK_STARTER_BITS_NUMBER = 3+3+1
+    CHUNK_END_BITS_NUMBER = 3
+    def __init__(self, frequency:int, frame_rate:int, bits_per_symbol:int) -> None:
+        super().__init__(frequency, frame_rate)
+        self._constellation = Constellation(bits_per_symbol)
+        self._quadrature_tables:dict[int, np.ndarray] = {}
+        _logger.debug(f"Bits per cycle: {bits_per_symbol}")
+
+    def _get_quadrature_table(self, freq:int)->np.ndarray:
+        # Same as _get_cycle_table with a cosine
+        if freq not in self._quadrature_tables:
+            period = self._frame_rate // math.gcd(freq, self._frame_rate)
+            self._quadrature_tables[freq] = np.array([self._max_volume * math.cos(2 * math.pi * float(freq) * (x / float(self._frame_rate))) for x in range(period)])
+        return self._quadrature_tables[freq]
+
+    def _get_block_points(self, bits:BitBuffer, is_header:bool)->np.ndarray:
+        # One complex point per cycle
+        bit_values = bits.to_array()
+        if is_header:
+            starter_length, end_length = self.HEADER_STARTER_BITS_NUMBER, 0
+        else:
+            starter_length, end_length = self.CHUNK_STARTER_BITS_NUMBER, self.CHUNK_END_BITS_NUMBER
+        data_end = len(bit_values) - end_length
+        return np.concatenate((bit_values[:starter_length].astype(np.complex128),
+                               self._constellation.map(bit_values[starter_length:data_end]),
+                               bit_values[data_end:].astype(np.complex128)))
+
+    def _modulate(self, points:np.ndarray, bit_ends:np.ndarray, start_sample:int)->np.ndarray:
+        lengths = np.diff(bit_ends, prepend=start_sample)
+        positions = np.arange(start_sample, int(bit_ends[-1]))
+        in_phase = self._get_cycle_table(self._freq)
+        quadrature = self._get_quadrature_table(self._freq)
+        return np.repeat(points.real, lengths) * in_phase[positions % len(in_phase)] + np.repeat(points.imag, lengths) * quadrature[positions % len(quadrature)]
+
+    def iter_convert(self, meta_bits:BitBuffer, enhanced_bits_blocks):
+        # Same timing as the WaveProcessor, one cycle per point instead of one per bit
+        yield self._get_meta_sound(meta_bits)
+        current_sample = 0
+        current_real_position = 0.0
+        for block_index, bits in enumerate(enhanced_bits_blocks):
+            points = self._get_block_points(bits, block_index == 0)
+            bit_ends, current_real_position = self._get_bit_ends(self._one_bit_cycle_frame, len(points), current_real_position)
+            yield self._modulate(points, bit_ends, current_sample)
+            current_sample = int(bit_ends[-1])
+        yield np.zeros(math.ceil(self._one_bit_cycle_frame)) # the last cycle is not cut by the end of the sound
+
+    @property
+    def wave_option(self)->int:
+        return self._constellation.bits_per_symbol
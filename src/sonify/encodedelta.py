@@ -0,0 +1,132 @@
+import logging
+import math
+import os
+import numpy as np
+from ..common.delta import Delta, DeltaHeader
+
+_logger = logging.getLogger(__name__)
+
+class DeltaEncoder:
+    # Encodes a file as a Delta against a base file. The blocks of the base file are indexed by their weak checksum, the weak checksums
+    # of the new file are computed at every position window by window, and the positions whose checksum is one of a base block are
+    # confirmed by the strong hash. The bytes between the matched blocks are sent as literals
+    MIN_BLOCK_SIZE = 512
+    MAX_BLOCK_SIZE = 64*1024
+    WINDOW_SIZE = 4*1024*1024 # positions of the new file checked at once
+    FILTER_BITS = 20
+
+    def __init__(self, block_size:int|None=None) -> None:
+        # block_size None for about the square root of the base size
+        self._block_size = block_size
+        self.copied_size = 0 # bytes of the new file taken from the base file
+        self.literal_size = 0 # bytes of the new file sent as is
+
+    def _get_block_size(self, base_size:int)->int:
+        if self._block_size is not None:
+            return self._block_size
+        return max(self.MIN_BLOCK_SIZE, min(self.MAX_BLOCK_SIZE, math.isqrt(base_size) // 8 * 8))
+
+    def _index_base(self, base_file_path:str, block_size:int)->dict:
+        # Weak checksum of each whole block of the base file to the indexes and strong hashes of the blocks having it
+        blocks = {}
+        index = 0
+        with open(base_file_path, 'rb') as f:
+            while data := f.read(max(Delta.READ_SIZE // block_size, 1) * block_size):
+                data = np.frombuffer(data, dtype=np.uint8)
+                block_number = len(data) // block_size
+                if block_number == 0:
+                    break
+                weak_checksums = Delta.get_block_weak_checksums(data[:block_number * block_size], block_size)
+                for i, weak_checksum in enumerate(weak_checksums.tolist()):
+                    blocks.setdefault(weak_checksum, []).append((index + i, Delta.get_strong_hash(data[i * block_size:(i + 1) * block_size].tobytes())))
+                index += block_number
+        return blocks
+
+    def encode(self, base_file_path:str, input_file_path:str, delta_file_path:str)->DeltaHeader:
+        base_size, base_checksum = Delta.get_file_checksum(base_file_path)
+        size, checksum = Delta.get_file_checksum(input_file_path)
+        header = DeltaHeader(base_size, base_checksum, size, checksum, self._get_block_size(base_size))
+        block_size = header.block_size
+        blocks = self._index_base(base_file_path, block_size)
+        weak_keys = np.sort(np.array(list(blocks), dtype=np.int64))
+        key_filter = self._get_key_filter(weak_keys)
+        data = np.memmap(input_file_path, dtype=np.uint8, mode='r') if size else np.zeros(0, dtype=np.uint8)
+        self.copied_size = 0
+        self.literal_size = 0
+        with open(delta_file_path, 'wb') as f:
+            f.write(Delta.pack_header(header))
+            writer = _OperationWriter(f)
+            position = 0 # of the 1st byte of the new file not encoded yet
+            for window_start in range(0, max(size - block_size + 1, 0), self.WINDOW_SIZE):
+                weak_checksums = Delta.get_weak_checksums(data[window_start:window_start + self.WINDOW_SIZE + block_size - 1], block_size)
+                for candidate in (self._find_candidates(weak_checksums, weak_keys, key_filter) + window_start).tolist():
+                    if candidate < position:
+                        continue
+                    block_index = self._match(blocks[int(weak_checksums[candidate - window_start])], data[candidate:candidate + block_size].tobytes())
+                    if block_index is None:
+                        continue
+                    if candidate > position:
+                        writer.literal(data[position:candidate].tobytes())
+                    writer.copy(block_index)
+                    position = candidate + block_size
+            if position < size:
+                writer.literal(data[position:size].tobytes())
+            writer.flush()
+            self.copied_size, self.literal_size = writer.copy_number * block_size, writer.literal_size
+        _logger.info(f"Delta of {size} bytes against {base_size} bytes: {self.copied_size} bytes copied, {self.literal_size} sent, {os.path.getsize(delta_file_path)} bytes of delta")
+        return header
+
+    @staticmethod
+    def _find_candidates(weak_checksums:np.ndarray, weak_keys:np.ndarray, key_filter:np.ndarray)->np.ndarray:
+        # Positions whose weak checksum is one of the sorted weak_keys. The few positions passing the filter table are searched in the keys
+        candidates = np.flatnonzero(key_filter[DeltaEncoder._get_filter_indexes(weak_checksums)])
+        indexes = np.minimum(np.searchsorted(weak_keys, weak_checksums[candidates]), len(weak_keys) - 1)
+        return candidates[weak_keys[indexes] == weak_checksums[candidates]]
+
+    @classmethod
+    def _get_key_filter(cls, weak_keys:np.ndarray)->np.ndarray:
+        # Table telling the weak checksums which may be keys, far smaller than the 2^32 checksums
+        key_filter = np.zeros(1 << cls.FILTER_BITS, dtype=bool)
+        key_filter[cls._get_filter_indexes(weak_keys)] = True
+        return key_filter
+
+    @classmethod
+    def _get_filter_indexes(cls, weak_checksums:np.ndarray)->np.ndarray:
+        return (weak_checksums ^ (weak_checksums >> (32 - cls.FILTER_BITS))) & ((1 << cls.FILTER_BITS) - 1)
+
+    @staticmethod
+    def _match(candidate_blocks:list, block:bytes)->int|None:
+        strong_hash = Delta.get_strong_hash(block)
+        for block_index, block_hash in candidate_blocks:
+            if block_hash == strong_hash:
+                return block_index
+        return None
+
+
+class _OperationWriter:
+    # Writes the operations of a delta, the copies of consecutive blocks are merged
+    def __init__(self, f) -> None:
+        self._f = f
+        self._copy_start = None
+        self._copy_count = 0
+        self.copy_number = 0 # blocks copied
+        self.literal_size = 0
+
+    def copy(self, block_index:int):
+        if self._copy_start is not None and block_index == self._copy_start + self._copy_count:
+            self._copy_count += 1
+        else:
+            self.flush()
+            self._copy_start, self._copy_count = block_index, 1
+        self.copy_number += 1
+
+    def literal(self, data:bytes):
+        self.flush()
+        self._f.write(bytes([Delta.LITERAL]) + Delta.LITERAL_ARGS.pack(len(data)))
+        self._f.write(data)
+        self.literal_size += len(data)
+
+    def flush(self):
+        if self._copy_start is not None:
+            self._f.write(bytes([Delta.COPY]) + Delta.COPY_ARGS.pack(self._copy_start, self._copy_count))
+            self._copy_start = None
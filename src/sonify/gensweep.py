@@ -0,0 +1,33 @@
+import logging
+import numpy as np
+from .bitp import BitProcessor
+from .wavep import WaveProcessor
+from ..common import BitBuffer
+from ..common.sweep import CalibrationSweep
+
+_logger = logging.getLogger(__name__)
+
+class SweepGenerator:
+    # Generates the calibration sweep (see CalibrationSweep) for a frame rate, up to the highest frequency of the sweep it can send
+    def __init__(self, frame_rate:int) -> None:
+        self._frame_rate = frame_rate
+        self.max_frequency = CalibrationSweep.get_max_frequency(frame_rate)
+        self.wave_processor = WaveProcessor(self.max_frequency, frame_rate) # of the meta data, gives the format of the sound
+
+    def iter_sound(self):
+        # Yields the meta data, then the silence and the segment of each frequency of the sweep
+        meta_bits = BitProcessor(8).get_meta_bits(self.max_frequency, CalibrationSweep.VERSION, CalibrationSweep.WAVE_VERSION)
+        meta_sound = np.concatenate(list(self.wave_processor.iter_convert(meta_bits, [])))
+        yield meta_sound
+        meta_end = len(meta_bits) * self._frame_rate / WaveProcessor.META_DATA_FREQ
+        position = len(meta_sound)
+        segment_bits = CalibrationSweep.get_segment_bits()
+        for freq in CalibrationSweep.get_frequencies(self.max_frequency):
+            start = round(meta_end + CalibrationSweep.get_segment_start(self.max_frequency, freq) * self._frame_rate)
+            yield np.zeros(start - position)
+            # without meta bits, only the segment is converted
+            segment_sound = np.concatenate(list(WaveProcessor(freq, self._frame_rate).iter_convert(BitBuffer(), [segment_bits])))
+            _logger.debug(f"Segment of {freq}Hz at {start / self._frame_rate:.3f}s")
+            yield segment_sound
+            position = start + len(segment_sound)
+        yield np.zeros(int(CalibrationSweep.GAP_SEC * self._frame_rate))
@@ -0,0 +1,63 @@
+import math
+import logging
+import numpy as np
+from ..common import BitBuffer
+from .wavep import WaveProcessor
+
+_logger = logging.getLogger(__name__)
+
+class MultiCarrierWaveProcessor(WaveProcessor):
+    # Sends carrier_number bits at once in each symbol, one on/off keyed subcarrier per bit.
+    # The subcarriers are the multiples of the spacing (frequency/carrier_number) up to frequency. They are orthogonal over a symbol of 1/spacing sec.
+    # Each block of bits (the header and every chunk) is sent as 1 silent symbol, REFERENCE_SYMBOL_NUMBER symbols with all subcarriers on, then the bits.
+    # Every symbol is preceded by a cyclic prefix of 1/4 symbol, so a slightly misplaced symbol window still covers whole periods.
+    VERSION = 2
+    MAX_FREQUENCY_RATIO = 0.4 # the subcarriers are detected by FFT, they can go higher than the 1/6 frame rate of the single carrier
+    MIN_SPACING = 1000
+    REFERENCE_SYMBOL_NUMBER = 2
+    def __init__(self, frequency:int, frame_rate:int, carrier_number:int) -> None:
+        assert 2 <= carrier_number <= 255, f"Unexpected carrier number {carrier_number}. Expect between 2 and 255."
+        spacing = frequency // carrier_number
+        assert spacing * carrier_number == frequency, f"The frequency ({frequency}) must be a multiple of the carrier number ({carrier_number})"
+        assert spacing >= self.MIN_SPACING, f"The subcarrier spacing is too small ({spacing}), the minimum is {self.MIN_SPACING}. Lower the carrier number."
+        assert frame_rate % (4 * spacing) == 0, f"The frame rate ({frame_rate}) must be a multiple of 4 times the subcarrier spacing ({spacing})"
+        assert frequency <= frame_rate * self.MAX_FREQUENCY_RATIO, f"The frequency is set too high ({frequency} regarding to the frame rate ({frame_rate}))"
+        super().__init__(spacing, frame_rate)
+        self._carrier_number = carrier_number
+        self._symbol_length = frame_rate // spacing
+        self._prefix_length = self._symbol_length // 4
+        self._symbol_basis = self._gen_symbol_basis()
+        _logger.debug(f"Subcarriers: {carrier_number} x {spacing}Hz, Symbol length: {self._symbol_length}")
+
+    def _gen_symbol_basis(self)->np.ndarray:
+        # One row per subcarrier, from the start of the cyclic prefix to the end of the symbol.
+        # Newman phases keep the peak of the sum low, the amplitude keeps a random sum of the subcarriers under the max volume.
+        carriers = np.arange(1, self._carrier_number + 1)[:, None]
+        phases = np.pi * (carriers - 1)**2 / self._carrier_number
+        positions = np.arange(-self._prefix_length, self._symbol_length)[None, :]
+        amplitude = self._max_volume / (2 * math.sqrt(self._carrier_number))
+        return amplitude * np.sin(2 * np.pi * carriers * positions / self._symbol_length + phases)
+
+    def _modulate(self, bits:np.ndarray)->np.ndarray:
+        symbols = bits.reshape(-1, self._carrier_number).astype(np.float64) @ self._symbol_basis
+        return np.clip(symbols.ravel(), -self._max_volume, self._max_volume)
+
+    def _get_block_sound(self, bits:BitBuffer)->np.ndarray:
+        bit_values = bits.to_array()
+        data = np.zeros(math.ceil(len(bit_values) / self._carrier_number) * self._carrier_number, dtype=np.uint8)
+        data[:len(bit_values)] = bit_values
+        reference = np.ones(self.REFERENCE_SYMBOL_NUMBER * self._carrier_number, dtype=np.uint8)
+        return np.concatenate((self._get_silent_symbol(), self._modulate(reference), self._modulate(data)))
+
+    def _get_silent_symbol(self)->np.ndarray:
+        return np.zeros(self._prefix_length + self._symbol_length)
+
+    def iter_convert(self, meta_bits:BitBuffer, enhanced_bits_blocks):
+        yield self._get_meta_sound(meta_bits)
+        for bits in enhanced_bits_blocks:
+            yield self._get_block_sound(bits)
+        yield self._get_silent_symbol()
+
+    @property
+    def wave_option(self)->int:
+        return self._carrier_number
@@ -1,19 +1,64 @@
 import logging
-import wave
-import struct
+import numpy as np
 from .wavep import WaveProcessor
+from .sinks import SoundSink, WaveFileSink, RawPcmSink
 
 
 _logger = logging.getLogger(__name__)
 
 class OutputWriter:
     VERSION = 1
-    def __init__(self) -> None:
+    STANDARD_OUTPUT = "-" # file path to write raw PCM frames to the standard output instead of a wav file
+    def __init__(self, sample_width:int=2) -> None:
         self._num_channels = 1
+        self._sample_width = sample_width # bytes of the written samples, 1 to 3
 
-    def save(self, wavp:WaveProcessor, sound_data:list[int], file_path:str):
-        _logger.debug(f"Saving sound data to : {file_path}")
-        frames = b''.join([struct.pack('h', int(s)) for s in sound_data])
-        with wave.open(file_path, 'wb') as wav_file:
-            wav_file.setparams((wavp.channel_number, wavp.sample_width, wavp.frame_rate, len(sound_data), 'NONE', 'not compressed'))
-            wav_file.writeframes(frames)
+    def get_sink(self, file_path:str)->SoundSink:
+        if file_path == self.STANDARD_OUTPUT:
+            return RawPcmSink(sample_width=self._sample_width)
+        return WaveFileSink(file_path, self._sample_width)
+
+    def save(self, wavp:WaveProcessor, sound_data:np.ndarray, file_path:str)->int:
+        return self.save_stream(wavp, [sound_data], file_path)
+
+    def save_stream(self, wavp:WaveProcessor, sound_blocks, file_path:str, channel_number:int|None=None)->int:
+        # Returns the bytes of the written frames
+        return self.write_stream(wavp, sound_blocks, self.get_sink(file_path), channel_number)
+
+    def write_stream(self, wavp:WaveProcessor, sound_blocks, sink:SoundSink, channel_number:int|None=None)->int:
+        # With several channels, the blocks are (frames, channels) arrays
+        sink.open(channel_number or wavp.channel_number, wavp.frame_rate, wavp.get_max_volume(wavp.sample_width))
+        frame_number = 0
+        try:
+            for sound_data in sound_blocks:
+                sink.write(sound_data)
+                frame_number += len(sound_data)
+        finally:
+            sink.close()
+        _logger.debug(f"Frame number: {frame_number}")
+        return sink.byte_number
+
+    def save_channels_stream(self, wavp:WaveProcessor, channels_sound_blocks:list, file_path:str)->int:
+        # One iterable of sound blocks per channel, the channels which end first are completed with silence
+        return self.save_stream(wavp, self._interleave(channels_sound_blocks), file_path, len(channels_sound_blocks))
+
+    def _interleave(self, channels_sound_blocks:list):
+        iterators = [iter(sound_blocks) for sound_blocks in channels_sound_blocks]
+        pending = [np.zeros(0) for _ in iterators] # samples of each channel not written yet
+        ended = [False for _ in iterators]
+        while True:
+            for c, iterator in enumerate(iterators):
+                while not ended[c] and len(pending[c]) == 0:
+                    try:
+                        pending[c] = np.asarray(next(iterator))
+                    except StopIteration:
+                        ended[c] = True
+            running = [len(pending[c]) for c in range(len(iterators)) if not ended[c]]
+            frame_number = min(running) if running else max(len(samples) for samples in pending)
+            if frame_number == 0:
+                return
+            frames = np.zeros((frame_number, len(iterators)))
+            for c, samples in enumerate(pending):
+                frames[:min(frame_number, len(samples)), c] = samples[:frame_number]
+                pending[c] = samples[frame_number:]
+            yield frames
@@ -0,0 +1,70 @@
+import logging
+import multiprocessing
+import os
+import zlib
+from ..common.codec import Codec
+from ..common.batch import BatchEntry, BatchManifest
+
+_logger = logging.getLogger(__name__)
+
+def _encode_file(task):
+    # Reads and compresses a file, returns its entry and its stored bytes
+    file_path, name, codec = task
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    file_codec = Codec.estimate(file_path) if codec == "auto" else Codec.by_name(codec)
+    stored = file_codec.compress(content)
+    return BatchEntry(name, len(content), zlib.adler32(content), file_codec.codec_id, len(stored)), stored
+
+
+class BatchPacker:
+    # Packs files into a batch (see BatchManifest) to send them in one transmission.
+    # Each file is compressed on its own in a pool of processes, with the codec of the batch or the one estimated for it with "auto"
+    def __init__(self, codec:str="none", jobs:int=1) -> None:
+        self._codec = codec
+        self._jobs = jobs
+
+    @staticmethod
+    def list_files(input_paths:list[str])->list[tuple[str, str]]:
+        # The files to pack and their names in the batch: a file is named after itself, the files of a directory after their path in it
+        files = []
+        for input_path in input_paths:
+            if not os.path.isdir(input_path):
+                files.append((input_path, os.path.basename(input_path)))
+                continue
+            for directory, sub_directories, file_names in os.walk(input_path):
+                sub_directories.sort()
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(directory, file_name)
+                    files.append((file_path, os.path.relpath(file_path, input_path).replace(os.sep, "/")))
+        names = [name for _, name in files]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Several files are named {duplicates} in the batch")
+        return files
+
+    def pack(self, input_paths:list[str], batch_file_path:str)->list[BatchEntry]:
+        files = self.list_files(input_paths)
+        _logger.info(f"Packing {len(files)} files with {self._jobs} processes...")
+        tasks = [(file_path, name, self._codec) for file_path, name in files]
+        # The manifest has the same length whatever the sizes, it's written again once they are known
+        entries = [BatchEntry(name, 0, 0) for _, name in files]
+        with open(batch_file_path, 'wb') as f:
+            f.write(BatchManifest.to_bytes(entries))
+            if self._jobs > 1 and len(tasks) > 1:
+                with multiprocessing.Pool(min(self._jobs, len(tasks))) as pool:
+                    entries = self._write_files(f, pool.imap(_encode_file, tasks))
+            else:
+                entries = self._write_files(f, map(_encode_file, tasks))
+            f.seek(0)
+            f.write(BatchManifest.to_bytes(entries))
+        return entries
+
+    @staticmethod
+    def _write_files(f, encoded_files)->list[BatchEntry]:
+        entries = []
+        for entry, stored in encoded_files:
+            _logger.debug(f"{entry.name}: {entry.size} bytes stored in {entry.stored_size} with {Codec.by_id(entry.codec_id).name}")
+            f.write(stored)
+            entries.append(entry)
+        return entries
@@ -1,45 +1,163 @@
+import hashlib
+import io
 import logging
+import os
+import tempfile
 import zlib
+from ..common.codec import Codec
+from ..common.metrics import Metrics
+from ..common.batch import BatchManifest
+from ..common.delta import Delta
 
 _logger = logging.getLogger(__name__)
 
 class InputReader:
     # Responsible of IO, compression, encryption
     VERSION = 1
-    def __init__(self, input_filepath:str) -> None:
+    COMPRESSED_VERSION = 2 # the content is compressed, the codec is given in the header
+    BATCH_VERSION = 3 # the content is a batch of files (see BatchManifest), its content type is given in the header
+    DELTA_VERSION = 4 # the content is a Delta against a base file, compressed or not
+    BLOCK_SIZE = 1024*1024
+    def __init__(self, input_filepath:str, codec:str="none", metrics:Metrics|None=None, content_type:int=0, base_checksum:int=0) -> None:
+        # codec is a Codec name or "auto" to choose the one compressing the most.
+        # content_type is BatchManifest.CONTENT_TYPE for a batch packed by BatchPacker (its files are already compressed),
+        # Delta.CONTENT_TYPE for a delta made by DeltaEncoder (base_checksum is the Adler-32 of its base file), 0 for a file
+        assert content_type != BatchManifest.CONTENT_TYPE or codec == "none", "The files of a batch are compressed on their own"
         self._input_filepath = input_filepath
+        self.content_type = content_type
+        self.base_checksum = base_checksum
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._codec = None if codec == "auto" else Codec.by_name(codec)
+        self._compressed_file = None # temporary file of the compressed content
+        self._compressed_size = None
         self._file_stream = None
         self._checksum = None
+        self._source_checksum = None # Adler-32 of the file, the checksum of the content when it's not compressed
+        self._digest = None
+        self._content = None # the file read in memory by load
 
     def __enter__(self):
         return self
 
+    @property
+    def codec(self)->Codec:
+        if self._codec is None:
+            with self._metrics.stage("codec"):
+                self._codec = Codec.estimate(self._input_filepath)
+            _logger.debug(f"Estimated codec: {self._codec.name}")
+        return self._codec
+
+    @property
+    def version(self)->int:
+        if self.content_type == BatchManifest.CONTENT_TYPE:
+            return self.BATCH_VERSION
+        if self.content_type == Delta.CONTENT_TYPE:
+            return self.DELTA_VERSION
+        return self.VERSION if self.codec.codec_id == 0 else self.COMPRESSED_VERSION
+
+    def load(self):
+        # Reads the file in memory once, computing its checksum and its digest during the read: the content is then sent,
+        # compressed and hashed from memory instead of reading the file again for each
+        if self._content is None:
+            self._read_source(keep=True)
+
+    def _read_source(self, keep:bool=False):
+        _logger.debug("Calculating checksum...")
+        with self._metrics.stage("checksum", bytes=os.path.getsize(self._input_filepath)), open(self._input_filepath, 'rb') as f: # read on its own, the file stream can be opened
+            checksum = zlib.adler32(b"")
+            digest = hashlib.blake2b(digest_size=20)
+            content = io.BytesIO() if keep else None
+            while block := f.read(self.BLOCK_SIZE):
+                checksum = zlib.adler32(block, checksum)
+                digest.update(block)
+                if keep:
+                    content.write(block)
+        self._source_checksum = checksum
+        self._digest = digest.hexdigest()
+        self._content = content
+        _logger.debug(f"Checksum:{self._source_checksum}")
+
+    def _open_source(self):
+        if self._content is not None:
+            self._content.seek(0)
+            return self._content
+        return open(self._input_filepath, 'rb')
+
+    @property
+    def digest(self)->str:
+        # Strong hash of the file (before compression), to address it by its content
+        if self._digest is None:
+            self._read_source()
+        return self._digest
+
+    def _compress(self):
+        # The content is compressed once to a temporary file, its size and checksum must be known before sending it
+        _logger.debug(f"Compressing with {self.codec.name}...")
+        with self._metrics.stage("compress", bytes=os.path.getsize(self._input_filepath)):
+            self._compressed_file = tempfile.TemporaryFile()
+            compressor = self.codec.compressor()
+            checksum = zlib.adler32(b"")
+            f = self._open_source()
+            try:
+                while block := f.read(self.BLOCK_SIZE):
+                    compressed = compressor.compress(block)
+                    checksum = zlib.adler32(compressed, checksum)
+                    self._compressed_file.write(compressed)
+            finally:
+                if f is not self._content:
+                    f.close()
+            compressed = compressor.flush()
+            self._checksum = zlib.adler32(compressed, checksum)
+            self._compressed_file.write(compressed)
+            self._compressed_size = self._compressed_file.tell()
+        _logger.info(f"Compressed from {os.path.getsize(self._input_filepath)} to {self._compressed_size} bytes with {self.codec.name}")
+
     def open(self):
         if self._file_stream is not None:
             raise Exception("File stream is already opened")
-        self._file_stream = open(self._input_filepath, 'rb')
+        if self.codec.codec_id == 0:
+            self._file_stream = self._open_source()
+            return self
+        if self._compressed_file is None:
+            self._compress()
+        self._compressed_file.seek(0)
+        self._file_stream = self._compressed_file
         return self
-    
+
     def read(self, nb_bytes=0):
-        if nb_bytes == 0:
-            return self._file_stream.read()
-        else:
-            return self._file_stream.read(nb_bytes)
-    
+        with self._metrics.stage("read"):
+            data = self._file_stream.read() if nb_bytes == 0 else self._file_stream.read(nb_bytes)
+        self._metrics.count("read", bytes=len(data))
+        return data
+
+    def seek(self, offset:int):
+        return self._file_stream.seek(offset)
+
     @property
     def checksum(self):
         if self._checksum is None:
-            _logger.debug("Calculating checksum...")
-            self.close()
-            with self.open() as f:
-                self._checksum = zlib.adler32(f.read())
-                _logger.debug(f"Checksum:{self._checksum}")
+            if self.codec.codec_id != 0:
+                self._compress() # gives the checksum of the compressed content
+                return self._checksum
+            if self._source_checksum is None:
+                self._read_source()
+            self._checksum = self._source_checksum
         return self._checksum
 
+    @property
+    def size(self)->int:
+        # Size of the content to send
+        if self.codec.codec_id == 0:
+            return os.path.getsize(self._input_filepath)
+        if self._compressed_file is None:
+            self._compress()
+        return self._compressed_size
+
     def close(self):
         if self._file_stream is not None:
-            self._file_stream.close()
+            if self._file_stream is not self._compressed_file and self._file_stream is not self._content: # the compressed or loaded content is kept until the reader is deleted
+                self._file_stream.close()
             self._file_stream = None
-    
+
     def __exit__(self, exc_type, exc_value, traceback):
-        self.close()
\ No newline at end of file
+        self.close()
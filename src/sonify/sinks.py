@@ -0,0 +1,85 @@
+import logging
+import sys
+from abc import ABC, abstractmethod
+import wave
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+class SoundSink(ABC):
+    # Where the frames of the sound go. The sound blocks are float samples at the scale of volume_scale (the max volume of
+    # the wave processor), (frames,) arrays or (frames, channels) ones with several channels. They are converted to little endian
+    # PCM samples of sample_width bytes (8 bits samples are unsigned) with a cast of the whole block
+    SAMPLE_WIDTHS = (1, 2, 3)
+
+    def __init__(self, sample_width:int=2) -> None:
+        assert sample_width in self.SAMPLE_WIDTHS, f"Unexpected sample width {sample_width}. Expect one of {self.SAMPLE_WIDTHS}."
+        self.sample_width = sample_width
+        self._scale = 1.0
+        self.byte_number = 0 # written so far
+
+    def open(self, channel_number:int, frame_rate:int, volume_scale:float):
+        self._scale = float(2**(8*self.sample_width-1)-1) / volume_scale
+
+    def write(self, sound_data:np.ndarray):
+        frames = self.to_frames(sound_data)
+        self._write_frames(frames)
+        self.byte_number += len(frames)
+
+    @abstractmethod
+    def _write_frames(self, frames:bytes):
+        pass
+
+    def close(self):
+        pass
+
+    def to_frames(self, sound_data:np.ndarray)->bytes:
+        # float to int conversion truncates toward zero, as int() does
+        sound_data = np.asarray(sound_data)
+        if self._scale != 1.0:
+            sound_data = sound_data * self._scale
+        if self.sample_width == 1:
+            return (sound_data.astype(np.int16) + 128).astype(np.uint8).tobytes()
+        if self.sample_width == 3:
+            return sound_data.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        return sound_data.astype('<i2').tobytes()
+
+
+class WaveFileSink(SoundSink):
+    # A wav file, the frame count in its header is patched by the wave module when it's closed
+    def __init__(self, file_path:str, sample_width:int=2) -> None:
+        super().__init__(sample_width)
+        self._file_path = file_path
+        self._wav_file = None
+
+    def open(self, channel_number:int, frame_rate:int, volume_scale:float):
+        super().open(channel_number, frame_rate, volume_scale)
+        _logger.debug(f"Saving sound data to : {self._file_path}")
+        self._wav_file = wave.open(self._file_path, 'wb')
+        self._wav_file.setparams((channel_number, self.sample_width, frame_rate, 0, 'NONE', 'not compressed'))
+
+    def _write_frames(self, frames:bytes):
+        self._wav_file.writeframesraw(frames)
+
+    def close(self):
+        if self._wav_file is not None:
+            self._wav_file.close()
+            self._wav_file = None
+
+
+class RawPcmSink(SoundSink):
+    # Raw PCM frames written to a binary stream as they are converted, the standard output by default,
+    # e.g. to play them with aplay -t raw -f S16_LE -r <frame rate> -c <channels>
+    def __init__(self, stream=None, sample_width:int=2) -> None:
+        super().__init__(sample_width)
+        self._stream = stream if stream is not None else sys.stdout.buffer
+
+    def open(self, channel_number:int, frame_rate:int, volume_scale:float):
+        super().open(channel_number, frame_rate, volume_scale)
+        _logger.debug(f"Writing raw PCM frames: {frame_rate}Hz, {self.sample_width} bytes, {channel_number} channel(s)")
+
+    def _write_frames(self, frames:bytes):
+        self._stream.write(frames)
+
+    def close(self):
+        self._stream.flush()
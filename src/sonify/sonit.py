@@ -1,41 +1,175 @@
 import logging
+import os
+import tempfile
+import numpy as np
 from .bitp import BitProcessor
 from .wavep import WaveProcessor
+from .mcwavep import MultiCarrierWaveProcessor
+from .constwavep import ConstellationWaveProcessor
 from .output import OutputWriter
 from .readfile import InputReader
+from .packbatch import BatchPacker
+from .encodedelta import DeltaEncoder
+from .gensweep import SweepGenerator
+from .wavecache import WaveCache
+from ..common.metrics import Metrics
+from ..common.batch import BatchManifest
+from ..common.delta import Delta
 
 _logger = logging.getLogger(__name__)
 
 class SonifyWorkflow:
     VERSION = 1
     # Compatible to work with : 
-    #     InputReader Version 1
-    #     BitProcessor Version 1
+    #     InputReader Version 1 (2 when compressed, 3 for a batch of files, 4 for a delta)
+    #     BitProcessor Version 1 (2 with FEC or chunk CRC)
     #     WaveProcessor Version 1
+    #     MultiCarrierWaveProcessor Version 2
+    #     ConstellationWaveProcessor Version 3
     #     OutputWriter Version 1
+    #     WaveCache Version 1
 
-    def __init__(self, frequency:int, frame_rate:int, chunk_kb_size:int) -> None:
+    def __init__(self, frequency:int, frame_rate:int, chunk_kb_size:int, streaming:bool=False, carrier_number:int=1, bits_per_cycle:int=1, channel_number:int=1, codec:str="none", fec_parity_number:int=0, chunk_crc:bool=False, metrics:Metrics|None=None, sample_width:int=2, cache:WaveCache|None=None) -> None:
         self._freq = frequency
         self._frame_rate = frame_rate
         self._chunk_kb_size = chunk_kb_size
         self._one_bit_cycle_number = 1
+        self._streaming = streaming # read, convert and save chunk by chunk to keep the memory usage bounded by the chunk size
+        self._carrier_number = carrier_number # more than 1 to send the bits on parallel subcarriers up to frequency
+        self._bits_per_cycle = bits_per_cycle # more than 1 to send the bits by the phase and amplitude of the cycles
+        assert carrier_number == 1 or bits_per_cycle == 1, "The multi carrier and the constellation modes cannot be used together"
+        self._channel_number = channel_number # the chunks are striped across the channels of the wave file
+        self._codec = codec # compression of the file content, a Codec name or "auto"
+        self._fec_parity_number = fec_parity_number # Reed-Solomon parity bytes per codeword of the chunk data, 0 for none
+        self._chunk_crc = chunk_crc # each chunk carries the CRC-32 of its data, so that the good chunks can be kept from a damaged recording
+        self._sample_width = sample_width # bytes of the written samples, 1 to 3
+        self._cache = cache # the wav files already generated are copied from it instead of converting the file again
+        self.metrics = metrics if metrics is not None else Metrics() # stages: pack (batch), delta, codec, cache, compress, checksum, read, bitit, synth, write
+
+    def _get_wave_processor(self)->WaveProcessor:
+        if self._carrier_number > 1:
+            return MultiCarrierWaveProcessor(self._freq, self._frame_rate, self._carrier_number)
+        if self._bits_per_cycle > 1:
+            return ConstellationWaveProcessor(self._freq, self._frame_rate, self._bits_per_cycle)
+        return WaveProcessor(self._freq, self._frame_rate, self._one_bit_cycle_number)
 
     def execute(self, input_filepath:str, output_filepath:str):
+        self._execute(InputReader(input_filepath, self._codec, self.metrics), output_filepath)
+
+    def execute_batch(self, input_paths:list[str], output_filepath:str, jobs:int=1):
+        # Sends files and the files of directories as one transmission, unpacked to a directory by the demodulation.
+        # The files are compressed with the codec of the workflow in jobs processes
+        with tempfile.TemporaryDirectory(prefix="buzzbatch") as temp_dir:
+            batch_path = os.path.join(temp_dir, "batch")
+            with self.metrics.stage("pack"):
+                entries = BatchPacker(self._codec, jobs).pack(input_paths, batch_path)
+            self.metrics.count("pack", bytes=sum(entry.size for entry in entries))
+            _logger.info(f"{len(entries)} files packed in {os.path.getsize(batch_path)} bytes")
+            self._execute(InputReader(batch_path, "none", self.metrics, BatchManifest.CONTENT_TYPE), output_filepath)
+
+    def execute_delta(self, input_filepath:str, base_filepath:str, output_filepath:str):
+        # Sends only what differs from a base file the receiver has, which rebuilds the file from it
+        with tempfile.TemporaryDirectory(prefix="buzzdelta") as temp_dir:
+            delta_path = os.path.join(temp_dir, "delta")
+            with self.metrics.stage("delta"):
+                header = DeltaEncoder().encode(base_filepath, input_filepath, delta_path)
+            self.metrics.count("delta", bytes=header.size)
+            self._execute(InputReader(delta_path, self._codec, self.metrics, Delta.CONTENT_TYPE, header.base_checksum), output_filepath)
+
+    def execute_calibration(self, output_filepath:str):
+        # Writes the calibration sweep for the frame rate of the workflow instead of a file, the frequency and the chunk size
+        # are then chosen from its recording (DemodWorkflow.execute_calibration)
+        generator = SweepGenerator(self._frame_rate)
+        _logger.info(f"Calibration sweep up to {generator.max_frequency}Hz")
+        writer = OutputWriter(self._sample_width)
+        self._write(writer.save_stream, generator.wave_processor, self.metrics.iter_stage("synth", generator.iter_sound(), lambda sound_data: {"samples": len(sound_data)}), output_filepath)
+
+    def _execute(self, reader:InputReader, output_filepath:str):
         # put them at the beginning to check input values before starting the workflow
-        wavp = WaveProcessor(self._freq, self._frame_rate, self._one_bit_cycle_number) 
-        bitp = BitProcessor(self._chunk_kb_size*8*1024)
-        writer = OutputWriter()
+        wavp = self._get_wave_processor()
+        bitp = BitProcessor(self._chunk_kb_size*8*1024, self._fec_parity_number, self._chunk_crc)
+        writer = OutputWriter(self._sample_width)
 
         _logger.info("Reading file...")
-        reader = InputReader(input_filepath)
-        checksum = reader.checksum
+        _logger.info(f"Codec: {reader.codec.name}")
+        if not self._streaming:
+            reader.load() # the checksum is computed while reading the content for its conversion
+
+        cache_key = None
+        if self._cache is not None and output_filepath != OutputWriter.STANDARD_OUTPUT:
+            with self.metrics.stage("cache"):
+                cache_key = self._get_cache_key(reader, wavp, bitp)
+                hit = self._cache.fetch(cache_key, output_filepath)
+            self.metrics.count("cache", hits=int(hit), misses=int(not hit))
+            if hit:
+                _logger.info("Copied from the cache")
+                return
+
+        self._convert(wavp, bitp, writer, reader, output_filepath)
+        if cache_key is not None:
+            with self.metrics.stage("cache"):
+                self._cache.store(cache_key, output_filepath)
+
+    def _get_cache_key(self, reader:InputReader, wavp:WaveProcessor, bitp:BitProcessor)->str:
+        # Everything the generated sound depends on. The streaming mode is not in it, it gives the same sound
+        return WaveCache.get_key(digest=reader.digest, codec=reader.codec.name, content_type=reader.content_type, base_checksum=reader.base_checksum,
+                                 frequency=self._freq, frame_rate=self._frame_rate, chunk_kb_size=self._chunk_kb_size,
+                                 one_bit_cycle_number=self._one_bit_cycle_number, carrier_number=self._carrier_number,
+                                 bits_per_cycle=self._bits_per_cycle, channel_number=self._channel_number,
+                                 fec_parity_number=self._fec_parity_number, chunk_crc=self._chunk_crc, sample_width=self._sample_width,
+                                 workflow_version=self.VERSION, reader_version=reader.version, bitp_version=bitp.version,
+                                 wave_version=wavp.VERSION, wave_option=wavp.wave_option, writer_version=OutputWriter.VERSION)
+
+    def _convert(self, wavp:WaveProcessor, bitp:BitProcessor, writer:OutputWriter, reader:InputReader, output_filepath:str):
+        if self._channel_number > 1:
+            self._execute_channels(wavp, bitp, writer, reader, output_filepath)
+            return
+
+        if self._streaming:
+            with reader.open() as f:
+                _logger.info("Processing, converting and saving file as a stream...")
+                meta_bits, enhanced_bits_blocks = self._bitit(bitp, f, reader, wavp)
+                self._write(writer.save_stream, wavp, self._synth(wavp, meta_bits, enhanced_bits_blocks), output_filepath)
+            return
 
         with reader.open() as f:
             _logger.info("Processing file...")
-            meta_bits, enhanced_bits = bitp.bitit(f, checksum, self._freq, InputReader.VERSION, WaveProcessor.VERSION)
+            meta_bits, enhanced_bits_blocks = self._bitit(bitp, f, reader, wavp)
+            enhanced_bits_blocks = list(enhanced_bits_blocks)
 
         _logger.info("Converting to sound...")
-        sound_data = wavp.convert(meta_bits, enhanced_bits)
+        sound_data = np.concatenate(list(self._synth(wavp, meta_bits, enhanced_bits_blocks)))
 
         _logger.info("Saving to file...")
-        writer.save(wavp, sound_data, output_filepath)
\ No newline at end of file
+        self._write(writer.save, wavp, sound_data, output_filepath)
+
+    def _bitit(self, bitp:BitProcessor, f, reader:InputReader, wavp:WaveProcessor, channel_index:int=0):
+        # The bits of each block are timed as they are pulled
+        file_size, checksum, codec_id = reader.size, reader.checksum, reader.codec.codec_id
+        with self.metrics.stage("bitit"):
+            meta_bits, enhanced_bits_blocks = bitp.bitit_stream(f, file_size, checksum, wavp.meta_frequency, reader.version, wavp.VERSION, wavp.wave_option,
+                                                                channel_index, self._channel_number, codec_id, reader.content_type,
+                                                                reader.base_checksum)
+        return meta_bits, self.metrics.iter_stage("bitit", enhanced_bits_blocks, lambda bits: {"bits": len(bits)})
+
+    def _synth(self, wavp:WaveProcessor, meta_bits, enhanced_bits_blocks):
+        return self.metrics.iter_stage("synth", wavp.iter_convert(meta_bits, enhanced_bits_blocks), lambda sound_data: {"samples": len(sound_data)})
+
+    def _write(self, save, wavp:WaveProcessor, sound, output_filepath:str):
+        # The sound blocks of a stream are converted while they are written, their conversion is timed apart
+        with self.metrics.stage("write"):
+            byte_number = save(wavp, sound, output_filepath)
+        self.metrics.count("write", bytes=byte_number)
+
+    def _execute_channels(self, wavp:WaveProcessor, bitp:BitProcessor, writer:OutputWriter, reader:InputReader, output_filepath:str):
+        # Each channel is converted on its own, its chunks are read from the file while the channels are written together
+        with reader.open() as f:
+            channels_sound_blocks = []
+            for channel_index in range(self._channel_number):
+                meta_bits, enhanced_bits_blocks = self._bitit(bitp, f, reader, wavp, channel_index)
+                channels_sound_blocks.append(self._synth(wavp, meta_bits, enhanced_bits_blocks))
+            if not self._streaming:
+                _logger.info("Processing and converting to sound...")
+                channels_sound_blocks = [[np.concatenate(list(sound_blocks))] for sound_blocks in channels_sound_blocks]
+            _logger.info(f"Saving {self._channel_number} channels to file...")
+            self._write(writer.save_channels_stream, wavp, channels_sound_blocks, output_filepath)
@@ -0,0 +1,72 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+class WaveCache:
+    # On-disk cache of the generated wav files, addressed by their content: the key is a hash of the digest of the content sent and of
+    # every parameter and component version the sound depends on, so a cached sound is never returned for other settings.
+    # The entries are evicted least recently used first (their modification time is updated when they are used) to keep the
+    # cache under max_bytes
+    VERSION = 1
+    SUFFIX = ".wav"
+
+    def __init__(self, directory:str, max_bytes:int) -> None:
+        assert max_bytes > 0, f"Bad cache size: {max_bytes}"
+        self._directory = directory
+        self._max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def get_key(cls, **values)->str:
+        # values are the digest of the content and the parameters of the sound, their order does not matter
+        description = ";".join(f"{name}={values[name]}" for name in sorted(values))
+        return hashlib.blake2b(f"{cls.VERSION};{description}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def _get_path(self, key:str)->str:
+        return os.path.join(self._directory, key + self.SUFFIX)
+
+    def fetch(self, key:str, output_filepath:str)->bool:
+        # Copies the cached sound of key to output_filepath, False when there is none
+        path = self._get_path(key)
+        try:
+            shutil.copyfile(path, output_filepath)
+        except FileNotFoundError:
+            return False
+        os.utime(path) # most recently used
+        _logger.debug(f"Cache hit: {path}")
+        return True
+
+    def store(self, key:str, wave_filepath:str):
+        # Copies a generated wav file to the cache, through a temporary file so that a partial entry is never fetched
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self._directory)
+        os.close(fd)
+        try:
+            shutil.copyfile(wave_filepath, temp_path)
+            os.replace(temp_path, self._get_path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        _logger.debug(f"Cached as {self._get_path(key)}")
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self._directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            _logger.debug(f"Evicting {path} from the cache")
+            try:
+                os.remove(path)
+            except FileNotFoundError: # evicted by another process
+                pass
+            total -= size
@@ -1,5 +1,7 @@
 import math
 import logging
+import numpy as np
+from ..common import BitBuffer
 
 _logger = logging.getLogger(__name__)
 
@@ -21,6 +23,7 @@ class WaveProcessor:
         self._num_channels = 1
         self._one_bit_cycle_frame:float = self._one_bit_cycle_number / float(frequency) * float(frame_rate)
         assert self._one_bit_cycle_frame >= 6.0, f"Too few frames for one cycle. Got {self._one_bit_cycle_frame}, the minimum is 6." 
+        self._cycle_tables:dict[int, np.ndarray] = {}
 
     def get_max_volume(self, sample_width=2):
         return float(2**(8*sample_width-1)-1)
@@ -29,39 +32,82 @@ class WaveProcessor:
         one_bit_duration = one_bit_cycle_number/freq 
         return math.ceil(bits_number * one_bit_duration * self._frame_rate)
 
-    def _gen_full_init_sound(self, freq:int, sample_number:int):
-        _freq = float(freq)
-        _frame_rate = float(self._frame_rate)
-        return [self._max_volume * math.sin(2 * math.pi * _freq * (x / _frame_rate)) for x in range(sample_number)]
+    def _get_cycle_table(self, freq:int)->np.ndarray:
+        # The carrier repeats itself every frame_rate/gcd(freq, frame_rate) samples, so only one period is computed.
+        # Each value is computed the same way as a full length carrier to keep the output samples unchanged.
+        if freq not in self._cycle_tables:
+            period = self._frame_rate // math.gcd(freq, self._frame_rate)
+            _freq = float(freq)
+            _frame_rate = float(self._frame_rate)
+            self._cycle_tables[freq] = np.array([self._max_volume * math.sin(2 * math.pi * _freq * (x / _frame_rate)) for x in range(period)])
+            _logger.debug(f"Cycle table of {freq}Hz: {period} samples")
+        return self._cycle_tables[freq]
+
+    def _gen_full_init_sound(self, freq:int, sample_number:int, start_sample:int=0)->np.ndarray:
+        table = self._get_cycle_table(freq)
+        if start_sample == 0:
+            return np.resize(table, sample_number)
+        return table[np.arange(start_sample, start_sample + sample_number) % len(table)]
     
-    def _get_meta_sound(self, meta_bits:str)->list[int]:
+    def _get_meta_sound(self, meta_bits:BitBuffer)->np.ndarray:
         sample_number = self._get_sample_number(self.META_DATA_FREQ, 1, len(meta_bits))
         init_sound = self._gen_full_init_sound(self.META_DATA_FREQ, sample_number)
         one_bit_cycle_frame = 1 / self.META_DATA_FREQ * self._frame_rate
-        meta_sound = self._mask_sound_by_bits(init_sound, one_bit_cycle_frame, meta_bits)
+        bit_ends, _ = self._get_bit_ends(one_bit_cycle_frame, len(meta_bits))
+        meta_sound = self._mask_sound_by_bits(init_sound, bit_ends, meta_bits)
         return meta_sound
     
-    def _mask_sound_by_bits(self, init_sound:list[int], one_bit_cycle_frame:int, bits:str)->list[int]:
+    def _get_bit_ends(self, one_bit_cycle_frame:float, bits_number:int, start_real_position:float=0.0):
+        # The bit boundaries are accumulated (not multiplied) to get exactly the same float positions as a bit by bit walk
+        # Returns the sample index where each bit ends and the real position after the last bit
+        steps = np.full(bits_number + 1, one_bit_cycle_frame)
+        steps[0] = start_real_position
+        real_positions = np.cumsum(steps)
+        return real_positions[1:].astype(np.int64), float(real_positions[-1])
+
+    def _mask_sound_by_bits(self, init_sound:np.ndarray, bit_ends:np.ndarray, bits:BitBuffer, start_sample:int=0)->np.ndarray:
+        # init_sound begins at start_sample which is where the first bit starts
+        bit_values = bits.to_array()
+        mask = np.repeat(bit_values, np.diff(bit_ends, prepend=start_sample))
         sound_data = init_sound.copy()
-        current_real_position = 0.0
-        next_starting_position = 0
-        for b in bits:
-            next_real_position = current_real_position + one_bit_cycle_frame
-            next_entire_position = int(next_real_position)
-            if b=="0":
-                for i in range(next_starting_position, next_entire_position):
-                    sound_data[i] = 0
-            current_real_position = next_real_position
-            next_starting_position = next_entire_position
+        sound_data[:len(mask)] *= mask
         return sound_data
     
-    def convert(self, meta_bits:str, enhanced_bits:str)->list[int]:
+    def convert(self, meta_bits:BitBuffer, enhanced_bits:BitBuffer)->np.ndarray:
+        return self.convert_blocks(meta_bits, [enhanced_bits])
+
+    def convert_blocks(self, meta_bits:BitBuffer, enhanced_bits_blocks)->np.ndarray:
         _logger.debug("Converting...")
-        sample_number = self._get_sample_number(self._freq, self._one_bit_cycle_number, len(enhanced_bits))
+        return np.concatenate(list(self.iter_convert(meta_bits, enhanced_bits_blocks)))
+
+    def iter_convert(self, meta_bits:BitBuffer, enhanced_bits_blocks):
+        # Yields the sound block by block. The carrier phase and the bit boundaries continue from one block to the next
+        yield self._get_meta_sound(meta_bits)
+        bits_number = 0
+        current_sample = 0
+        current_real_position = 0.0
+        for bits in enhanced_bits_blocks:
+            if not bits:
+                continue
+            bits_number += len(bits)
+            bit_ends, current_real_position = self._get_bit_ends(self._one_bit_cycle_frame, len(bits), current_real_position)
+            next_sample = int(bit_ends[-1])
+            init_sound = self._gen_full_init_sound(self._freq, next_sample - current_sample, current_sample)
+            yield self._mask_sound_by_bits(init_sound, bit_ends, bits, current_sample)
+            current_sample = next_sample
+        sample_number = self._get_sample_number(self._freq, self._one_bit_cycle_number, bits_number)
         _logger.debug(f"Sample number:{sample_number}")
-        full_init_sound = self._gen_full_init_sound(self._freq, sample_number)
-        sound_data = self._get_meta_sound(meta_bits) + self._mask_sound_by_bits(full_init_sound, self._one_bit_cycle_frame, enhanced_bits)
-        return sound_data
+        yield self._gen_full_init_sound(self._freq, sample_number - current_sample, current_sample) # the samples after the last bit end are not masked
+
+    @property
+    def meta_frequency(self)->int:
+        # The frequency sent in the meta data
+        return self._freq
+
+    @property
+    def wave_option(self)->int:
+        # Wave version specific parameter sent in the reserved bits of the meta data
+        return 0
 
     @property
     def channel_number(self):
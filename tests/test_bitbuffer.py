@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from src.common.bitbuffer import BitBuffer
+
+def _random_bits(number:int, seed:int=0)->str:
+    # The "0"/"1" string the buffers are checked against
+    return "".join(map(str, np.random.default_rng(seed).integers(0, 2, number)))
+
+def _check(buffer:BitBuffer, bits:str):
+    assert str(buffer) == bits
+    assert len(buffer) == len(bits)
+    padded = bits + "0" * (-len(bits) % 8) # the padding bits are 0
+    assert buffer.tobytes() == bytes(int(padded[i:i + 8], 2) for i in range(0, len(padded), 8))
+
+def test_from_bytes():
+    _check(BitBuffer.from_bytes(b"\x0f\xa0"), "0000111110100000")
+    _check(BitBuffer(b"\xff\xff", 12), "111111111111")
+
+@pytest.mark.parametrize("first_length", [0, 1, 7, 8, 9, 13, 16])
+@pytest.mark.parametrize("second_length", [0, 1, 5, 8, 11, 24])
+def test_append(first_length, second_length):
+    # Onto a buffer which ends in the middle of a byte or on a byte boundary
+    first, second = _random_bits(first_length, 1), _random_bits(second_length, 2)
+    buffer = BitBuffer.from_str(first)
+    assert buffer.append(BitBuffer.from_str(second)) is buffer
+    _check(buffer, first + second)
+
+def test_append_several_times():
+    buffer = BitBuffer()
+    bits = ""
+    for n in range(1, 20):
+        buffer.append(_random_bits(n, n))
+        bits += _random_bits(n, n)
+    _check(buffer, bits)
+
+def test_add_does_not_change_the_operands():
+    first, second = BitBuffer.from_str("10110"), BitBuffer.from_str("011")
+    _check(first + second, "10110011")
+    _check(first, "10110")
+    _check(second, "011")
+
+@pytest.mark.parametrize("offset", [0, 3, 8, 13])
+@pytest.mark.parametrize("value, width", [(0, 1), (1, 1), (5, 3), (0xa5, 8), (0x1234, 13), (2**32 - 1, 32), (2**64 - 2, 64)])
+def test_append_int(offset, value, width):
+    buffer = BitBuffer.from_str(_random_bits(offset)).append_int(value, width)
+    _check(buffer, _random_bits(offset) + format(value, f"0{width}b"))
+    assert buffer.to_int(offset, width) == value
+
+def test_append_int_out_of_range():
+    with pytest.raises(AssertionError):
+        BitBuffer().append_int(8, 3)
+
+@pytest.mark.parametrize("start", [0, 1, 7, 8, 9, 30])
+@pytest.mark.parametrize("width", [0, 1, 6, 8, 17, 33])
+def test_to_int(start, width):
+    bits = _random_bits(80)
+    assert BitBuffer.from_str(bits).to_int(start, width) == int("0" + bits[start:start + width], 2)
+
+def test_to_int_of_slices():
+    bits = _random_bits(100)
+    buffer = BitBuffer.from_str(bits)
+    for start, stop in [(0, 100), (3, 40), (8, 24), (13, 14), (50, 50), (-20, -3)]:
+        _check(buffer[start:stop], bits[start:stop])
+        assert buffer[start:stop].to_int() == int("0" + bits[start:stop], 2)
+
+def test_to_int_out_of_the_buffer():
+    with pytest.raises(AssertionError):
+        BitBuffer.from_str("1010").to_int(2, 3)
+
+def test_get_bits():
+    bits = _random_bits(20)
+    buffer = BitBuffer.from_str(bits)
+    assert [buffer[i] for i in range(-20, 20)] == [int(bit) for bit in bits + bits]
+    with pytest.raises(IndexError):
+        buffer[20]
+
+@pytest.mark.parametrize("sub", ["1", "0", "111", "1010", "0000000", "11111111111111111111", ""])
+@pytest.mark.parametrize("start, end", [(0, None), (5, None), (9, 60), (33, 40), (50, 10)])
+def test_find(sub, start, end):
+    bits = _random_bits(64, 3)
+    expected = bits[:end].find(sub, start)
+    if end is not None and end <= start:
+        expected = start if not sub else -1
+    assert BitBuffer.from_str(bits).find(sub, start, end) == expected
+    assert BitBuffer.from_str(bits).find(BitBuffer.from_str(sub), start, end) == expected
+
+@pytest.mark.parametrize("bits, ones, zeros", [("", 0, 0), ("1", 1, 0), ("0", 0, 1), ("1110100", 3, 0), ("0001", 0, 3),
+                                               ("1" * 20, 20, 0), ("1" * 9 + "0", 9, 0), ("0" * 16 + "1", 0, 16)])
+def test_count_leading(bits, ones, zeros):
+    buffer = BitBuffer.from_str(bits)
+    assert (buffer.count_leading(1), buffer.count_leading(0)) == (ones, zeros)
+    if len(bits) > 3:
+        assert buffer[3:].count_leading(int(bits[3])) == len(bits[3:]) - len(bits[3:].lstrip(bits[3]))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from src.common.bitbuffer import BitBuffer
+from src.common.chunkfec import ChunkFec
+
+CHUNK_BIT_SIZE = 1024*8
+
+def _get_chunk(seed:int=0)->BitBuffer:
+    return BitBuffer.from_bytes(np.random.default_rng(seed).bytes(CHUNK_BIT_SIZE // 8))
+
+def _flip(frame_bits:BitBuffer, positions:list)->BitBuffer:
+    bits = frame_bits.to_array().copy()
+    bits[positions] ^= 1
+    return BitBuffer.from_array(bits)
+
+@pytest.mark.parametrize("parity_number, crc", [(0, True), (16, False), (16, True), (ChunkFec.MAX_PARITY_NUMBER, True)])
+def test_encode_and_decode(parity_number, crc):
+    fec = ChunkFec(parity_number, CHUNK_BIT_SIZE, crc)
+    frame_bits = fec.encode(_get_chunk())
+    assert len(frame_bits) == fec.frame_bits_number
+    assert fec.decode(frame_bits) == _get_chunk()
+
+@pytest.mark.parametrize("position", [0, 1000, CHUNK_BIT_SIZE - 1, CHUNK_BIT_SIZE, CHUNK_BIT_SIZE + 31])
+def test_crc_rejects_a_damaged_chunk(position):
+    # A bit of the data or of the CRC itself
+    fec = ChunkFec(0, CHUNK_BIT_SIZE, crc=True)
+    with pytest.raises(ValueError):
+        fec.decode(_flip(fec.encode(_get_chunk()), [position]))
+
+def test_crc_rejects_a_chunk_the_fec_cannot_correct():
+    # More damaged bytes in a codeword than the parity bytes can correct, the CRC catches a wrong correction
+    fec = ChunkFec(4, CHUNK_BIT_SIZE, crc=True)
+    frame_bits = fec.encode(_get_chunk())
+    with pytest.raises(ValueError):
+        fec.decode(_flip(frame_bits, list(range(0, 8 * 200, 8))))
+
+def test_fec_corrects_a_burst():
+    # The codewords are interleaved, a burst of damaged bytes is spread over all of them
+    fec = ChunkFec(16, CHUNK_BIT_SIZE, crc=True)
+    frame_bits = fec.encode(_get_chunk())
+    assert fec.decode(_flip(frame_bits, list(range(800, 800 + 8 * 30)))) == _get_chunk()
+
+def test_fec_corrects_erasures():
+    fec = ChunkFec(16, CHUNK_BIT_SIZE, crc=True)
+    frame_bits = fec.encode(_get_chunk())
+    erasures = list(range(4000, 4000 + 8 * 60))
+    assert fec.decode(_flip(frame_bits, erasures), erasures) == _get_chunk()
+
+@pytest.mark.parametrize("parity_number", [0, 16])
+def test_refuse_a_truncated_chunk(parity_number):
+    fec = ChunkFec(parity_number, CHUNK_BIT_SIZE, crc=True)
+    with pytest.raises(ValueError):
+        fec.decode(fec.encode(_get_chunk())[:fec.frame_bits_number - 8])
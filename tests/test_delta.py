@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from src.common.delta import Delta
+from src.sonify.encodedelta import DeltaEncoder
+from src.demod.applydelta import DeltaDecoder
+
+def _random_bytes(size:int, seed:int=0)->bytes:
+    return np.random.default_rng(seed).bytes(size)
+
+def _round_trip(tmp_path, base:bytes, new:bytes, encoder:DeltaEncoder|None=None):
+    # Returns the encoder and the delta size, the rebuilt file must be the new one
+    base_path, new_path, delta_path, output_path = (tmp_path / name for name in ("base.bin", "new.bin", "delta.bin", "output.bin"))
+    base_path.write_bytes(base)
+    new_path.write_bytes(new)
+    encoder = encoder or DeltaEncoder()
+    header = encoder.encode(str(base_path), str(new_path), str(delta_path))
+    assert (header.base_size, header.size) == (len(base), len(new))
+    with open(delta_path, 'rb') as delta_f:
+        assert DeltaDecoder(str(base_path)).apply(delta_f, str(output_path)) == header
+    assert output_path.read_bytes() == new
+    return encoder, delta_path.stat().st_size
+
+def test_same_file(tmp_path):
+    base = _random_bytes(100*1024)
+    encoder, delta_size = _round_trip(tmp_path, base, base)
+    assert encoder.literal_size == len(base) % encoder._get_block_size(len(base))
+    assert delta_size < 1024
+
+@pytest.mark.parametrize("offset", [-1, 0, 1])
+def test_insertion_at_window_boundary(tmp_path, offset):
+    # The checksums of the new file are computed window by window, a block which starts in a window and ends in the next one is matched
+    base = _random_bytes(DeltaEncoder.WINDOW_SIZE + 256*1024)
+    insert_at = DeltaEncoder.WINDOW_SIZE + offset - 100
+    new = base[:insert_at] + _random_bytes(100, seed=1) + base[insert_at:]
+    encoder, _ = _round_trip(tmp_path, base, new)
+    block_size = encoder._get_block_size(len(base))
+    assert encoder.literal_size <= 100 + 2 * block_size
+
+@pytest.mark.parametrize("insert_at", [1000, 1023, 1024, 1025, 1500])
+def test_insertion_around_small_windows(tmp_path, monkeypatch, insert_at):
+    monkeypatch.setattr(DeltaEncoder, "WINDOW_SIZE", 1024)
+    base = _random_bytes(8*1024)
+    new = base[:insert_at] + b"inserted" + base[insert_at:]
+    encoder, _ = _round_trip(tmp_path, base, new, DeltaEncoder(block_size=64))
+    assert encoder.literal_size <= len(b"inserted") + 2 * 64
+
+def test_empty_base(tmp_path):
+    new = _random_bytes(10*1024)
+    encoder, _ = _round_trip(tmp_path, b"", new)
+    assert (encoder.copied_size, encoder.literal_size) == (0, len(new))
+
+def test_empty_new_file(tmp_path):
+    encoder, delta_size = _round_trip(tmp_path, _random_bytes(10*1024), b"")
+    assert (encoder.copied_size, encoder.literal_size) == (0, 0)
+    assert delta_size == Delta.HEADER.size
+
+def test_base_smaller_than_a_block(tmp_path):
+    base = _random_bytes(100)
+    new = base + _random_bytes(1000, seed=1)
+    encoder, _ = _round_trip(tmp_path, base, new)
+    assert encoder._get_block_size(len(base)) > len(base)
+    assert (encoder.copied_size, encoder.literal_size) == (0, len(new))
+
+def test_wrong_base(tmp_path):
+    base = _random_bytes(10*1024)
+    _round_trip(tmp_path, base, base[:5000] + base[6000:])
+    (tmp_path / "base.bin").write_bytes(_random_bytes(10*1024, seed=2))
+    with open(tmp_path / "delta.bin", 'rb') as delta_f, pytest.raises(ValueError):
+        DeltaDecoder(str(tmp_path / "base.bin")).apply(delta_f, str(tmp_path / "other.bin"))
+    assert not (tmp_path / "other.bin").exists()
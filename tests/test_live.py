@@ -0,0 +1,44 @@
+import threading
+import time
+import numpy as np
+from src.sonify.sonit import SonifyWorkflow
+from src.demod.demodit import DemodWorkflow
+from src.demod.readlive import LiveReader
+from src.demod.readwave import WaveReader
+
+FEED_SEC = 0.02 # of the blocks fed, as a sound card would
+MAX_LATENCY_SEC = 1.0
+
+def _get_frames(wave_path:str)->tuple[bytes, int]:
+    # The raw PCM frames of a mono recording and its frame rate
+    with WaveReader(wave_path) as reader:
+        return reader.samples(0, reader.num_frames).astype("<i2").tobytes(), reader.frame_rate
+
+def test_live_demod_ends_with_the_transmission(tmp_path):
+    # The frames are fed in real time, followed by silence as a recording goes on: the file is written right after its last chunk
+    content = np.random.default_rng(0).bytes(300)
+    (tmp_path / "input.bin").write_bytes(content)
+    SonifyWorkflow(4800, 48000, 1, chunk_crc=True).execute(str(tmp_path / "input.bin"), str(tmp_path / "input.wav"))
+    frames, frame_rate = _get_frames(str(tmp_path / "input.wav"))
+    reader = LiveReader(frame_rate)
+    result = {}
+    def demod():
+        result["missing"] = DemodWorkflow()._demod_live(reader, str(tmp_path / "output.bin"), None)
+        result["end"] = time.monotonic()
+    demodulation = threading.Thread(target=demod)
+    demodulation.start()
+    block_size = int(frame_rate * FEED_SEC) * 2
+    try:
+        for start in range(0, len(frames), block_size):
+            reader.feed(frames[start:start + block_size])
+            time.sleep(FEED_SEC)
+        transmission_end = time.monotonic()
+        while demodulation.is_alive() and time.monotonic() - transmission_end < 2 * MAX_LATENCY_SEC:
+            reader.feed(bytes(block_size))
+            time.sleep(FEED_SEC)
+    finally:
+        reader.close()
+        demodulation.join()
+    assert result["end"] - transmission_end < MAX_LATENCY_SEC
+    assert result["missing"] == []
+    assert (tmp_path / "output.bin").read_bytes() == content
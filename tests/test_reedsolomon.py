@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from src.common.reedsolomon import ReedSolomon
+
+PARITY_NUMBER = 16
+DATA_SIZE = 239
+
+def _get_codewords(codeword_number:int=4, seed:int=0):
+    rs = ReedSolomon(PARITY_NUMBER, DATA_SIZE)
+    data = np.random.default_rng(seed).integers(0, 256, (codeword_number, DATA_SIZE), dtype=np.uint8)
+    return rs, data, rs.encode(data)
+
+def _damage(codewords:np.ndarray, cw:int, positions:list)->np.ndarray:
+    # Every byte at positions is changed to another value
+    damaged = codewords.copy()
+    damaged[cw, positions] ^= np.uint8(0x5a)
+    return damaged
+
+def _get_positions(number:int, seed:int=1)->list:
+    return sorted(np.random.default_rng(seed).choice(DATA_SIZE + PARITY_NUMBER, number, replace=False).tolist())
+
+def test_encode_without_errors():
+    rs, data, codewords = _get_codewords()
+    assert codewords.shape == (4, DATA_SIZE + PARITY_NUMBER)
+    assert not rs.syndromes(codewords).any()
+    np.testing.assert_array_equal(rs.decode(codewords), data)
+
+@pytest.mark.parametrize("error_number, erasure_number", [(PARITY_NUMBER // 2, 0), (0, PARITY_NUMBER), (3, PARITY_NUMBER - 6), (5, 6)])
+def test_correct_up_to_the_limit(error_number, erasure_number):
+    # 2e + f <= parity_number
+    rs, data, codewords = _get_codewords()
+    positions = _get_positions(error_number + erasure_number)
+    damaged = _damage(codewords, 1, positions)
+    erasures = [[], positions[:erasure_number], [], []]
+    np.testing.assert_array_equal(rs.decode(damaged, erasures), data)
+
+def test_erasures_only():
+    # The erased bytes are given as zeros, whatever was received
+    rs, data, codewords = _get_codewords()
+    erasures = [_get_positions(PARITY_NUMBER, seed) for seed in range(len(codewords))]
+    damaged = codewords.copy()
+    for cw, positions in enumerate(erasures):
+        damaged[cw, positions] = 0
+    np.testing.assert_array_equal(rs.decode(damaged, erasures), data)
+
+def test_erasures_without_errors_in_them():
+    # An erased byte which was received right is corrected as well
+    rs, data, codewords = _get_codewords()
+    np.testing.assert_array_equal(rs.decode(codewords, [_get_positions(PARITY_NUMBER)] * len(codewords)), data)
+
+def test_refuse_too_many_erasures():
+    rs, _, codewords = _get_codewords()
+    positions = _get_positions(PARITY_NUMBER + 1)
+    with pytest.raises(ValueError):
+        rs.decode(_damage(codewords, 2, positions), [[], [], positions, []])
+
+@pytest.mark.parametrize("error_number, erasure_number", [(PARITY_NUMBER // 2 + 1, 0), (4, PARITY_NUMBER - 7)])
+def test_refuse_beyond_the_limit(error_number, erasure_number):
+    # 2e + f > parity_number, the codeword is not given back as corrected
+    rs, _, codewords = _get_codewords()
+    positions = _get_positions(error_number + erasure_number)
+    erasures = [[], [], positions[:erasure_number], []]
+    with pytest.raises(ValueError):
+        rs.decode(_damage(codewords, 2, positions), erasures)
+
+def test_shortened_codeword():
+    # Less than 255 bytes, as the last codewords of a chunk
+    rs = ReedSolomon(8, 20)
+    data = np.arange(40, dtype=np.uint8).reshape(2, 20)
+    codewords = rs.encode(data)
+    codewords[0, [3, 25]] ^= 0xff
+    codewords[1, [0, 1, 2, 3, 4, 5]] = 0
+    np.testing.assert_array_equal(rs.decode(codewords, [[], [0, 1, 2, 3, 4, 5]]), data)
@@ -0,0 +1,46 @@
+import io
+import zlib
+import pytest
+from src.common.batch import BatchEntry, BatchManifest
+from src.common.codec import Codec
+from src.sonify.packbatch import BatchPacker
+from src.demod.unpackbatch import BatchUnpacker
+
+def _make_batch(files:dict[str, bytes])->io.BytesIO:
+    # Batch of the files stored as is, whatever their names
+    codec_id = Codec.by_name("none").codec_id
+    entries = [BatchEntry(name, len(content), zlib.adler32(content), codec_id, len(content)) for name, content in files.items()]
+    return io.BytesIO(BatchManifest.to_bytes(entries) + b"".join(files.values()))
+
+def test_unpack_packed_files(tmp_path):
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_bytes(b"a" * 1000)
+    (source / "sub" / "b.bin").write_bytes(bytes(range(256)))
+    batch_path = tmp_path / "batch.bin"
+    BatchPacker("zlib").pack([str(source)], str(batch_path))
+    with open(batch_path, 'rb') as f:
+        entries = BatchUnpacker(str(tmp_path / "output")).unpack(f)
+    assert [entry.name for entry in entries] == ["a.txt", "sub/b.bin"]
+    assert (tmp_path / "output" / "a.txt").read_bytes() == b"a" * 1000
+    assert (tmp_path / "output" / "sub" / "b.bin").read_bytes() == bytes(range(256))
+
+@pytest.mark.parametrize("name", ["../escaped.txt", "sub/../../escaped.txt", "..", "/tmp/escaped.txt", "//escaped.txt", "", "sub//escaped.txt",
+                                  "sub/", "./escaped.txt", "sub/./escaped.txt"])
+def test_refuse_names_out_of_the_output_dir(tmp_path, name):
+    # A crafted manifest cannot write out of the output directory
+    output_dir = tmp_path / "a" / "output"
+    with pytest.raises(ValueError):
+        BatchUnpacker(str(output_dir)).unpack(_make_batch({name: b"escaped"}))
+    assert not list(tmp_path.rglob("escaped.txt"))
+
+def test_refuse_a_wrong_checksum(tmp_path):
+    batch = _make_batch({"a.txt": b"content"})
+    data = batch.getvalue()
+    with pytest.raises(ValueError):
+        BatchUnpacker(str(tmp_path)).unpack(io.BytesIO(data[:-1] + b"!"))
+
+def test_refuse_a_truncated_batch(tmp_path):
+    data = _make_batch({"a.txt": b"content"}).getvalue()
+    with pytest.raises(ValueError):
+        BatchUnpacker(str(tmp_path)).unpack(io.BytesIO(data[:-3]))
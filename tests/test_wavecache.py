@@ -0,0 +1,66 @@
+import os
+import pytest
+from src.sonify.wavecache import WaveCache
+
+ENTRY_SIZE = 1000
+SETTINGS = dict(digest="0123456789abcdef", codec="zlib", frequency=8000, frame_rate=48000, chunk_kb_size=4, sample_width=2)
+
+def _store(cache:WaveCache, tmp_path, key:str, mtime:float|None=None):
+    # Stores an entry of ENTRY_SIZE bytes, mtime sets its last use explicitly
+    wave_path = tmp_path / f"{key}.src"
+    wave_path.write_bytes(key.encode() * (ENTRY_SIZE // len(key)))
+    cache.store(key, str(wave_path))
+    if mtime is not None:
+        os.utime(cache._get_path(key), (mtime, mtime))
+
+def _cached_keys(cache_dir)->set:
+    return {path.stem for path in cache_dir.glob("*" + WaveCache.SUFFIX)}
+
+def test_fetch_a_stored_entry(tmp_path):
+    cache = WaveCache(str(tmp_path / "cache"), 10 * ENTRY_SIZE)
+    _store(cache, tmp_path, "aaaa")
+    assert cache.fetch("aaaa", str(tmp_path / "output.wav"))
+    assert (tmp_path / "output.wav").read_bytes() == (tmp_path / "aaaa.src").read_bytes()
+    assert not cache.fetch("bbbb", str(tmp_path / "other.wav"))
+    assert not (tmp_path / "other.wav").exists()
+
+def test_stay_under_max_bytes(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = WaveCache(str(cache_dir), int(2.5 * ENTRY_SIZE))
+    for n, key in enumerate(["aaaa", "bbbb", "cccc", "dddd"]):
+        _store(cache, tmp_path, key, mtime=1000 + n)
+    assert _cached_keys(cache_dir) == {"cccc", "dddd"}
+    assert sum(path.stat().st_size for path in cache_dir.iterdir()) <= 2.5 * ENTRY_SIZE
+
+def test_evict_the_least_recently_fetched(tmp_path):
+    # aaaa is stored first but fetched after bbbb was stored, bbbb is evicted first
+    cache_dir = tmp_path / "cache"
+    cache = WaveCache(str(cache_dir), int(2.5 * ENTRY_SIZE))
+    _store(cache, tmp_path, "aaaa", mtime=1000)
+    _store(cache, tmp_path, "bbbb", mtime=2000)
+    assert cache.fetch("aaaa", str(tmp_path / "output.wav"))
+    _store(cache, tmp_path, "cccc")
+    assert _cached_keys(cache_dir) == {"aaaa", "cccc"}
+
+def test_entry_larger_than_the_cache(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = WaveCache(str(cache_dir), ENTRY_SIZE // 2)
+    _store(cache, tmp_path, "aaaa")
+    assert not _cached_keys(cache_dir)
+    assert not list(cache_dir.glob("*.tmp"))
+
+def test_key_does_not_depend_on_the_order():
+    assert WaveCache.get_key(**SETTINGS) == WaveCache.get_key(**dict(reversed(SETTINGS.items())))
+
+@pytest.mark.parametrize("name", sorted(SETTINGS))
+def test_key_changes_with_every_setting(name):
+    changed = {**SETTINGS, name: str(SETTINGS[name]) + "0"}
+    assert WaveCache.get_key(**changed) != WaveCache.get_key(**SETTINGS)
+
+def test_key_changes_with_the_version(monkeypatch):
+    key = WaveCache.get_key(**SETTINGS)
+    monkeypatch.setattr(WaveCache, "VERSION", WaveCache.VERSION + 1)
+    assert WaveCache.get_key(**SETTINGS) != key
+
+def test_key_changes_with_a_new_setting():
+    assert WaveCache.get_key(**SETTINGS, carrier_number=1) != WaveCache.get_key(**SETTINGS)
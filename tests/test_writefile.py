@@ -0,0 +1,70 @@
+import wave
+import numpy as np
+import pytest
+from src.sonify.sonit import SonifyWorkflow
+from src.demod.demodit import DemodWorkflow
+from src.demod.writefile import FileWriter
+from src.common.metrics import Metrics
+
+FREQUENCY = 4800
+FRAME_RATE = 48000
+CHUNK_NUMBER = 4
+
+@pytest.fixture(scope="module")
+def transmission(tmp_path_factory):
+    # A file of CHUNK_NUMBER chunks sent with the chunk CRC, and where each chunk is in the recording (its start and its samples)
+    tmp_path = tmp_path_factory.mktemp("transmission")
+    content = np.random.default_rng(0).bytes(CHUNK_NUMBER * 1024)
+    (tmp_path / "input.bin").write_bytes(content)
+    SonifyWorkflow(FREQUENCY, FRAME_RATE, 1, chunk_crc=True).execute(str(tmp_path / "input.bin"), str(tmp_path / "input.wav"))
+    metrics = Metrics()
+    assert DemodWorkflow(metrics=metrics).execute(str(tmp_path / "input.wav"), str(tmp_path / "output.bin")) == []
+    chunks = [(event["start"], event["samples"]) for event in metrics.report()["events"]["chunk"]]
+    assert len(chunks) == CHUNK_NUMBER
+    return content, tmp_path / "input.wav", chunks
+
+def _damage(transmission, chunk_index:int, wave_path)->str:
+    # Recording where the middle of a chunk is silent
+    _, input_path, chunks = transmission
+    with wave.open(str(input_path), 'rb') as wav_file:
+        params = wav_file.getparams()
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2").copy()
+    start, length = chunks[chunk_index]
+    samples[start + length // 4:start + 3 * length // 4] = 0
+    with wave.open(str(wave_path), 'wb') as wav_file:
+        wav_file.setparams(params)
+        wav_file.writeframes(samples.tobytes())
+    return str(wave_path)
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_resume_with_another_recording(tmp_path, transmission, streaming):
+    # The 1st run saves the chunks received and the missing ones to the sidecar, the 2nd one completes the file from another recording
+    content = transmission[0]
+    output_path = tmp_path / "output.bin"
+    sidecar_path = tmp_path / ("output.bin" + FileWriter.SIDECAR_SUFFIX)
+    assert DemodWorkflow(streaming).execute(_damage(transmission, 1, tmp_path / "a.wav"), str(output_path)) == [1]
+    assert sidecar_path.exists()
+    received = output_path.read_bytes()
+    assert received[:1024] + received[2048:] == content[:1024] + content[2048:]
+    assert DemodWorkflow(streaming).execute(_damage(transmission, 2, tmp_path / "b.wav"), str(output_path)) == []
+    assert output_path.read_bytes() == content
+    assert not sidecar_path.exists()
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_merge_recordings(tmp_path, transmission, streaming):
+    output_path = tmp_path / "output.bin"
+    recordings = [_damage(transmission, 0, tmp_path / "a.wav"), _damage(transmission, 3, tmp_path / "b.wav")]
+    assert DemodWorkflow(streaming).execute(recordings[0], str(output_path), merge_with=recordings[1:]) == []
+    assert output_path.read_bytes() == transmission[0]
+
+def test_chunk_lost_in_every_recording(tmp_path, transmission):
+    output_path = tmp_path / "output.bin"
+    recordings = [_damage(transmission, 2, tmp_path / "a.wav"), _damage(transmission, 2, tmp_path / "b.wav")]
+    assert DemodWorkflow().execute(recordings[0], str(output_path), merge_with=recordings[1:]) == [2]
+    assert (tmp_path / ("output.bin" + FileWriter.SIDECAR_SUFFIX)).exists()
+
+def test_refuse_a_recording_of_another_transmission(tmp_path, transmission):
+    (tmp_path / "other.bin").write_bytes(np.random.default_rng(1).bytes(CHUNK_NUMBER * 1024))
+    SonifyWorkflow(FREQUENCY, FRAME_RATE, 1, chunk_crc=True).execute(str(tmp_path / "other.bin"), str(tmp_path / "other.wav"))
+    with pytest.raises(ValueError, match="not a recording of the same transmission"):
+        DemodWorkflow().execute(_damage(transmission, 1, tmp_path / "a.wav"), str(tmp_path / "output.bin"), merge_with=[str(tmp_path / "other.wav")])